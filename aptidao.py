@@ -4,14 +4,13 @@ import folium
 from folium.features import DivIcon
 from streamlit_folium import st_folium
 import plotly.express as px
-from shapely.geometry import Polygon, Point
 import pandas as pd
-import tempfile
-import zipfile
-import os
-import bs4
+import shapely
 import requests
 
+import camadas_locais
+import leitor_kml
+
 # --- 1. CONFIGURAÇÕES E CORES ---
 COLOR_MAP_LEGENDA = {
     "1": "#AAFF00", "2": "#D7B09E", "3": "#FFAA00", 
@@ -21,6 +20,12 @@ COLOR_MAP_LEGENDA = {
     "Sem Inf.": "#DDDDDD"
 }
 
+# Camada nacional de aptidão agrícola (Embrapa). Com o snapshot local
+# (python camadas_locais.py aptidao) o recorte é feito sem rede.
+URL_WFS_EMBRAPA = "https://geoinfo.dados.embrapa.br/geoserver/ows"
+CAMADA_EMBRAPA = "geonode:aptagr_bra"
+MARGEM_BBOX = 0.05
+
 # --- 2. FUNÇÕES DE PARSER ---
 
 def obter_epsg_por_latlon(lon, lat):
@@ -28,57 +33,18 @@ def obter_epsg_por_latlon(lon, lat):
     zona = int((lon + 180) / 6) + 1
     return 32700 + zona if lat < 0 else 32600 + zona
 
-def carregar_kmz_kml_bs4(uploaded_file):
+def carregar_kmz_kml(uploaded_file):
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp:
-            tmp.write(uploaded_file.getbuffer())
-            tmp_path = tmp.name
-
-        kml_content = ""
-        if zipfile.is_zipfile(tmp_path):
-            with zipfile.ZipFile(tmp_path, "r") as kmz:
-                kmls = [f for f in kmz.namelist() if f.endswith(".kml")]
-                if not kmls: raise ValueError("Nenhum .kml encontrado no KMZ")
-                target = "doc.kml" if "doc.kml" in kmz.namelist() else kmls[0]
-                with kmz.open(target) as f:
-                    kml_content = f.read().decode("utf-8")
-        else:
-            with open(tmp_path, "r", encoding="utf-8") as f:
-                kml_content = f.read()
-
-        soup = bs4.BeautifulSoup(kml_content, "xml")
-        records = []
-        placemarks = soup.find_all("Placemark")
-        
-        for placemark in placemarks:
-            name_tag = placemark.find("name")
-            name = name_tag.text.strip() if name_tag else ""
-            
-            if not name:
-                if placemark.find("Polygon"): name = "Avaliando"
-                elif placemark.find("Point"): name = "Ponto Sem Nome"
-                else: name = "Elemento"
-
-            coord_tag = placemark.find("coordinates")
-            if coord_tag:
-                raw_coords = coord_tag.text.strip().split()
-                points = []
-                for c in raw_coords:
-                    parts = c.split(",")
-                    if len(parts) >= 2:
-                        points.append((float(parts[0]), float(parts[1])))
-                
-                geom = None
-                if len(points) == 1:
-                    geom = Point(points[0])
-                elif len(points) > 2:
-                    geom = Polygon(points)
-                
-                if geom:
-                    records.append({"name": name, "geometry": geom})
+        gdf = leitor_kml.ler_kml(uploaded_file.getvalue())
+        # A análise usa polígonos (perímetro/áreas) e pontos (buffer de 40 m)
+        gdf = gdf[gdf.geom_type.isin(['Point', 'Polygon', 'MultiPolygon'])].reset_index(drop=True)
+        if gdf.empty: return None, "Nenhuma geometria encontrada."
 
-        if not records: return None, "Nenhuma geometria encontrada."
-        return gpd.GeoDataFrame(records, geometry="geometry", crs="EPSG:4326"), None
+        # Nomes padrão quando o Placemark não tem <name>
+        sem_nome = gdf['name'].isna() | (gdf['name'].astype(str).str.strip() == "")
+        padrao = gdf.geom_type.map({'Point': "Ponto Sem Nome"}).fillna("Avaliando")
+        gdf['name'] = gdf['name'].where(~sem_nome, padrao)
+        return gdf[['name', 'geometry']], None
 
     except Exception as e:
         return None, f"Erro ao ler arquivo: {str(e)}"
@@ -95,6 +61,131 @@ def get_color_embrapa(txt):
     key = normalizar_classe_embrapa(txt)
     return COLOR_MAP_LEGENDA.get(key, "#DDDDDD")
 
+# Sigla ausente na base -> sigla derivada da classe (primeiro trecho encontrado vale)
+SIGLAS_POR_CLASSE = [
+    ('unidade de conservação', 'UC'),
+    ('terra indígena', 'TI'),
+    ('corpos d', 'Água'),
+    ('área urbana', 'Urb'),
+    ('area urbana', 'Urb'),
+    ('sem inf', '---'),
+]
+SIGLAS_INVALIDAS = ['none', 'nan', '', 'null']
+
+def corrigir_sigla(sigla, classe_norm):
+    """Sigla ausente na base da Embrapa -> sigla derivada da classe (UC, TI, Água...)."""
+    s = str(sigla).strip()
+    c_norm = str(classe_norm).strip().lower()
+    if s.lower() in SIGLAS_INVALIDAS:
+        for trecho, sigla_classe in SIGLAS_POR_CLASSE:
+            if trecho in c_norm: return sigla_classe
+    return s
+
+def _como_texto(serie):
+    """str() elemento a elemento: None -> 'None', NaN -> 'nan' (astype(str) mantém NaN no pandas 3)."""
+    return serie.astype(object).map(str)
+
+def _por_valor_unico(serie, funcao):
+    """Aplica a transformação vetorizada só aos valores distintos e mapeia de volta."""
+    unicos = pd.Series(serie.unique())
+    return serie.map(dict(zip(unicos, funcao(unicos))))
+
+def _normalizar_unicos(txt):
+    txt = txt.str.strip()
+    norm = pd.Series(None, index=txt.index, dtype=object)
+    for k in COLOR_MAP_LEGENDA:
+        norm = norm.where(norm.notna() | ~txt.str.startswith(k), k)
+    vazio = txt.str.lower().isin(['none', 'nan', ''])
+    return norm.fillna(txt.where(~vazio, "Sem Inf."))
+
+def normalizar_classes(legendas):
+    """Versão vetorizada de normalizar_classe_embrapa para uma coluna inteira."""
+    return _por_valor_unico(_como_texto(legendas), _normalizar_unicos)
+
+def corrigir_siglas(siglas, classes):
+    """Versão vetorizada de corrigir_sigla: troca siglas inválidas pela sigla da classe."""
+    s = _como_texto(siglas).str.strip()
+    c = _por_valor_unico(_como_texto(classes), lambda u: u.str.strip().str.lower())
+
+    resultado = s.copy()
+    pendente = s.str.lower().isin(SIGLAS_INVALIDAS)
+    for trecho, sigla in SIGLAS_POR_CLASSE:
+        marcar = pendente & c.str.contains(trecho, regex=False)
+        resultado[marcar] = sigla
+        pendente &= ~marcar
+    return resultado
+
+def preparar_classes(gdf):
+    """Limpa legenda/sigla e cria classe_norm (cor) e simb_apt corrigida."""
+    gdf["legenda_ap"] = _como_texto(gdf["legenda_ap"]).str.replace(".", "", regex=False).str.strip()
+    gdf["simb_apt"] = _como_texto(gdf["simb_apt"]).str.replace(".", "", regex=False).str.strip()
+    gdf["classe_norm"] = normalizar_classes(gdf["legenda_ap"])
+    gdf["simb_apt"] = corrigir_siglas(gdf["simb_apt"], gdf["classe_norm"])
+    return gdf
+
+def verificar_equivalencia():
+    """
+    Confere as versões vetorizadas contra as escalares (inclusive None/NaN).
+    Retorna a lista de divergências (vazia = ok). Uso: python aptidao.py
+    """
+    legendas = pd.Series(["1 - Boa", "Terra indígena", "Unidade de conservação", "Corpos d'água",
+                          "Área urbana", "area urbana", "Sem Inf.", "", " ", None, float("nan"), "null", "Outra"])
+    siglas = pd.Series(["1abc", None, float("nan"), "", "null", "None", "nan", None, None, "x", float("nan"), None, None])
+    divergencias = []
+    for serie in (legendas, legendas.astype("str"), legendas.astype(object)):
+        vetor = normalizar_classes(serie)
+        for i, v in serie.items():
+            if vetor[i] != normalizar_classe_embrapa(v):
+                divergencias.append(("classe", v, vetor[i], normalizar_classe_embrapa(v)))
+    gdf = preparar_classes(pd.DataFrame({"legenda_ap": legendas, "simb_apt": siglas}))
+    for i in range(len(legendas)):
+        classe = normalizar_classe_embrapa(str(legendas[i]).replace(".", "").strip())
+        esperado = corrigir_sigla(str(siglas[i]).replace(".", "").strip(), classe)
+        if gdf["classe_norm"][i] != classe or gdf["simb_apt"][i] != esperado:
+            divergencias.append(("sigla", legendas[i], siglas[i], gdf["simb_apt"][i], esperado))
+    return divergencias
+
+def sobrepor_aptidao(gdf_embrapa, geom, epsg_metro):
+    """
+    Classes de aptidão dentro da área analisada (geom em EPSG:4326).
+    Candidatos pelo STRtree, recorte retangular e interseção exata, tudo vetorizado;
+    só o resultado recortado é reprojetado para medir a área.
+    """
+    geoms = gdf_embrapa.geometry.values.to_numpy()
+    idx = shapely.STRtree(geoms).query(geom, predicate='intersects')
+    idx.sort()
+
+    # O recorte pelo retângulo reduz polígonos regionais a poucos vértices antes da interseção
+    cortados = shapely.clip_by_rect(geoms[idx], *geom.bounds)
+    shapely.prepare(geom)
+    pedacos = shapely.intersection(cortados, geom)
+    ok = ~shapely.is_empty(pedacos)
+
+    resultado = gpd.GeoDataFrame(
+        gdf_embrapa[["legenda_ap", "classe_norm", "simb_apt"]].iloc[idx[ok]].reset_index(drop=True),
+        geometry=pedacos[ok], crs="EPSG:4326"
+    ).to_crs(epsg=epsg_metro)
+    resultado["area_ha"] = resultado.geometry.area / 10000
+    return resultado
+
+def baixar_aptidao_wfs(bbox):
+    """Consulta o WFS da Embrapa no retângulo (oeste, sul, leste, norte)."""
+    bbox_str = ",".join(str(v) for v in bbox)
+    wfs_url = f"{URL_WFS_EMBRAPA}?service=WFS&version=1.0.0&request=GetFeature&typeName={CAMADA_EMBRAPA}&bbox={bbox_str},EPSG:4326&outputFormat=application/json"
+    gdf = gpd.read_file(wfs_url)
+    if gdf.empty: return gdf
+    return preparar_classes(gdf.to_crs(epsg=4326))
+
+def carregar_aptidao(bounds, margem=MARGEM_BBOX):
+    """
+    Polígonos de aptidão ao redor do imóvel (EPSG:4326, classes já normalizadas).
+    Usa o snapshot local indexado; sem ele, cai no WFS da Embrapa.
+    """
+    bbox = (bounds[0] - margem, bounds[1] - margem, bounds[2] + margem, bounds[3] + margem)
+    if camadas_locais.disponivel('aptidao'):
+        return camadas_locais.recortar('aptidao', bbox)
+    return baixar_aptidao_wfs(bbox)
+
 # --- 3. RENDERIZAÇÃO ---
 def render_tab():
     st.markdown("### 🌾 Análise de Aptidão Agrícola (Embrapa)")
@@ -119,7 +210,7 @@ def render_tab():
                 st.rerun()
 
     if uploaded_file:
-        gdf_raw, erro = carregar_kmz_kml_bs4(uploaded_file)
+        gdf_raw, erro = carregar_kmz_kml(uploaded_file)
         if erro:
             st.error(erro)
             return
@@ -206,52 +297,17 @@ def render_tab():
 
                                 gdf_calculo = pd.concat(lista_calc, ignore_index=True)
                                 geom_uniao = gdf_calculo.unary_union
-                                gdf_uniao = gpd.GeoDataFrame(geometry=[geom_uniao], crs=gdf_calculo.crs)
-                                
-                                bounds = gdf_uniao.to_crs(epsg=4326).total_bounds
-                                margem = 0.05
-                                bbox_str = f"{bounds[0]-margem},{bounds[1]-margem},{bounds[2]+margem},{bounds[3]+margem}"
-                                wfs_url = f"https://geoinfo.dados.embrapa.br/geoserver/ows?service=WFS&version=1.0.0&request=GetFeature&typeName=geonode:aptagr_bra&bbox={bbox_str},EPSG:4326&outputFormat=application/json"
+                                geom_wgs84 = gpd.GeoSeries([geom_uniao], crs=gdf_calculo.crs).to_crs(epsg=4326).iloc[0]
                                 
-                                gdf_embrapa = gpd.read_file(wfs_url)
+                                gdf_embrapa = carregar_aptidao(geom_wgs84.bounds)
                                 
                                 if gdf_embrapa.empty:
                                     st.warning("Sem dados.")
                                 else:
-                                    gdf_embrapa_utm = gdf_embrapa.to_crs(epsg=epsg_metro)
-                                    gdf_intersect = gpd.overlay(gdf_embrapa_utm, gdf_uniao, how='intersection')
+                                    gdf_intersect = sobrepor_aptidao(gdf_embrapa, geom_wgs84, epsg_metro)
                                     
                                     stats = None
                                     if not gdf_intersect.empty:
-                                        gdf_intersect["area_ha"] = gdf_intersect.geometry.area / 10000
-                                        
-                                        # Limpa strings
-                                        gdf_intersect["legenda_ap"] = gdf_intersect["legenda_ap"].astype(str).str.replace(r"\.", "", regex=True).str.strip()
-                                        gdf_intersect["simb_apt"] = gdf_intersect["simb_apt"].astype(str).str.replace(r"\.", "", regex=True).str.strip()
-
-                                        # 1. Cria Normalização (Para cor)
-                                        gdf_intersect["classe_norm"] = gdf_intersect["legenda_ap"].apply(normalizar_classe_embrapa)
-                                        
-                                        # 2. Corrige Siglas (CORREÇÃO REFORÇADA)
-                                        def corrigir_sigla_reforcada(row):
-                                            s = str(row['simb_apt']).strip()
-                                            c_norm = str(row['classe_norm']).strip().lower()
-                                            
-                                            # Lista de valores inválidos
-                                            invalidos = ['none', 'nan', '', 'null', 'nan']
-                                            
-                                            # Se a sigla é inválida, força a sigla correta baseada na classe
-                                            if s.lower() in invalidos:
-                                                if 'unidade de conservação' in c_norm: return 'UC'
-                                                if 'terra indígena' in c_norm: return 'TI'
-                                                if 'corpos d' in c_norm: return 'Água'
-                                                if 'área urbana' in c_norm or 'area urbana' in c_norm: return 'Urb'
-                                                if 'sem inf' in c_norm: return '---'
-                                            
-                                            return s
-                                        
-                                        gdf_intersect["simb_apt"] = gdf_intersect.apply(corrigir_sigla_reforcada, axis=1)
-
                                         # 3. Agrupamento
                                         stats = gdf_intersect.groupby(["legenda_ap", "classe_norm", "simb_apt"])["area_ha"].sum().reset_index()
                                         
@@ -267,7 +323,7 @@ def render_tab():
                                             stats = None
 
                                     st.session_state['aptidao_data'] = {
-                                        'visual': gdf_embrapa.to_crs(epsg=4326),
+                                        'visual': gdf_embrapa,
                                         'stats': stats
                                     }
                                     st.session_state['aptidao_concluida'] = True
@@ -285,10 +341,10 @@ def render_tab():
                     # PATCH PARA DADOS ANTIGOS
                     if 'classe_norm' not in stats.columns:
                         if 'legenda_ap' in stats.columns:
-                            stats['classe_norm'] = stats['legenda_ap'].apply(normalizar_classe_embrapa)
+                            stats['classe_norm'] = normalizar_classes(stats['legenda_ap'])
                         else:
                             col_0 = stats.columns[0]
-                            stats['classe_norm'] = stats[col_0].apply(normalizar_classe_embrapa)
+                            stats['classe_norm'] = normalizar_classes(stats[col_0])
                             stats['legenda_ap'] = stats[col_0]
 
                     st.markdown("#### 📊 Resultados")
@@ -323,4 +379,11 @@ def render_tab():
                                 "%": st.column_config.NumberColumn("%", format="%.2f%%")
                             },
                             use_container_width=True, hide_index=True
-                        )
\ No newline at end of file
+                        )
+
+if __name__ == "__main__":
+    import sys
+    divergencias = verificar_equivalencia()
+    for d in divergencias: print("Divergência:", d)
+    print("OK" if not divergencias else f"{len(divergencias)} divergência(s)")
+    sys.exit(1 if divergencias else 0)
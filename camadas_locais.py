@@ -0,0 +1,322 @@
+import os
+import sys
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import requests
+import shapely
+import shapely.geometry
+import geopandas as gpd
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+# Camadas de referência gravadas como GeoParquet e indexadas em memória (STRtree).
+# Construídas uma vez com: python camadas_locais.py [camada ...]
+PASTA_CAMADAS = os.path.join("dados", "camadas")
+
+URL_MALHA_UF = "https://servicodados.ibge.gov.br/api/v3/malhas/estados/{uf}"
+URL_LOCALIDADES = "https://servicodados.ibge.gov.br/api/v1/localidades/municipios"
+URL_WFS_IBGE = "https://geoservicos.ibge.gov.br/geoserver/ows"
+
+# Camadas temáticas do WFS do IBGE: nome local -> (typeName, colunas mantidas)
+CAMADAS_WFS = {
+    'biomas': ("CREN:bioma_vazado", ['bioma']),
+    'amazonia_legal': ("CGMAT:lim_amazonia_legal_2022", []),
+    'bacias_6': ("CREN:bacias_nivel_6", ['nome_bacia', 'suprabacia', 'curso_prin', 'princ_aflu']),
+    'bacias_4': ("CREN:bacias_nivel_4", ['nome_bacia', 'suprabacia', 'curso_prin', 'princ_aflu']),
+}
+
+# Aptidão agrícola (Embrapa): baixada em páginas pelo WFS 2.0
+PAGINA_WFS = 5000
+
+# Camadas vetoriais distribuídas junto com o app: nome local -> (arquivo, colunas mantidas)
+CAMADAS_ARQUIVO = {
+    'koppen': (os.path.join("dados", "koppen_brasil.geojson"), ['Classificacao', 'Descricao']),
+}
+
+# Polígonos continentais (biomas, Amazônia Legal) são recortados numa grade para que
+# o STRtree devolva poucos pedaços pequenos e a interseção exata fique barata.
+SUBDIVISAO_GRAUS = 0.5
+
+# Raio autálico: a projeção senoidal com ele preserva áreas
+RAIO_TERRA = 6371007.2
+
+UFS = ['AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+       'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO']
+
+MAX_WORKERS_DOWNLOAD = 8
+TIMEOUT_DOWNLOAD = 120
+
+# ==========================================
+# 1. CONSTRUÇÃO (UMA VEZ, VIA SERVIÇOS DO IBGE)
+# ==========================================
+
+def _malha_uf(uf):
+    params = {"formato": "application/vnd.geo+json", "intrarregiao": "municipio", "qualidade": "intermediaria"}
+    resp = requests.get(URL_MALHA_UF.format(uf=uf), params=params, timeout=TIMEOUT_DOWNLOAD)
+    resp.raise_for_status()
+    return gpd.GeoDataFrame.from_features(resp.json()["features"], crs="EPSG:4674")
+
+def construir_municipios(pasta=PASTA_CAMADAS, progresso=print):
+    """
+    Malha municipal do IBGE com UF e regiões geográficas (imediata e intermediária).
+    Geometrias: API de malhas (uma requisição por UF). Atributos: API de localidades.
+    """
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS_DOWNLOAD) as pool:
+        malhas = list(pool.map(_malha_uf, UFS))
+    malha = gpd.GeoDataFrame(pd.concat(malhas, ignore_index=True), crs="EPSG:4674")
+    malha["codigo_ibge"] = malha["codarea"].astype(int)
+    progresso(f"Malha: {len(malha)} municípios")
+
+    resp = requests.get(URL_LOCALIDADES, params={"view": "nivelado"}, timeout=TIMEOUT_DOWNLOAD)
+    resp.raise_for_status()
+    atributos = pd.DataFrame(resp.json()).rename(columns={
+        "municipio-id": "codigo_ibge",
+        "municipio-nome": "municipio",
+        "UF-sigla": "uf",
+        "regiao-imediata-id": "cod_regiao_imediata",
+        "regiao-imediata-nome": "regiao_imediata",
+        "regiao-intermediaria-id": "cod_regiao_intermediaria",
+        "regiao-intermediaria-nome": "regiao_intermediaria",
+    })
+    colunas = ["codigo_ibge", "municipio", "uf", "cod_regiao_imediata", "regiao_imediata",
+               "cod_regiao_intermediaria", "regiao_intermediaria"]
+    atributos = atributos[colunas].astype({"codigo_ibge": int})
+
+    gdf = malha[["codigo_ibge", "geometry"]].merge(atributos, on="codigo_ibge", how="left")
+    return _salvar(gdf[colunas + ["geometry"]], "municipios", pasta)
+
+def _subdividir(gdf, passo=SUBDIVISAO_GRAUS):
+    """Corta cada geometria nas células de uma grade regular (atributos repetidos)."""
+    pedacos, origem = [], []
+    for i, geom in enumerate(gdf.geometry.values):
+        minx, miny, maxx, maxy = geom.bounds
+        xs = np.arange(math.floor(minx / passo) * passo, maxx, passo)
+        ys = np.arange(math.floor(miny / passo) * passo, maxy, passo)
+        xx, yy = (a.ravel() for a in np.meshgrid(xs, ys))
+        cortes = shapely.clip_by_rect(geom, xx, yy, xx + passo, yy + passo)
+        cortes = cortes[~shapely.is_empty(cortes)]
+        pedacos.append(cortes)
+        origem.append(np.full(len(cortes), i))
+    origem = np.concatenate(origem)
+    return gpd.GeoDataFrame(
+        gdf.drop(columns=gdf.geometry.name).iloc[origem].reset_index(drop=True),
+        geometry=np.concatenate(pedacos), crs=gdf.crs
+    )
+
+def construir_wfs(nome, pasta=PASTA_CAMADAS, progresso=print):
+    """Baixa a camada temática inteira do WFS do IBGE, subdivide e grava."""
+    type_name, colunas = CAMADAS_WFS[nome]
+    params = {"service": "WFS", "version": "1.0.0", "request": "GetFeature", "typeName": type_name,
+              "outputFormat": "application/json", "srsName": "EPSG:4674"}
+    resp = requests.get(URL_WFS_IBGE, params=params, timeout=TIMEOUT_DOWNLOAD * 5)
+    resp.raise_for_status()
+    gdf = gpd.GeoDataFrame.from_features(resp.json()["features"], crs="EPSG:4674")
+    gdf = gdf[colunas + ["geometry"]].copy()
+    gdf["geometry"] = shapely.make_valid(gdf.geometry.values)
+
+    gdf = _subdividir(gdf)
+    progresso(f"{nome}: {len(gdf)} pedaços")
+    return _salvar(gdf, nome, pasta)
+
+def construir_arquivo(nome, pasta=PASTA_CAMADAS, progresso=print):
+    """Converte uma camada vetorial local (GeoJSON, GPKG...) para o formato indexado."""
+    caminho, colunas = CAMADAS_ARQUIVO[nome]
+    gdf = gpd.read_file(caminho).to_crs("EPSG:4326")[colunas + ["geometry"]].copy()
+    gdf["geometry"] = shapely.make_valid(gdf.geometry.values)
+
+    gdf = _subdividir(gdf)
+    progresso(f"{nome}: {len(gdf)} pedaços")
+    return _salvar(gdf, nome, pasta)
+
+def construir_aptidao(pasta=PASTA_CAMADAS, progresso=print):
+    """
+    Snapshot nacional da aptidão agrícola com as classes já normalizadas
+    (classe_norm e simb_apt corrigida), para o recorte local da aba Aptidão.
+    """
+    from aptidao import preparar_classes, URL_WFS_EMBRAPA, CAMADA_EMBRAPA
+
+    paginas, inicio = [], 0
+    while True:
+        params = {"service": "WFS", "version": "2.0.0", "request": "GetFeature", "typeNames": CAMADA_EMBRAPA,
+                  "outputFormat": "application/json", "srsName": "EPSG:4326",
+                  "count": PAGINA_WFS, "startIndex": inicio}
+        resp = requests.get(URL_WFS_EMBRAPA, params=params, timeout=TIMEOUT_DOWNLOAD * 5)
+        resp.raise_for_status()
+        feicoes = resp.json()["features"]
+        if feicoes:
+            paginas.append(gpd.GeoDataFrame.from_features(feicoes, crs="EPSG:4326"))
+        progresso(f"aptidao: {inicio + len(feicoes)} feições")
+        if len(feicoes) < PAGINA_WFS: break
+        inicio += PAGINA_WFS
+
+    gdf = gpd.GeoDataFrame(pd.concat(paginas, ignore_index=True), crs="EPSG:4326")
+    gdf = preparar_classes(gdf[["legenda_ap", "simb_apt", "geometry"]].copy())
+    gdf["geometry"] = shapely.make_valid(gdf.geometry.values)
+
+    gdf = _subdividir(gdf)
+    progresso(f"aptidao: {len(gdf)} pedaços")
+    return _salvar(gdf, "aptidao", pasta)
+
+CONSTRUTORES = {
+    'municipios': construir_municipios,
+    'aptidao': construir_aptidao,
+    **{nome: (lambda nome=nome: construir_wfs(nome)) for nome in CAMADAS_WFS},
+    **{nome: (lambda nome=nome: construir_arquivo(nome)) for nome in CAMADAS_ARQUIVO},
+}
+
+def _caminho(nome, pasta=PASTA_CAMADAS):
+    return os.path.join(pasta, f"{nome}.parquet")
+
+def _salvar(gdf, nome, pasta=PASTA_CAMADAS):
+    os.makedirs(pasta, exist_ok=True)
+    caminho = _caminho(nome, pasta)
+    temporario = f"{caminho}.tmp"
+    gdf.to_parquet(temporario, index=False)
+    os.replace(temporario, caminho)
+    _ler.cache_clear()
+    return caminho
+
+# ==========================================
+# 2. LEITURA E ÍNDICE ESPACIAL (UMA VEZ POR PROCESSO)
+# ==========================================
+
+def disponivel(nome, pasta=PASTA_CAMADAS):
+    return os.path.exists(_caminho(nome, pasta))
+
+def carregar(nome, pasta=PASTA_CAMADAS):
+    """
+    Atributos (DataFrame sem geometria), array de geometrias preparadas e STRtree.
+    Fica em memória enquanto o arquivo não mudar: uma reconstrução feita por outro
+    processo (python camadas_locais.py) é lida de novo na consulta seguinte.
+    """
+    caminho = _caminho(nome, pasta)
+    return _ler(caminho, os.stat(caminho).st_mtime_ns)
+
+# Algumas versões por camada: a antiga sai do cache depois de substituída
+@lru_cache(maxsize=32)
+def _ler(caminho, versao):
+    gdf = gpd.read_parquet(caminho)
+    geoms = gdf.geometry.values.to_numpy()
+    shapely.prepare(geoms)
+    atributos = gdf.drop(columns=gdf.geometry.name)
+    return atributos, geoms, shapely.STRtree(geoms)
+
+def indices_pontos(nome, lons, lats, pasta=PASTA_CAMADAS):
+    """
+    Índice da feição que contém cada ponto (-1 fora da camada), vetorizado.
+    Em fronteiras compartilhadas vale a primeira feição encontrada.
+    """
+    _, _, arvore = carregar(nome, pasta)
+    pontos = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+    i_pontos, i_feicoes = arvore.query(pontos, predicate='intersects')
+    resultado = np.full(len(pontos), -1, dtype=np.int64)
+    # Atribui de trás para frente: a primeira ocorrência de cada ponto prevalece
+    resultado[i_pontos[::-1]] = i_feicoes[::-1]
+    return resultado
+
+def recortar(nome, bbox, pasta=PASTA_CAMADAS):
+    """GeoDataFrame (EPSG:4326) com as feições que tocam o retângulo (oeste, sul, leste, norte)."""
+    atributos, geoms, arvore = carregar(nome, pasta)
+    idx = arvore.query(shapely.box(*bbox), predicate='intersects')
+    idx.sort()
+    return gpd.GeoDataFrame(atributos.iloc[idx].reset_index(drop=True), geometry=geoms[idx], crs="EPSG:4326")
+
+def consultar_ponto(nome, lat, lon, pasta=PASTA_CAMADAS):
+    """Atributos da feição que contém o ponto ({} fora da camada)."""
+    atributos, _, _ = carregar(nome, pasta)
+    i = indices_pontos(nome, [lon], [lat], pasta)[0]
+    return atributos.iloc[i].to_dict() if i >= 0 else {}
+
+def _area_m2(geoms):
+    """Área em m² pela projeção senoidal (equivalente), vetorizada."""
+    def senoidal(coords):
+        lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+        return np.column_stack([RAIO_TERRA * lon * np.cos(lat), RAIO_TERRA * lat])
+    return shapely.area(shapely.transform(geoms, senoidal))
+
+def participacoes(nome, geom, coluna=None, pasta=PASTA_CAMADAS):
+    """
+    Área (ha) e percentual do polígono coberto por cada classe da camada.
+    Candidatos pelo STRtree, interseção exata vetorizada só sobre eles.
+    coluna=None soma tudo numa classe só (camadas de um polígono, ex.: Amazônia Legal).
+    """
+    atributos, geoms, arvore = carregar(nome, pasta)
+    idx = arvore.query(geom, predicate='intersects')
+    total_ha = _area_m2(geom) / 1e4
+    classes = atributos[coluna].values[idx] if coluna else np.full(len(idx), nome)
+
+    df = pd.DataFrame({'classe': classes, 'area_ha': _area_m2(shapely.intersection(geoms[idx], geom)) / 1e4})
+    df = df.groupby('classe', as_index=False)['area_ha'].sum()
+    df['percentual'] = (df['area_ha'] / total_ha * 100).clip(upper=100) if total_ha > 0 else 0.0
+    return df[df['area_ha'] > 0].sort_values('area_ha', ascending=False).reset_index(drop=True)
+
+# ==========================================
+# 3. CONSULTAS DE ALTO NÍVEL
+# ==========================================
+
+def municipio_local(lat, lon):
+    """
+    Município, UF, código IBGE e regiões do ponto, sem rede.
+    Retorna None se a malha não foi construída ou o ponto está fora do Brasil.
+    """
+    if not disponivel('municipios'): return None
+    p = consultar_ponto('municipios', lat, lon)
+    if not p: return None
+    return {
+        "municipio": p["municipio"], "uf": p["uf"], "codigo_ibge": int(p["codigo_ibge"]),
+        "regiao_intermediaria": p["regiao_intermediaria"] or "---",
+        "regiao_imediata": p["regiao_imediata"] or "---",
+    }
+
+def _lista(df):
+    return [{'nome': r.classe, 'area_ha': float(r.area_ha), 'percentual': float(r.percentual)}
+            for r in df.itertuples()]
+
+def paineis_ambientais(geojson):
+    """
+    Bioma, Amazônia Legal e bacia pela área de todo o polígono (não só o centroide).
+    Retorna {'ambiental': {...}, 'bacia': {...}} com os painéis cujas camadas existem.
+    """
+    geom = shapely.geometry.shape(geojson)
+    paineis = {}
+
+    if disponivel('biomas') and disponivel('amazonia_legal'):
+        biomas = participacoes('biomas', geom, 'bioma')
+        amazonia = participacoes('amazonia_legal', geom)
+        pct_amazonia = float(amazonia['percentual'].sum())
+        paineis['ambiental'] = {
+            "bioma": biomas['classe'].iloc[0] if not biomas.empty else "Não identificado",
+            "amazonia_legal": pct_amazonia > 0,
+            "amazonia_legal_pct": pct_amazonia,
+            "biomas": _lista(biomas),
+        }
+
+    # Nível 6 (mais detalhado) quando cobre o imóvel; senão nível 4
+    for nome in ('bacias_6', 'bacias_4'):
+        if not disponivel(nome): continue
+        bacias = participacoes(nome, geom, 'nome_bacia')
+        if bacias.empty: continue
+        atributos, _, _ = carregar(nome)
+        principal = atributos[atributos['nome_bacia'] == bacias['classe'].iloc[0]].iloc[0]
+        paineis['bacia'] = {
+            "suprabacia": principal['suprabacia'] or "---",
+            "nome_bacia": principal['nome_bacia'] or "---",
+            "curso_prin": principal['curso_prin'] or "---",
+            "princ_aflu": principal['princ_aflu'] or "---",
+            "nivel": nome[-1],
+            "bacias": _lista(bacias),
+        }
+        break
+
+    return paineis
+
+if __name__ == "__main__":
+    for nome in sys.argv[1:] or CONSTRUTORES:
+        print(f"Construindo '{nome}'...")
+        print(CONSTRUTORES[nome]())
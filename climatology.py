@@ -4,6 +4,11 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 import io  # Necessário para criar o arquivo Excel na memória
+import os
+from datetime import date
+import utils
+import gee_lote
+import normais_locais
 
 # ==========================================
 # 0. CONFIGURAÇÕES E UTILITÁRIOS
@@ -40,103 +45,196 @@ def to_excel_horizontal(df, index_col='Mês'):
     return processed_data
 
 # ==========================================
-# 1. FUNÇÕES DE DADOS (CACHE CORRIGIDO)
+# 1. FUNÇÕES DE DADOS (1 ROUND-TRIP)
 # ==========================================
 
-@st.cache_data(show_spinner=False)
-def get_worldclim_data(_geometry, cache_id):
+# Período usado nas normais de chuva do CHIRPS
+PERIODO_CHIRPS = ('2000-01-01', '2025-12-31')
+
+# Escala única da redução: resolução nativa do WorldClim (~1 km);
+# o CHIRPS (0.05°) é amostrado nessa mesma grade.
+ESCALA_CLIMA = 1000
+
+def imagem_climatologia():
     """
-    Busca dados de Temperatura (WorldClim V1 Monthly).
+    Empilha as 12 normais mensais numa só imagem (48 bandas):
+    tavg_MM, tmin_MM, tmax_MM (°C) do WorldClim e chuva_MM (mm/mês) do CHIRPS.
+    Só monta a expressão; nenhuma chamada ao servidor.
     """
-    try:
-        geo_simple = _geometry.simplify(maxError=100)
-        wc = ee.ImageCollection("WORLDCLIM/V1/MONTHLY")
-        
-        def get_stats(img):
-            month = img.get('month')
-            stats = img.reduceRegion(
-                reducer=ee.Reducer.mean(),
-                geometry=geo_simple,
-                scale=2000, 
-                maxPixels=1e9,
-                bestEffort=True,
-                tileScale=16
-            )
-            return ee.Feature(None, {
-                'month': month,
-                'avg': ee.Number(stats.get('tavg')).divide(10),
-                'min': ee.Number(stats.get('tmin')).divide(10),
-                'max': ee.Number(stats.get('tmax')).divide(10)
-            })
+    wc = ee.ImageCollection("WORLDCLIM/V1/MONTHLY")
+    chirps = ee.ImageCollection("UCSB-CHG/CHIRPS/PENTAD")\
+        .filterDate(*PERIODO_CHIRPS)\
+        .select('precipitation')
 
-        features = wc.map(get_stats).getInfo()['features']
-        
-        data = []
-        for f in features:
-            p = f['properties']
-            m_num = int(p['month'])
-            if p.get('avg') is not None:
-                data.append({
-                    "Mês_Num": m_num,
-                    "Mês": MESES_PT[m_num], 
-                    "Média (°C)": float(p['avg']),
-                    "Mínima (°C)": float(p['min']),
-                    "Máxima (°C)": float(p['max'])
-                })
-        
-        return pd.DataFrame(data).sort_values('Mês_Num')
-        
-    except Exception as e:
-        st.session_state['erro_clima_temp'] = str(e)
-        return pd.DataFrame()
+    bandas = []
+    for m in range(1, 13):
+        temp = wc.filter(ee.Filter.eq('month', m)).first().select(['tavg', 'tmin', 'tmax']).divide(10)
+        bandas.append(temp.rename([f'tavg_{m:02d}', f'tmin_{m:02d}', f'tmax_{m:02d}']))
+        # Média das pêntadas do mês x 6 pêntadas = total mensal
+        chuva = chirps.filter(ee.Filter.calendarRange(m, m, 'month')).mean().multiply(6)
+        bandas.append(chuva.rename(f'chuva_{m:02d}'))
+    return ee.Image.cat(bandas)
+
+def dataframes_climatologia(valores):
+    """Separa o dicionário da redução nos DataFrames de temperatura e chuva."""
+    temp, chuva = [], []
+    for m in range(1, 13):
+        if valores.get(f'tavg_{m:02d}') is not None:
+            temp.append({
+                "Mês_Num": m,
+                "Mês": MESES_PT[m],
+                "Média (°C)": float(valores[f'tavg_{m:02d}']),
+                "Mínima (°C)": float(valores[f'tmin_{m:02d}']),
+                "Máxima (°C)": float(valores[f'tmax_{m:02d}'])
+            })
+        if valores.get(f'chuva_{m:02d}') is not None:
+            chuva.append({
+                "Mês_Num": m,
+                "Mês": MESES_PT[m],
+                "Chuva (mm)": float(valores[f'chuva_{m:02d}'])
+            })
+    return pd.DataFrame(temp), pd.DataFrame(chuva)
 
 @st.cache_data(show_spinner=False)
-def get_chirps_data(_geometry, cache_id):
+def get_climatologia(_geometry, cache_id):
     """
-    Busca dados de Precipitação (CHIRPS Pentad).
+    Temperatura (WorldClim V1) e chuva (CHIRPS) numa única redução.
+    Usa as normais locais (normais_locais.py) quando construídas; senão, o GEE.
+    cache_id: fingerprint da geometria. Retorna (df_temp, df_chuva).
     """
     try:
+        # 1. Normais locais: estatística zonal em disco, sem rede nem cota do GEE
+        if normais_locais.disponivel():
+            valores = normais_locais.estatisticas_zonais(gee_lote.geojson_geometria(_geometry))
+            # None: fora da área ou só nodata sob o imóvel -> segue para o GEE
+            if valores:
+                return dataframes_climatologia(valores)
+
+        # 2. GEE: uma redução sobre a imagem empilhada
         geo_simple = _geometry.simplify(maxError=100)
-        dataset = ee.ImageCollection("UCSB-CHG/CHIRPS/PENTAD")\
-            .filterDate('2000-01-01', '2025-12-31')\
-            .select('precipitation')
-
-        def calc_monthly_climatology(m):
-            m = ee.Number(m)
-            mean_pentad = dataset.filter(ee.Filter.calendarRange(m, m, 'month')).mean()
-            val = mean_pentad.reduceRegion(
-                reducer=ee.Reducer.mean(),
-                geometry=geo_simple,
-                scale=5500,
-                maxPixels=1e9,
-                bestEffort=True,
-                tileScale=16
-            ).get('precipitation')
-            monthly_total = ee.Number(val).multiply(6)
-            return ee.Feature(None, {'month': m, 'rain': monthly_total})
-
-        months = ee.List.sequence(1, 12)
-        features = ee.FeatureCollection(months.map(calc_monthly_climatology)).getInfo()['features']
-        
-        data = []
-        for f in features:
-            p = f['properties']
-            m_num = int(p['month'])
-            if p.get('rain') is not None:
-                data.append({
-                    "Mês_Num": m_num,
-                    "Mês": MESES_PT[m_num],
-                    "Chuva (mm)": float(p['rain'])
-                })
-                
-        return pd.DataFrame(data).sort_values('Mês_Num')
+        valores = imagem_climatologia().reduceRegion(
+            reducer=ee.Reducer.mean(),
+            geometry=geo_simple,
+            scale=ESCALA_CLIMA,
+            maxPixels=1e9,
+            bestEffort=True,
+            tileScale=16
+        ).getInfo()
+        return dataframes_climatologia(valores)
 
     except Exception as e:
-        st.session_state['erro_clima_rain'] = str(e)
-        return pd.DataFrame()
+        st.session_state['erro_clima'] = str(e)
+        return pd.DataFrame(), pd.DataFrame()
+
+# ==========================================
+# 2. CHUVA ANO A ANO E ANOMALIAS (INCREMENTAL)
+# ==========================================
+
+# Matriz mensal armazenada por imóvel (um parquet por fingerprint)
+PASTA_CHUVA = os.path.join("dados", "chuva_mensal")
+ANO_INICIAL_CHUVA = 2000
+
+# O CHIRPS final substitui o preliminar ~2 meses depois do fim do mês
+DIAS_ATE_CONSOLIDAR = 60
+
+# Classes de seca/umidade de McKee et al. (1993) aplicadas ao índice padronizado
+CLASSES_SPI = [
+    (-99, -2.0, "Extremamente seco"), (-2.0, -1.5, "Muito seco"), (-1.5, -1.0, "Moderadamente seco"),
+    (-1.0, 1.0, "Normal"), (1.0, 1.5, "Moderadamente úmido"), (1.5, 2.0, "Muito úmido"), (2.0, 99, "Extremamente úmido"),
+]
+
+def imagem_chuva_mensal(ano_ini, mes_ini, n_meses):
+    """Uma banda por mês (soma das pêntadas = total mensal em mm) a partir de ano_ini/mes_ini."""
+    chirps = ee.ImageCollection("UCSB-CHG/CHIRPS/PENTAD").select('precipitation')
+    inicio = ee.Date.fromYMD(ano_ini, mes_ini, 1)
+
+    def total_mes(k):
+        data_ini = inicio.advance(ee.Number(k), 'month')
+        return chirps.filterDate(data_ini, data_ini.advance(1, 'month')).sum().rename('chuva')
+
+    # toBands nomeia as bandas como '<k>_chuva'
+    return ee.ImageCollection.fromImages(ee.List.sequence(0, n_meses - 1).map(total_mes)).toBands()
+
+def _caminho_chuva(fingerprint):
+    return os.path.join(PASTA_CHUVA, f"{fingerprint}.parquet")
+
+def carregar_chuva_mensal(fingerprint):
+    caminho = _caminho_chuva(fingerprint)
+    if not os.path.exists(caminho):
+        return pd.DataFrame(columns=['Data', 'Chuva (mm)', 'Consolidado'])
+    return pd.read_parquet(caminho)
+
+def atualizar_chuva_mensal(geometry, fingerprint):
+    """
+    Completa a matriz de chuva mensal do imóvel com uma única redução,
+    buscando apenas os meses fechados que ainda não estão consolidados.
+    """
+    df = carregar_chuva_mensal(fingerprint)
+    hoje = date.today()
+    ultimo = pd.Timestamp(hoje.year, hoje.month, 1) - pd.offsets.MonthBegin(1)
+
+    consolidados = df.loc[df['Consolidado'].astype(bool), 'Data'] if not df.empty else pd.Series(dtype='datetime64[ns]')
+    meses = pd.date_range(f"{ANO_INICIAL_CHUVA}-01-01", ultimo, freq='MS')
+    faltantes = meses[~meses.isin(consolidados)]
+    if faltantes.empty:
+        return df
+
+    # Um único bloco contínuo do primeiro mês faltante até o último mês fechado
+    inicio = faltantes[0]
+    n_meses = len(pd.date_range(inicio, ultimo, freq='MS'))
+    valores = imagem_chuva_mensal(inicio.year, inicio.month, n_meses).reduceRegion(
+        reducer=ee.Reducer.mean(),
+        geometry=geometry.simplify(maxError=100),
+        scale=ESCALA_CLIMA,
+        maxPixels=1e9,
+        bestEffort=True,
+        tileScale=16
+    ).getInfo()
+
+    datas = pd.date_range(inicio, periods=n_meses, freq='MS')
+    novos = pd.DataFrame({'Data': datas, 'Chuva (mm)': [valores.get(f"{k}_chuva") for k in range(n_meses)]})
+    limite = pd.Timestamp(hoje) - pd.Timedelta(days=DIAS_ATE_CONSOLIDAR)
+    novos['Consolidado'] = (novos['Data'] + pd.offsets.MonthBegin(1)) <= limite
+
+    df = pd.concat([df[~df['Data'].isin(novos['Data'])], novos], ignore_index=True)
+    df['Data'] = pd.to_datetime(df['Data'])
+    df = df.sort_values('Data').reset_index(drop=True)
+
+    os.makedirs(PASTA_CHUVA, exist_ok=True)
+    temporario = f"{_caminho_chuva(fingerprint)}.tmp"
+    df.to_parquet(temporario, index=False)
+    os.replace(temporario, _caminho_chuva(fingerprint))
+    return df
+
+def anomalias_chuva(df):
+    """
+    Matrizes ano x mês de chuva (mm), anomalia (% da normal) e índice padronizado
+    tipo SPI: (chuva - média do mês) / desvio do mês, na base 2000-2025.
+    """
+    df = df.dropna(subset=['Chuva (mm)']).copy()
+    df['Ano'] = df['Data'].dt.year
+    df['Mês_Num'] = df['Data'].dt.month
+
+    inicio_base, fim_base = (int(d[:4]) for d in PERIODO_CHIRPS)
+    base = df[df['Ano'].between(inicio_base, fim_base)].groupby('Mês_Num')['Chuva (mm)']
+    media, desvio = base.mean(), base.std()
+
+    df['Anomalia (%)'] = 100 * (df['Chuva (mm)'] / df['Mês_Num'].map(media) - 1)
+    df['Índice'] = (df['Chuva (mm)'] - df['Mês_Num'].map(media)) / df['Mês_Num'].map(desvio)
+
+    def matriz(coluna):
+        m = df.pivot(index='Ano', columns='Mês_Num', values=coluna).reindex(columns=range(1, 13))
+        m.columns = [MESES_PT[c] for c in m.columns]
+        return m
+
+    return matriz('Chuva (mm)'), matriz('Anomalia (%)'), matriz('Índice')
+
+def classe_spi(valor):
+    if pd.isna(valor): return "-"
+    return next(nome for lo, hi, nome in CLASSES_SPI if lo <= valor < hi)
 
 # ==========================================
-# 2. RENDERIZAÇÃO DA PÁGINA
+# 3. RENDERIZAÇÃO DA PÁGINA
 # ==========================================
 
 def render_tab():
@@ -153,12 +251,21 @@ def render_tab():
     if st.session_state.get('last_clim_source') != source_name:
         if 'clim_temp' in st.session_state: del st.session_state['clim_temp']
         if 'clim_rain' in st.session_state: del st.session_state['clim_rain']
-        if 'erro_clima_temp' in st.session_state: del st.session_state['erro_clima_temp']
-        if 'erro_clima_rain' in st.session_state: del st.session_state['erro_clima_rain']
+        if 'erro_clima' in st.session_state: del st.session_state['erro_clima']
+        if 'clim_chuva_anual' in st.session_state: del st.session_state['clim_chuva_anual']
         st.session_state['last_clim_source'] = source_name
 
     st.info(f"Análise Climática para: **{source_name}**")
-    
+
+    # Temperatura e chuva vêm da mesma redução (cache pelo fingerprint da geometria)
+    if st.button("📊 Gerar Climatologia (Temperatura e Chuva)", use_container_width=True):
+        with st.spinner("Processando WorldClim e CHIRPS..."):
+            df_temp, df_rain = get_climatologia(geometry, utils.fingerprint_geometria(geometry))
+            if not df_temp.empty: st.session_state['clim_temp'] = df_temp
+            if not df_rain.empty: st.session_state['clim_rain'] = df_rain
+            if df_temp.empty or df_rain.empty:
+                st.error(f"Erro: {st.session_state.get('erro_clima', 'Sem dados para a área.')}")
+
     col_temp, col_rain = st.columns(2, gap="medium")
 
     # --- COLUNA 1: TEMPERATURA ---
@@ -166,15 +273,7 @@ def render_tab():
         st.subheader("🌡️ Temperatura")
         with st.container(border=True):
             st.markdown("**Médias Históricas (WorldClim)**")
-            
-            if st.button("📉 Gerar Gráfico de Temperatura", use_container_width=True):
-                with st.spinner("Processando WorldClim..."):
-                    df_temp = get_worldclim_data(geometry, source_name)
-                    if not df_temp.empty:
-                        st.session_state['clim_temp'] = df_temp
-                    elif 'erro_clima_temp' in st.session_state:
-                        st.error(f"Erro: {st.session_state['erro_clima_temp']}")
-            
+
             if 'clim_temp' in st.session_state:
                 df = st.session_state['clim_temp']
                 
@@ -219,15 +318,6 @@ def render_tab():
         st.subheader("☔ Precipitação")
         with st.container(border=True):
             st.markdown("**Médias Mensais (CHIRPS - 0.05°)**")
-            
-            if st.button("🌧️ Gerar Gráfico de Chuva", use_container_width=True):
-                with st.spinner("Processando CHIRPS..."):
-                    df_rain = get_chirps_data(geometry, source_name)
-                    if not df_rain.empty:
-                        st.session_state['clim_rain'] = df_rain
-                    else:
-                        msg = st.session_state.get('erro_clima_rain', 'Erro desconhecido.')
-                        st.error(f"Erro CHIRPS: {msg}")
 
             if 'clim_rain' in st.session_state:
                 df = st.session_state['clim_rain']
@@ -259,4 +349,53 @@ def render_tab():
                     file_name=f'precipitacao_{source_name}.xlsx',
                     mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                     use_container_width=True
-                )
\ No newline at end of file
+                )
+
+    # --- CHUVA ANO A ANO (matriz incremental + anomalias) ---
+    st.subheader("📅 Chuva Ano a Ano e Anomalias")
+    with st.container(border=True):
+        fingerprint = utils.fingerprint_geometria(geometry)
+        if st.button("📅 Gerar Matriz de Chuva Mensal", use_container_width=True):
+            with st.spinner("Processando CHIRPS mês a mês..."):
+                try:
+                    st.session_state['clim_chuva_anual'] = atualizar_chuva_mensal(geometry, fingerprint)
+                except Exception as e:
+                    st.error(f"Erro CHIRPS: {e}")
+
+        df_mensal = st.session_state.get('clim_chuva_anual')
+        if df_mensal is not None and not df_mensal.empty:
+            chuva, anomalia, indice = anomalias_chuva(df_mensal)
+
+            escolha = st.radio("Exibir", ["Índice padronizado (SPI)", "Anomalia (% da normal)", "Chuva (mm)"], horizontal=True, key="clim_matriz")
+            matriz, escala, faixa, formato = {
+                "Índice padronizado (SPI)": (indice, "RdBu", (-2.5, 2.5), ".1f"),
+                "Anomalia (% da normal)": (anomalia, "RdBu", (-100, 100), ".0f"),
+                "Chuva (mm)": (chuva, "Blues", (None, None), ".0f"),
+            }[escolha]
+
+            fig = px.imshow(
+                matriz, color_continuous_scale=escala, zmin=faixa[0], zmax=faixa[1],
+                aspect="auto", text_auto=formato, labels=dict(color=escolha)
+            )
+            fig.update_layout(height=max(350, 22 * len(matriz)), margin=dict(l=20, r=20, t=20, b=20), yaxis=dict(dtick=1))
+            st.plotly_chart(fig, use_container_width=True)
+
+            # Resumo do último ano fechado
+            anual = chuva.sum(axis=1, min_count=12)
+            normal = anual.loc[anual.index.isin(range(int(PERIODO_CHIRPS[0][:4]), int(PERIODO_CHIRPS[1][:4]) + 1))].mean()
+            ultimo_mes = df_mensal.dropna(subset=['Chuva (mm)'])['Data'].max()
+            idx_ultimo = indice.loc[ultimo_mes.year, MESES_PT[ultimo_mes.month]]
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Normal Anual", f"{normal:,.0f}".replace(",", ".") + " mm")
+            c2.metric(f"Chuva {MESES_PT[ultimo_mes.month]}/{ultimo_mes.year}", f"{chuva.loc[ultimo_mes.year, MESES_PT[ultimo_mes.month]]:,.0f}".replace(",", ".") + " mm",
+                      f"{anomalia.loc[ultimo_mes.year, MESES_PT[ultimo_mes.month]]:+.0f}%")
+            c3.metric("Índice do Mês", f"{idx_ultimo:+.2f}".replace(".", ","), classe_spi(idx_ultimo), delta_color="off")
+            st.caption("Fonte: CHIRPS Pentad (soma mensal). Índice = (chuva - média do mês) / desvio padrão do mês, base 2000-2025; classes de McKee et al. (1993).")
+
+            st.download_button(
+                label="📥 Baixar Matriz",
+                data=to_excel_horizontal(chuva.T.reset_index().rename(columns={'index': 'Mês'})),
+                file_name=f'chuva_mensal_{source_name}.xlsx',
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                use_container_width=True
+            )
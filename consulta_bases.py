@@ -5,10 +5,7 @@ import duckdb
 import folium
 from streamlit_folium import st_folium
 from shapely import wkb
-import io
-import zipfile
-import tempfile
-import os
+import exportacao
 
 # --- 1. CONFIGURAÇÃO ---
 URL_SIGEF = "https://huggingface.co/datasets/julioczcosta/base-incra/resolve/main/sigef_brasil.parquet?download=true"
@@ -45,101 +42,20 @@ def calcular_area_hectares(gdf):
     except:
         return 0.0
 
-# --- 3. GERADORES DE ARQUIVOS (TEXTO PURO & COORDENADAS SEGURAS) ---
+# --- 3. GERADORES DE ARQUIVOS ---
 
 def gerar_kml_perimetro(gdf, codigo):
-    try:
-        # Cabeçalho KML
-        kml = [
-            '<?xml version="1.0" encoding="UTF-8"?>',
-            '<kml xmlns="http://www.opengis.net/kml/2.2">',
-            '<Document>',
-            '<Style id="yellowBorder">',
-            '<LineStyle><color>ff00ffff</color><width>4</width></LineStyle>',
-            '<PolyStyle><color>00ffffff</color></PolyStyle>',
-            '</Style>'
-        ]
-
-        for _, row in gdf.iterrows():
-            kml.append('<Placemark>')
-            kml.append(f'<name>{str(codigo)}</name>')
-            kml.append('<styleUrl>#yellowBorder</styleUrl>')
-
-            # --- DESCRIÇÃO ---
-            desc_lines = []
-            for col in gdf.columns:
-                if col == 'geometry': continue
-                
-                val = row[col]
-                val_str = str(val).strip()
-                
-                if val_str.lower() in ['nan', 'nat', 'none', '', '<na>']:
-                    continue
-                
-                val_str = val_str.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                desc_lines.append(f"<b>{col}:</b> {val_str}")
-
-            full_desc = "<br>".join(desc_lines)
-            kml.append(f'<description><![CDATA[{full_desc}]]></description>')
-
-            # --- GEOMETRIA ---
-            geom = row.geometry
-            if geom and not geom.is_empty:
-                kml.append('<MultiGeometry>')
-                
-                if geom.geom_type == 'Polygon':
-                    polys = [geom]
-                elif geom.geom_type == 'MultiPolygon':
-                    polys = geom.geoms
-                else:
-                    polys = []
-
-                for poly in polys:
-                    if poly.is_empty: continue
-                    
-                    coords_str_list = []
-                    # CORREÇÃO DO ERRO AQUI:
-                    # Em vez de "for x, y in...", pegamos a tupla inteira "point"
-                    for point in poly.exterior.coords:
-                        # Pegamos sempre os dois primeiros valores (X, Y)
-                        x, y = point[0], point[1]
-                        coords_str_list.append(f"{x},{y},0")
-                    
-                    coords_str = " ".join(coords_str_list)
-                    
-                    kml.append('<Polygon><outerBoundaryIs><LinearRing><coordinates>')
-                    kml.append(coords_str)
-                    kml.append('</coordinates></LinearRing></outerBoundaryIs></Polygon>')
-                
-                kml.append('</MultiGeometry>')
-
-            kml.append('</Placemark>')
-
-        kml.append('</Document></kml>')
-        return "\n".join(kml).encode('utf-8')
-
-    except Exception as e:
-        return f"ERRO: {str(e)}"
+    kml = exportacao.gerar_kml_bytes(gdf, nome=codigo)
+    return kml if kml is not None else "ERRO: falha ao gerar KML."
 
 def gerar_shp_perimetro(gdf, codigo):
-    try:
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            clean_gdf = gdf.copy()
-            for col in clean_gdf.columns:
-                if col != 'geometry':
-                    clean_gdf[col] = clean_gdf[col].astype(str).replace({'NaT': '', 'nan': '', 'None': ''})
+    clean_gdf = gdf.copy()
+    for col in clean_gdf.columns:
+        if col != 'geometry':
+            clean_gdf[col] = clean_gdf[col].astype(str).replace({'NaT': '', 'nan': '', 'None': ''})
 
-            safe_code = str(codigo).replace("/", "_").replace(".", "").replace(" ", "_")[:15]
-            clean_gdf.to_file(os.path.join(tmpdirname, f"INCRA_{safe_code}.shp"), driver='ESRI Shapefile')
-            
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for root, _, files in os.walk(tmpdirname):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        zf.write(file_path, arcname=file)
-            return zip_buffer.getvalue()
-    except Exception: return None
+    safe_code = str(codigo).replace("/", "_").replace(".", "").replace(" ", "_")[:15]
+    return exportacao.gerar_shapefile_zip(clean_gdf, f"INCRA_{safe_code}")
 
 # --- 4. BUSCA ---
 def buscar_imovel_especifico(filtros_sql, url_parquet, eh_sigef=True):
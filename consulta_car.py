@@ -9,11 +9,7 @@ from urllib3.poolmanager import PoolManager
 import json
 import geopandas as gpd
 import pandas as pd
-import io
-import zipfile
-import tempfile
-import os
-import xml.dom.minidom as minidom
+import exportacao
 
 # --- 1. CONFIGURAÇÃO DE REDE BLINDADA ---
 class LegacySSLAdapter(HTTPAdapter):
@@ -67,93 +63,15 @@ def calcular_area_geometria(gdf):
 
 # --- 3. GERADORES DE ARQUIVOS ---
 def gerar_kml_perimetro(gdf, codigo_car, metadados):
-    try:
-        doc = minidom.Document()
-        kml = doc.createElementNS('http://www.opengis.net/kml/2.2', 'kml')
-        kml.setAttribute('xmlns', 'http://www.opengis.net/kml/2.2')
-        doc.appendChild(kml)
-        
-        document = doc.createElement('Document')
-        kml.appendChild(document)
-        
-        # Estilo Amarelo (Sem preenchimento)
-        style = doc.createElement('Style')
-        style.setAttribute('id', 'yellowBorder')
-        lstyle = doc.createElement('LineStyle')
-        lcolor = doc.createElement('color')
-        lcolor.appendChild(doc.createTextNode('ff00ffff')) # Amarelo
-        lwidth = doc.createElement('width')
-        lwidth.appendChild(doc.createTextNode('4'))
-        lstyle.appendChild(lcolor)
-        lstyle.appendChild(lwidth)
-        pstyle = doc.createElement('PolyStyle')
-        pcolor = doc.createElement('color')
-        pcolor.appendChild(doc.createTextNode('00ffffff')) # Transparente
-        pstyle.appendChild(pcolor)
-        style.appendChild(lstyle)
-        style.appendChild(pstyle)
-        document.appendChild(style)
-
-        for _, row in gdf.iterrows():
-            placemark = doc.createElement('Placemark')
-            name = doc.createElement('name')
-            name.appendChild(doc.createTextNode(str(codigo_car)))
-            placemark.appendChild(name)
-            
-            style_url = doc.createElement('styleUrl')
-            style_url.appendChild(doc.createTextNode('#yellowBorder'))
-            placemark.appendChild(style_url)
-
-            # Usa os metadados garantidos
-            desc_txt = f"Código: {codigo_car}\nMunicípio: {metadados['municipio']}\nÁrea: {metadados['area']} ha\nStatus: {metadados['status']}"
-            
-            desc = doc.createElement('description')
-            desc.appendChild(doc.createCDATASection(desc_txt))
-            placemark.appendChild(desc)
-
-            geom = row.geometry
-            geoms = [geom] if geom.geom_type == 'Polygon' else (geom.geoms if geom.geom_type == 'MultiPolygon' else [])
-
-            if len(geoms) > 1:
-                container = doc.createElement('MultiGeometry')
-                placemark.appendChild(container)
-            else:
-                container = placemark
-
-            for poly in geoms:
-                if poly.is_empty: continue
-                polygon_xml = doc.createElement('Polygon')
-                outer = doc.createElement('outerBoundaryIs')
-                ring = doc.createElement('LinearRing')
-                coords_elem = doc.createElement('coordinates')
-                coords = list(poly.exterior.coords)
-                coords_str = " ".join([f"{x},{y},0" for x, y in coords])
-                coords_elem.appendChild(doc.createTextNode(coords_str))
-                ring.appendChild(coords_elem)
-                outer.appendChild(ring)
-                polygon_xml.appendChild(outer)
-                container.appendChild(polygon_xml)
-            
-            document.appendChild(placemark)
-        return doc.toprettyxml(encoding='UTF-8')
-    except Exception: return None
+    # Usa os metadados garantidos
+    desc_txt = f"Código: {codigo_car}\nMunicípio: {metadados['municipio']}\nÁrea: {metadados['area']} ha\nStatus: {metadados['status']}"
+    return exportacao.gerar_kml_bytes(gdf, nome=codigo_car, descricao=desc_txt)
 
 def gerar_shp_perimetro(gdf, codigo_car):
-    try:
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            clean_gdf = gdf[['geometry']].copy()
-            clean_gdf['codigo'] = str(codigo_car)
-            safe_code = str(codigo_car).replace("/", "_").replace(".", "")
-            clean_gdf.to_file(os.path.join(tmpdirname, f"CAR_{safe_code}.shp"), driver='ESRI Shapefile')
-
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for root, _, files in os.walk(tmpdirname):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        zf.write(file_path, arcname=file)
-            return zip_buffer.getvalue()
-    except Exception: return None
+    clean_gdf = gdf[['geometry']].copy()
+    clean_gdf['codigo'] = str(codigo_car)
+    safe_code = str(codigo_car).replace("/", "_").replace(".", "")
+    return exportacao.gerar_shapefile_zip(clean_gdf, f"CAR_{safe_code}")
 
 # --- 4. FUNÇÃO PRINCIPAL ---
 def render_tab():
@@ -0,0 +1,287 @@
+import time
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+import streamlit as st
+
+import camadas_locais
+import estatisticas_municipais
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+URL_WFS_IBGE = "https://geoservicos.ibge.gov.br/geoserver/ows"
+URL_NOMINATIM = "https://nominatim.openstreetmap.org/reverse"
+URL_MUNICIPIOS_UF = "https://servicodados.ibge.gov.br/api/v1/localidades/estados/{uf}/municipios"
+URL_SIDRA_POP = "https://apisidra.ibge.gov.br/values/t/4714/n6/{cod}/v/93/p/last%201"
+URL_AREA_MUN = "https://servicodados.ibge.gov.br/api/v3/malhas/municipios/{cod}/metadados"
+
+HEADERS = {"User-Agent": "GeoDashboard/1.0"}
+
+# (conexão, leitura) em segundos, por chamada HTTP
+TIMEOUT_CHAMADA = (3, 6)
+# Prazo total da aba: o que não chegar até aqui é exibido como indisponível
+PRAZO_TOTAL = 15
+MAX_WORKERS_CONTEXTO = 8
+# Cache das consultas remotas, compartilhado entre sessões (dados do IBGE mudam pouco)
+TTL_CONTEXTO = 24 * 3600
+
+# Painéis da aba Contexto e as consultas de que cada um depende
+PAINEIS = {
+    'politico': ('municipio', 'populacao', 'area', 'regioes'),
+    'ambiental': ('bioma', 'amazonia'),
+    'bacia': ('bacia',),
+}
+
+# ==========================================
+# 1. HTTP (UMA SESSÃO POR THREAD)
+# ==========================================
+
+_local = threading.local()
+
+def _sessao():
+    # requests.Session não é thread-safe: cada thread reaproveita a sua conexão
+    if not hasattr(_local, 'sessao'):
+        _local.sessao = requests.Session()
+        _local.sessao.headers.update(HEADERS)
+    return _local.sessao
+
+def _get_json(url, params=None, timeout=TIMEOUT_CHAMADA):
+    resp = _sessao().get(url, params=params, timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
+
+def _wfs(type_name, **filtro):
+    """Primeira feição do WFS do IBGE ({} se não houver)."""
+    params = {"service": "WFS", "version": "1.0.0", "request": "GetFeature",
+              "typeName": type_name, "outputFormat": "application/json", **filtro}
+    dados = _get_json(URL_WFS_IBGE, params)
+    return dados["features"][0]["properties"] if dados.get("features") else {}
+
+def _bbox(lat, lon, raio):
+    return f"{lon - raio},{lat - raio},{lon + raio},{lat + raio}"
+
+def _primeiro_valido(funcoes):
+    """
+    Dispara alternativas ao mesmo tempo e devolve o resultado não vazio de maior
+    prioridade (ordem da lista). Falhas e vazios são ignorados; cada chamada já
+    é limitada por TIMEOUT_CHAMADA.
+    """
+    with ThreadPoolExecutor(max_workers=len(funcoes)) as pool:
+        futuros = [pool.submit(f) for f in funcoes]
+    for futuro in futuros:
+        if not futuro.exception() and futuro.result():
+            return futuro.result()
+    # Todas falharam: propaga o erro para o resultado não ficar no cache
+    if all(f.exception() for f in futuros):
+        raise futuros[0].exception()
+    return {}
+
+def _normalizar(s):
+    return unicodedata.normalize('NFKD', s).encode('ascii', 'ignore').decode().lower()
+
+# ==========================================
+# 2. CONSULTAS INDIVIDUAIS
+# ==========================================
+
+@st.cache_data(ttl=TTL_CONTEXTO, show_spinner=False)
+def buscar_municipio(lat, lon):
+    """Nominatim (nome + UF) -> lista de municípios do IBGE (código oficial)."""
+    geo = _get_json(URL_NOMINATIM, {"format": "json", "lat": lat, "lon": lon, "zoom": 10})
+    endereco = geo.get("address", {})
+    cidade = endereco.get("city") or endereco.get("town") or endereco.get("village") or endereco.get("municipality")
+    estado = endereco.get("ISO3166-2-lvl4", "")
+    uf = estado.split("-")[1] if "-" in estado else "BR"
+    if not cidade: return {"erro": "Local não identificado."}
+
+    lista = _get_json(URL_MUNICIPIOS_UF.format(uf=uf))
+    alvo = _normalizar(cidade)
+    municipio = next((m for m in lista if _normalizar(m['nome']) == alvo), None)
+    if not municipio: municipio = next((m for m in lista if alvo in _normalizar(m['nome'])), None)
+    if not municipio: return {"erro": f"Município {cidade} não encontrado."}
+    return {"municipio": municipio['nome'], "uf": uf, "codigo_ibge": municipio['id']}
+
+@st.cache_data(ttl=TTL_CONTEXTO, show_spinner=False)
+def buscar_populacao(codigo_ibge):
+    r = _get_json(URL_SIDRA_POP.format(cod=codigo_ibge))
+    return float(r[1].get("V")) if len(r) > 1 else None
+
+@st.cache_data(ttl=TTL_CONTEXTO, show_spinner=False)
+def buscar_area(codigo_ibge):
+    r = _get_json(URL_AREA_MUN.format(cod=codigo_ibge))
+    return float(r[0].get("area", {}).get("dimensao")) if r else None
+
+@st.cache_data(ttl=TTL_CONTEXTO, show_spinner=False)
+def buscar_regioes(lat, lon):
+    """Regiões geográficas intermediária e imediata (as duas WFS em paralelo)."""
+    bbox = _bbox(lat, lon, 0.001)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        f_int = pool.submit(_wfs, "CGEO:RG2017_rgint", bbox=bbox)
+        f_ime = pool.submit(_wfs, "CGMAT:qg_2024_110_reggeogimed_agreg", bbox=bbox)
+    if f_int.exception() and f_ime.exception():
+        raise f_int.exception()
+    reg_int = f_int.result().get("first_nome", "---") if not f_int.exception() else "---"
+    reg_ime = f_ime.result().get("nm_rgi", "---") if not f_ime.exception() else "---"
+    return {"regiao_intermediaria": reg_int or "---", "regiao_imediata": reg_ime or "---"}
+
+def _intersecta_ponto(type_name, lat, lon):
+    # O GeoServer do IBGE usa 'geom' ou 'the_geom' conforme a camada: testa as duas juntas
+    return _primeiro_valido([
+        lambda col=col: _wfs(type_name, cql_filter=f"INTERSECTS({col}, POINT({lon} {lat}))")
+        for col in ('geom', 'the_geom')
+    ])
+
+@st.cache_data(ttl=TTL_CONTEXTO, show_spinner=False)
+def buscar_bioma(lat, lon):
+    props = _intersecta_ponto("CREN:bioma_vazado", lat, lon)
+    return props.get("bioma", "Não identificado") if props else "Não identificado"
+
+@st.cache_data(ttl=TTL_CONTEXTO, show_spinner=False)
+def buscar_amazonia_legal(lat, lon):
+    return bool(_intersecta_ponto("CGMAT:lim_amazonia_legal_2022", lat, lon))
+
+@st.cache_data(ttl=TTL_CONTEXTO, show_spinner=False)
+def buscar_bacia(lat, lon):
+    """Bacia nível 6 (preferida) e nível 4 consultadas ao mesmo tempo."""
+    bbox = _bbox(lat, lon, 0.01)
+    props = _primeiro_valido([
+        lambda: _wfs("CREN:bacias_nivel_6", bbox=bbox),
+        lambda: _wfs("CREN:bacias_nivel_4", bbox=bbox),
+    ])
+    if not props: return {"erro": "Bacia não identificada."}
+    return {
+        "suprabacia": props.get("suprabacia", "---"),
+        "nome_bacia": props.get("nome_bacia", "---"),
+        "curso_prin": props.get("curso_prin", "---"),
+        "princ_aflu": props.get("princ_aflu", "---")
+    }
+
+# ==========================================
+# 3. MONTAGEM DOS PAINÉIS
+# ==========================================
+
+def _valor(resultados, nome, padrao=None):
+    r = resultados.get(nome)
+    return padrao if r is None or isinstance(r, Exception) else r
+
+def _incompleto(painel, resultados):
+    """Alguma consulta do painel falhou ou não chegou a tempo."""
+    return any(isinstance(resultados.get(d, TimeoutError()), Exception) for d in PAINEIS[painel])
+
+def montar_painel(painel, resultados):
+    """Converte os resultados das consultas no dicionário que a aba exibe."""
+    if painel == 'politico':
+        mun = _valor(resultados, 'municipio')
+        if not mun: return {"erro": "Erro na geolocalização."}
+        if "erro" in mun: return mun
+        pop, area = _valor(resultados, 'populacao'), _valor(resultados, 'area')
+        return {
+            **mun, "populacao": pop, "area_km2": area,
+            "densidade": (pop / area) if (pop and area) else None,
+            **_valor(resultados, 'regioes', {"regiao_intermediaria": "---", "regiao_imediata": "---"})
+        }
+    if painel == 'ambiental':
+        return {"bioma": _valor(resultados, 'bioma', "Não identificado"),
+                "amazonia_legal": _valor(resultados, 'amazonia', False)}
+    if painel == 'bacia':
+        return _valor(resultados, 'bacia', {"erro": "Bacia não identificada."})
+    raise ValueError(painel)
+
+# ==========================================
+# 4. ORQUESTRAÇÃO (PARALELO + DEPENDÊNCIAS)
+# ==========================================
+
+def consultar_contexto(lat, lon, geojson=None, prazo=PRAZO_TOTAL, max_workers=MAX_WORKERS_CONTEXTO):
+    """
+    Executa todas as consultas de contexto ao mesmo tempo e entrega
+    (painel, dados) assim que cada painel fica completo.
+    Única dependência: município -> população e área (precisam do código IBGE).
+    Município e regiões vêm da malha local quando ela existe (sem rede).
+    Com o polígono (geojson) e as camadas locais, bioma, Amazônia Legal e bacia
+    saem da área de todo o imóvel em vez de só do centroide.
+    Consultas que falham ou estouram o prazo entram como indisponíveis, e o
+    painel sai marcado com "incompleto" (não deve ser guardado em cache).
+    """
+    limite = time.monotonic() + prazo
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futuros = {}
+        resultados = {}
+        entregues = set()
+
+        def registrar(nome, valor):
+            resultados[nome] = valor
+            # Dependência: com o código IBGE, população e área (tabela local ou IBGE)
+            if nome == 'municipio':
+                cod = _valor(resultados, 'municipio', {}).get('codigo_ibge')
+                estat = estatisticas_municipais.obter(cod) if cod and estatisticas_municipais.disponivel() else None
+                if estat:
+                    resultados['populacao'], resultados['area'] = estat['populacao'], estat['area_km2']
+                elif cod:
+                    futuros[pool.submit(buscar_populacao, cod)] = 'populacao'
+                    futuros[pool.submit(buscar_area, cod)] = 'area'
+                else:
+                    resultados['populacao'] = resultados['area'] = None
+
+        def montar(painel):
+            dados = montar_painel(painel, resultados)
+            return {**dados, "incompleto": True} if _incompleto(painel, resultados) else dados
+
+        def completos():
+            for painel, deps in PAINEIS.items():
+                if painel not in entregues and all(d in resultados for d in deps):
+                    entregues.add(painel)
+                    yield painel, montar(painel)
+
+        local = camadas_locais.municipio_local(lat, lon)
+        if local:
+            resultados['regioes'] = {k: local.pop(k) for k in ('regiao_intermediaria', 'regiao_imediata')}
+            registrar('municipio', local)
+        else:
+            futuros[pool.submit(buscar_municipio, lat, lon)] = 'municipio'
+            futuros[pool.submit(buscar_regioes, lat, lon)] = 'regioes'
+
+        try:
+            locais = camadas_locais.paineis_ambientais(geojson) if geojson else {}
+        except Exception:
+            locais = {}  # camada local ilegível: segue pelas consultas remotas
+        for painel, dados in locais.items():
+            entregues.add(painel)
+            yield painel, dados
+
+        if 'ambiental' not in locais:
+            futuros[pool.submit(buscar_bioma, lat, lon)] = 'bioma'
+            futuros[pool.submit(buscar_amazonia_legal, lat, lon)] = 'amazonia'
+        if 'bacia' not in locais:
+            futuros[pool.submit(buscar_bacia, lat, lon)] = 'bacia'
+
+        # Painéis resolvidos só com bases locais saem antes de esperar a rede
+        yield from completos()
+
+        while futuros:
+            feitos, _ = wait(futuros, timeout=max(0, limite - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not feitos:
+                break  # prazo esgotado
+
+            for futuro in feitos:
+                nome = futuros.pop(futuro)
+                try:
+                    registrar(nome, futuro.result())
+                except Exception as e:
+                    registrar(nome, e)
+
+            yield from completos()
+
+        # O que sobrou após o prazo é entregue com o que houver
+        for painel in PAINEIS:
+            if painel not in entregues:
+                yield painel, montar(painel)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def consultar_contexto_completo(lat, lon, **kwargs):
+    """Versão síncrona: {painel: dados} com todos os painéis."""
+    return dict(consultar_contexto(lat, lon, **kwargs))
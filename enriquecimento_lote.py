@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+
+import camadas_locais
+import estatisticas_municipais
+import koppen
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+# Enriquecimento em lote de planilhas de pontos ou polígonos, só com bases locais:
+#   python enriquecimento_lote.py entrada.csv saida.parquet [--lat LAT --lon LON | --geometria COL]
+# Polígonos são classificados pelo ponto interno (point_on_surface).
+
+# Camada local -> {coluna da camada: coluna de saída}
+ATRIBUTOS = {
+    'municipios': {'codigo_ibge': 'codigo_ibge', 'municipio': 'municipio', 'uf': 'uf',
+                   'regiao_imediata': 'regiao_imediata', 'regiao_intermediaria': 'regiao_intermediaria'},
+    'biomas': {'bioma': 'bioma'},
+    'bacias_6': {'nome_bacia': 'bacia', 'suprabacia': 'suprabacia', 'curso_prin': 'curso_prin'},
+}
+
+COLUNAS_ESTATISTICAS = ['populacao', 'area_km2', 'densidade']
+
+NOMES_LAT = ('lat', 'latitude', 'y')
+NOMES_LON = ('lon', 'lng', 'long', 'longitude', 'x')
+
+# ==========================================
+# 1. JUNÇÕES VETORIZADAS
+# ==========================================
+
+def _tomar(valores, idx):
+    """valores[idx] com None onde idx == -1."""
+    saida = np.full(len(idx), None, dtype=object)
+    ok = idx >= 0
+    saida[ok] = np.asarray(valores, dtype=object)[idx[ok]]
+    return saida
+
+def _juntar_camada(saida, nome, lons, lats):
+    atributos, _, _ = camadas_locais.carregar(nome)
+    idx = camadas_locais.indices_pontos(nome, lons, lats)
+    for origem, destino in ATRIBUTOS[nome].items():
+        saida[destino] = _tomar(atributos[origem].to_numpy(), idx)
+    return idx
+
+def enriquecer_pontos(lons, lats):
+    """
+    Contexto territorial de muitos pontos de uma vez (arrays de lon/lat em WGS84).
+    Retorna (DataFrame na ordem da entrada, lista de camadas ausentes).
+    """
+    lons, lats = np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+    saida = pd.DataFrame(index=range(len(lons)))
+    ausentes = []
+
+    if camadas_locais.disponivel('municipios'):
+        _juntar_camada(saida, 'municipios', lons, lats)
+        if estatisticas_municipais.disponivel():
+            codigos = pd.to_numeric(saida['codigo_ibge'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+            pos = estatisticas_municipais.linhas(codigos)
+            tabela = estatisticas_municipais.colunas()
+            for c in COLUNAS_ESTATISTICAS:
+                saida[c] = _tomar(tabela[c], pos)
+        else:
+            ausentes.append('estatisticas_municipais')
+    else:
+        ausentes.append('municipios')
+
+    if camadas_locais.disponivel('biomas'):
+        _juntar_camada(saida, 'biomas', lons, lats)
+    else:
+        ausentes.append('biomas')
+
+    if camadas_locais.disponivel('amazonia_legal'):
+        saida['amazonia_legal'] = camadas_locais.indices_pontos('amazonia_legal', lons, lats) >= 0
+    else:
+        ausentes.append('amazonia_legal')
+
+    # Bacia nível 6; pontos sem nível 6 recebem o nível 4
+    if camadas_locais.disponivel('bacias_6'):
+        idx = _juntar_camada(saida, 'bacias_6', lons, lats)
+        faltam = np.flatnonzero(idx < 0)
+        if len(faltam) and camadas_locais.disponivel('bacias_4'):
+            atributos, _, _ = camadas_locais.carregar('bacias_4')
+            idx4 = camadas_locais.indices_pontos('bacias_4', lons[faltam], lats[faltam])
+            for origem, destino in ATRIBUTOS['bacias_6'].items():
+                saida.loc[faltam, destino] = _tomar(atributos[origem].to_numpy(), idx4)
+    else:
+        ausentes.append('bacias_6')
+
+    if koppen.disponivel():
+        saida['koppen'] = koppen.classes_pontos(lats, lons)
+    else:
+        ausentes.append('koppen')
+
+    return saida, ausentes
+
+def enriquecer(df, lat=None, lon=None, geometria=None):
+    """
+    Acrescenta as colunas de contexto a uma tabela de pontos (lat/lon) ou
+    geometrias (GeoDataFrame ou coluna WKT). Retorna (tabela, camadas ausentes).
+    """
+    if geometria is not None or isinstance(df, gpd.GeoDataFrame):
+        if isinstance(df, gpd.GeoDataFrame) and geometria in (None, df.geometry.name):
+            geoms = df.to_crs("EPSG:4326").geometry.values.to_numpy() if df.crs else df.geometry.values.to_numpy()
+        else:
+            # Células vazias ou WKT inválido viram None e ficam sem contexto
+            wkt = df[geometria].to_numpy(dtype=object, copy=True)
+            wkt[pd.isna(wkt)] = None
+            geoms = shapely.from_wkt(wkt, on_invalid="ignore")
+        pontos = shapely.point_on_surface(geoms)
+        pontos[shapely.is_empty(pontos)] = None  # get_x falha em ponto vazio
+        lons, lats = shapely.get_x(pontos), shapely.get_y(pontos)
+    else:
+        lat = lat or next((c for c in df.columns if c.lower() in NOMES_LAT), None)
+        lon = lon or next((c for c in df.columns if c.lower() in NOMES_LON), None)
+        if lat is None or lon is None:
+            raise ValueError("Colunas de latitude/longitude não encontradas (use --lat/--lon).")
+        lats, lons = df[lat].to_numpy(dtype=float), df[lon].to_numpy(dtype=float)
+
+    contexto, ausentes = enriquecer_pontos(lons, lats)
+    contexto.index = df.index
+    # Não sobrescreve colunas que já existem na entrada
+    contexto = contexto.rename(columns={c: f"ctx_{c}" for c in contexto.columns if c in df.columns})
+    return pd.concat([df, contexto], axis=1), ausentes
+
+# ==========================================
+# 2. ENTRADA E SAÍDA
+# ==========================================
+
+def ler_tabela(caminho):
+    ext = os.path.splitext(caminho)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(caminho)
+    if ext == ".parquet":
+        try:
+            return gpd.read_parquet(caminho)  # GeoParquet
+        except Exception:
+            return pd.read_parquet(caminho)
+    if ext in (".xlsx", ".xls"):
+        return pd.read_excel(caminho)
+    return gpd.read_file(caminho)  # GPKG, GeoJSON, SHP...
+
+def gravar_tabela(df, caminho):
+    ext = os.path.splitext(caminho)[1].lower()
+    if ext == ".parquet":
+        df.to_parquet(caminho, index=False)
+        return
+    if isinstance(df, gpd.GeoDataFrame):
+        df = pd.DataFrame(df.assign(**{df.geometry.name: df.geometry.to_wkt()}))
+    if ext == ".csv":
+        df.to_csv(caminho, index=False)
+    elif ext == ".xlsx":
+        df.to_excel(caminho, index=False, engine="xlsxwriter")
+    else:
+        raise ValueError(f"Formato de saída não suportado: {ext}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enriquece pontos/polígonos com o contexto territorial (bases locais).")
+    parser.add_argument("entrada", help="CSV, Parquet/GeoParquet, XLSX ou arquivo vetorial")
+    parser.add_argument("saida", help="CSV, Parquet ou XLSX")
+    parser.add_argument("--lat", help="Coluna de latitude (detectada se omitida)")
+    parser.add_argument("--lon", help="Coluna de longitude (detectada se omitida)")
+    parser.add_argument("--geometria", help="Coluna com geometria em WKT")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    df = ler_tabela(args.entrada)
+    resultado, ausentes = enriquecer(df, lat=args.lat, lon=args.lon, geometria=args.geometria)
+    gravar_tabela(resultado, args.saida)
+
+    if ausentes:
+        print(f"Aviso: camadas locais ausentes (colunas vazias): {', '.join(ausentes)}", file=sys.stderr)
+    print(f"{len(resultado)} linhas enriquecidas em {time.perf_counter() - inicio:.1f}s -> {args.saida}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
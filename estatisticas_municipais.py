@@ -0,0 +1,189 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import requests
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+# Tabela local com população, área e regiões de todos os municípios.
+# Atualizada periodicamente com: python estatisticas_municipais.py
+PASTA_ESTATISTICAS = os.path.join("dados", "camadas")
+ARQUIVO_TABELA = "estatisticas_municipais.parquet"
+ARQUIVO_META = "estatisticas_municipais.json"
+
+# Três requisições cobrem o país inteiro
+URL_SIDRA_POP_TODOS = "https://apisidra.ibge.gov.br/values/t/4714/n6/all/v/93/p/last%201"
+URL_AREAS_TODOS = "https://servicodados.ibge.gov.br/api/v3/malhas/paises/BR/metadados"
+URL_LOCALIDADES = "https://servicodados.ibge.gov.br/api/v1/localidades/municipios"
+
+TIMEOUT_DOWNLOAD = 120
+DIAS_VALIDADE = 30
+
+COLUNAS = ["codigo_ibge", "municipio", "uf", "populacao", "area_km2", "densidade",
+           "cod_regiao_imediata", "regiao_imediata", "cod_regiao_intermediaria", "regiao_intermediaria"]
+
+# ==========================================
+# 1. ATUALIZAÇÃO EM LOTE
+# ==========================================
+
+def _get_json(url, params=None):
+    resp = requests.get(url, params=params, timeout=TIMEOUT_DOWNLOAD)
+    resp.raise_for_status()
+    return resp.json()
+
+def _populacao():
+    linhas = _get_json(URL_SIDRA_POP_TODOS)[1:]  # primeira linha é o cabeçalho
+    df = pd.DataFrame({"codigo_ibge": [l["D1C"] for l in linhas], "populacao": [l["V"] for l in linhas]})
+    # SIDRA usa "-", "..." etc. para ausência de valor
+    df["populacao"] = pd.to_numeric(df["populacao"], errors="coerce")
+    return df.astype({"codigo_ibge": int})
+
+def _areas():
+    itens = _get_json(URL_AREAS_TODOS, {"intrarregiao": "municipio"})
+    return pd.DataFrame({
+        "codigo_ibge": [int(i["id"]) for i in itens],
+        "area_km2": [float(i["area"]["dimensao"]) for i in itens],
+    })
+
+def _regioes():
+    df = pd.DataFrame(_get_json(URL_LOCALIDADES, {"view": "nivelado"})).rename(columns={
+        "municipio-id": "codigo_ibge",
+        "municipio-nome": "municipio",
+        "UF-sigla": "uf",
+        "regiao-imediata-id": "cod_regiao_imediata",
+        "regiao-imediata-nome": "regiao_imediata",
+        "regiao-intermediaria-id": "cod_regiao_intermediaria",
+        "regiao-intermediaria-nome": "regiao_intermediaria",
+    })
+    return df[["codigo_ibge", "municipio", "uf", "cod_regiao_imediata", "regiao_imediata",
+               "cod_regiao_intermediaria", "regiao_intermediaria"]].astype({"codigo_ibge": int})
+
+def baixar_tabela():
+    """As três fontes em paralelo, unidas pelo código IBGE."""
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        f_reg, f_pop, f_area = pool.submit(_regioes), pool.submit(_populacao), pool.submit(_areas)
+    df = f_reg.result().merge(f_pop.result(), on="codigo_ibge", how="left") \
+                       .merge(f_area.result(), on="codigo_ibge", how="left")
+    df["densidade"] = df["populacao"] / df["area_km2"]
+    return df[COLUNAS].sort_values("codigo_ibge").reset_index(drop=True)
+
+def _assinatura(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+def comparar(antiga, nova):
+    """Resumo das mudanças entre duas versões da tabela."""
+    a, n = antiga.set_index("codigo_ibge"), nova.set_index("codigo_ibge")
+    comuns = a.index.intersection(n.index)
+    diferentes = (a.loc[comuns, COLUNAS[1:]] != n.loc[comuns, COLUNAS[1:]]) \
+                 & ~(a.loc[comuns, COLUNAS[1:]].isna() & n.loc[comuns, COLUNAS[1:]].isna())
+    return {
+        "novos": int(len(n.index.difference(a.index))),
+        "removidos": int(len(a.index.difference(n.index))),
+        "alterados": int(diferentes.any(axis=1).sum()),
+        "colunas_alteradas": {c: int(v) for c, v in diferentes.sum().items() if v},
+    }
+
+def atualizar(pasta=PASTA_ESTATISTICAS, progresso=print):
+    """
+    Baixa a tabela completa e só regrava se algo mudou.
+    Retorna o resumo das mudanças.
+    """
+    nova = baixar_tabela()
+    assinatura = _assinatura(nova)
+    meta_antiga = _ler_meta(pasta)
+
+    if meta_antiga and meta_antiga.get("assinatura") == assinatura:
+        resumo = {"novos": 0, "removidos": 0, "alterados": 0, "colunas_alteradas": {}}
+    elif disponivel(pasta):
+        resumo = comparar(pd.read_parquet(os.path.join(pasta, ARQUIVO_TABELA)), nova)
+    else:
+        resumo = {"novos": len(nova), "removidos": 0, "alterados": 0, "colunas_alteradas": {}}
+
+    meta = {"verificado_em": datetime.now().isoformat(timespec="seconds"), "assinatura": assinatura,
+            "municipios": len(nova), "ultima_mudanca": (meta_antiga or {}).get("ultima_mudanca")}
+    os.makedirs(pasta, exist_ok=True)
+    if meta_antiga is None or meta_antiga.get("assinatura") != assinatura:
+        caminho = os.path.join(pasta, ARQUIVO_TABELA)
+        nova.to_parquet(f"{caminho}.tmp", index=False)
+        os.replace(f"{caminho}.tmp", caminho)
+        meta["ultima_mudanca"] = meta["verificado_em"]
+        meta["resumo"] = resumo
+        _ler_tabela.cache_clear()
+
+    with open(os.path.join(pasta, ARQUIVO_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    progresso(f"{len(nova)} municípios; mudanças: {resumo}")
+    return resumo
+
+def _ler_meta(pasta=PASTA_ESTATISTICAS):
+    caminho = os.path.join(pasta, ARQUIVO_META)
+    if not os.path.exists(caminho): return None
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+def precisa_atualizar(pasta=PASTA_ESTATISTICAS, dias=DIAS_VALIDADE):
+    meta = _ler_meta(pasta)
+    if not meta or not disponivel(pasta): return True
+    return (datetime.now() - datetime.fromisoformat(meta["verificado_em"])).days >= dias
+
+# ==========================================
+# 2. CONSULTA (EM MEMÓRIA, SEM REDE)
+# ==========================================
+
+def disponivel(pasta=PASTA_ESTATISTICAS):
+    return os.path.exists(os.path.join(pasta, ARQUIVO_TABELA))
+
+def _carregar(pasta=PASTA_ESTATISTICAS):
+    """
+    Colunas como arrays NumPy, ordenadas pelo código IBGE (busca binária).
+    A data de modificação entra na chave do cache: a atualização feita pelo cron
+    (outro processo) vale para o servidor em execução sem reiniciá-lo.
+    """
+    caminho = os.path.join(pasta, ARQUIVO_TABELA)
+    return _ler_tabela(caminho, os.stat(caminho).st_mtime_ns)
+
+@lru_cache(maxsize=1)
+def _ler_tabela(caminho, versao):
+    df = pd.read_parquet(caminho).sort_values("codigo_ibge")
+    return {c: df[c].to_numpy() for c in COLUNAS}
+
+def linhas(codigos, pasta=PASTA_ESTATISTICAS):
+    """
+    Posição de cada código na tabela (-1 se não existir), vetorizado.
+    Use com colunas() para montar junções em lote.
+    """
+    tabela = _carregar(pasta)
+    codigos = np.asarray(codigos, dtype=np.int64)
+    pos = np.searchsorted(tabela["codigo_ibge"], codigos)
+    pos = np.minimum(pos, len(tabela["codigo_ibge"]) - 1)
+    return np.where(tabela["codigo_ibge"][pos] == codigos, pos, -1)
+
+def colunas(pasta=PASTA_ESTATISTICAS):
+    return _carregar(pasta)
+
+def obter(codigo_ibge, pasta=PASTA_ESTATISTICAS):
+    """Linha do município como dict (None se não estiver na tabela)."""
+    i = linhas([codigo_ibge], pasta)[0]
+    if i < 0: return None
+    tabela = _carregar(pasta)
+    linha = {}
+    for c in COLUNAS:
+        v = tabela[c][i]
+        linha[c] = None if pd.isna(v) else (v.item() if hasattr(v, "item") else v)
+    return linha
+
+if __name__ == "__main__":
+    import sys
+    # Para agendar (cron): só baixa se a última verificação passou de DIAS_VALIDADE
+    if "--forcar" in sys.argv or precisa_atualizar():
+        atualizar()
+    else:
+        print("Tabela verificada há menos de", DIAS_VALIDADE, "dias.")
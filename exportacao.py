@@ -0,0 +1,298 @@
+import io
+import time
+import zipfile
+import tracemalloc
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Fiona é usado apenas para os formatos binários (SHP, GPKG, FlatGeobuf),
+# que são gravados direto no /vsimem do GDAL via MemoryFile.
+try:
+    from fiona.io import MemoryFile
+    from geopandas.io.file import infer_schema
+except ImportError:
+    MemoryFile = None
+    infer_schema = None
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+# Estilo padrão dos perímetros (Borda amarela, sem preenchimento)
+ESTILO_PADRAO = (
+    '<Style id="yellowBorder">'
+    '<LineStyle><color>ff00ffff</color><width>4</width></LineStyle>'
+    '<PolyStyle><color>00ffffff</color></PolyStyle>'
+    '</Style>'
+)
+
+KML_CABECALHO = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+    '<Document>\n'
+)
+KML_RODAPE = '</Document>\n</kml>\n'
+
+VALORES_VAZIOS = {'nan', 'nat', 'none', '', '<na>'}
+
+# Quantidade de feições agrupadas por bloco de escrita (streaming)
+TAMANHO_BLOCO = 2000
+
+# ==========================================
+# 1. FUNÇÕES AUXILIARES
+# ==========================================
+
+def _para_wgs84(gdf):
+    """Garante coordenadas em WGS84 (exigido por KML e GeoJSON)."""
+    if gdf.crs is None:
+        return gdf.set_crs(epsg=4326)
+    if gdf.crs.to_epsg() != 4326:
+        return gdf.to_crs(epsg=4326)
+    return gdf
+
+def _coords_txt(coords):
+    """Formata um array (n, 2+) de coordenadas em texto KML numa única operação."""
+    xy = np.ascontiguousarray(coords[:, :2], dtype=float)
+    return ("%.8f,%.8f,0 " * len(xy) % tuple(xy.ravel())).rstrip()
+
+def _anel_kml(anel):
+    return f"<LinearRing><coordinates>{_coords_txt(shapely.get_coordinates(anel))}</coordinates></LinearRing>"
+
+def _geometria_kml(geom):
+    """Converte geometria Shapely em KML (inclui furos e multi-geometrias)."""
+    if geom is None or geom.is_empty:
+        return ""
+
+    tipo = geom.geom_type
+    if tipo == 'Point':
+        return f"<Point><coordinates>{_coords_txt(shapely.get_coordinates(geom))}</coordinates></Point>"
+    if tipo in ('LineString', 'LinearRing'):
+        return f"<LineString><coordinates>{_coords_txt(shapely.get_coordinates(geom))}</coordinates></LineString>"
+    if tipo == 'Polygon':
+        partes = [f"<outerBoundaryIs>{_anel_kml(geom.exterior)}</outerBoundaryIs>"]
+        partes += [f"<innerBoundaryIs>{_anel_kml(furo)}</innerBoundaryIs>" for furo in geom.interiors]
+        return f"<Polygon>{''.join(partes)}</Polygon>"
+
+    # MultiPoint, MultiLineString, MultiPolygon e GeometryCollection
+    filhos = "".join(_geometria_kml(g) for g in geom.geoms)
+    return f"<MultiGeometry>{filhos}</MultiGeometry>"
+
+def _descricao_atributos(linha):
+    """Monta a descrição HTML com todos os atributos preenchidos da feição."""
+    linhas = []
+    for col, val in linha.items():
+        val_str = str(val).strip()
+        if val_str.lower() in VALORES_VAZIOS:
+            continue
+        linhas.append(f"<b>{escape(str(col))}:</b> {escape(val_str)}")
+    return "<br>".join(linhas)
+
+# ==========================================
+# 2. KML / KMZ (STREAMING)
+# ==========================================
+
+def iter_kml(gdf, nome=None, descricao=None, estilo=ESTILO_PADRAO):
+    """
+    Gera o KML em blocos de texto, sem montar o documento inteiro na memória.
+    - nome: texto fixo para todas as feições (ou usa a coluna 'name'/'Name').
+    - descricao: texto fixo (ou tabela com todos os atributos da feição).
+    """
+    gdf = _para_wgs84(gdf)
+    atributos = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+    col_nome = next((c for c in ('name', 'Name', 'nome') if c in atributos.columns), None)
+    geometrias = gdf.geometry.values
+
+    yield KML_CABECALHO
+    if estilo:
+        yield estilo + "\n"
+
+    bloco = []
+    for i, geom in enumerate(geometrias):
+        if nome is not None:
+            nome_feicao = str(nome)
+        elif col_nome:
+            nome_feicao = str(atributos[col_nome].iat[i])
+        else:
+            nome_feicao = f"Feição {i + 1}"
+
+        if descricao is not None:
+            desc = str(descricao)
+        else:
+            desc = _descricao_atributos(atributos.iloc[i])
+
+        bloco.append(
+            f"<Placemark><name>{escape(nome_feicao)}</name>"
+            + ("<styleUrl>#yellowBorder</styleUrl>" if estilo else "")
+            + f"<description><![CDATA[{desc}]]></description>"
+            + _geometria_kml(geom)
+            + "</Placemark>\n"
+        )
+        if len(bloco) >= TAMANHO_BLOCO:
+            yield "".join(bloco)
+            bloco = []
+
+    if bloco:
+        yield "".join(bloco)
+    yield KML_RODAPE
+
+def escrever_kml(gdf, destino, **kwargs):
+    """Escreve o KML em qualquer objeto binário com .write (arquivo, BytesIO, zip)."""
+    for pedaco in iter_kml(gdf, **kwargs):
+        destino.write(pedaco.encode('utf-8'))
+
+def gerar_kml_bytes(gdf, **kwargs):
+    """Gera bytes de um arquivo KML."""
+    try:
+        buffer = io.BytesIO()
+        escrever_kml(gdf, buffer, **kwargs)
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"Erro KML: {e}")
+        return None
+
+def gerar_kmz_bytes(gdf, **kwargs):
+    """Gera bytes de um KMZ (doc.kml comprimido), escrito direto no ZIP."""
+    try:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            with zf.open("doc.kml", "w") as destino:
+                escrever_kml(gdf, destino, **kwargs)
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"Erro KMZ: {e}")
+        return None
+
+# ==========================================
+# 3. GEOJSON (STREAMING)
+# ==========================================
+
+def iter_geojson(gdf):
+    """Gera o GeoJSON em blocos; geometrias e atributos são serializados em lote."""
+    gdf = _para_wgs84(gdf)
+    atributos = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+
+    yield '{"type": "FeatureCollection", "features": [\n'
+    primeiro = True
+    for inicio in range(0, len(gdf), TAMANHO_BLOCO):
+        fim = inicio + TAMANHO_BLOCO
+        geoms = shapely.to_geojson(np.asarray(gdf.geometry.values[inicio:fim]))
+        if atributos.shape[1]:
+            props = atributos.iloc[inicio:fim].to_json(
+                orient='records', lines=True, date_format='iso', default_handler=str
+            ).splitlines()
+        else:
+            props = ["{}"] * len(geoms)
+
+        feicoes = [
+            f'{{"type": "Feature", "properties": {p}, "geometry": {g if g is not None else "null"}}}'
+            for p, g in zip(props, geoms)
+        ]
+        yield ("" if primeiro else ",\n") + ",\n".join(feicoes)
+        primeiro = False
+    yield '\n]}\n'
+
+def gerar_geojson_bytes(gdf):
+    """Gera bytes de um arquivo GeoJSON."""
+    try:
+        buffer = io.BytesIO()
+        for pedaco in iter_geojson(gdf):
+            buffer.write(pedaco.encode('utf-8'))
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"Erro GeoJSON: {e}")
+        return None
+
+# ==========================================
+# 4. FORMATOS OGR (GDAL /vsimem)
+# ==========================================
+
+def _gravar_vsimem(gdf, driver, nome_arquivo, camada):
+    """Grava o GeoDataFrame num arquivo virtual do GDAL e devolve os bytes."""
+    if MemoryFile is None: return None
+    schema = infer_schema(gdf)
+    crs_wkt = gdf.crs.to_wkt() if gdf.crs else None
+    with MemoryFile(filename=nome_arquivo) as mem:
+        with mem.open(driver=driver, schema=schema, crs_wkt=crs_wkt, layer=camada) as colxn:
+            for inicio in range(0, len(gdf), TAMANHO_BLOCO):
+                colxn.writerecords(gdf.iloc[inicio:inicio + TAMANHO_BLOCO].iterfeatures())
+        return bytes(mem.getbuffer())
+
+def gerar_shapefile_zip(gdf, nome_base="imovel"):
+    """
+    Gera um ZIP contendo o Shapefile.
+    O GDAL grava .shp/.shx/.dbf/.prj/.cpg direto dentro do '.shp.zip'.
+    """
+    try:
+        return _gravar_vsimem(gdf, "ESRI Shapefile", f"{nome_base}.shp.zip", nome_base)
+    except Exception as e:
+        print(f"Erro SHP: {e}")
+        return None
+
+def gerar_geopackage_bytes(gdf, nome_base="imovel"):
+    """Gera bytes de um arquivo GPKG."""
+    try:
+        return _gravar_vsimem(gdf, "GPKG", f"{nome_base}.gpkg", nome_base)
+    except Exception as e:
+        print(f"Erro GPKG: {e}")
+        return None
+
+def gerar_flatgeobuf_bytes(gdf, nome_base="imovel"):
+    """Gera bytes de um arquivo FlatGeobuf (com índice espacial embutido)."""
+    try:
+        return _gravar_vsimem(gdf, "FlatGeobuf", f"{nome_base}.fgb", nome_base)
+    except Exception as e:
+        print(f"Erro FlatGeobuf: {e}")
+        return None
+
+FORMATOS = {
+    "KML": (gerar_kml_bytes, ".kml", "application/vnd.google-earth.kml+xml"),
+    "KMZ": (gerar_kmz_bytes, ".kmz", "application/vnd.google-earth.kmz"),
+    "SHP": (gerar_shapefile_zip, ".zip", "application/zip"),
+    "GPKG": (gerar_geopackage_bytes, ".gpkg", "application/geopackage+sqlite3"),
+    "GeoJSON": (gerar_geojson_bytes, ".geojson", "application/geo+json"),
+    "FlatGeobuf": (gerar_flatgeobuf_bytes, ".fgb", "application/octet-stream"),
+}
+
+# ==========================================
+# 5. BENCHMARK
+# ==========================================
+
+def _gdf_sintetico(n):
+    """Cria n polígonos com furo (~120 vértices cada) para medir desempenho."""
+    rng = np.random.default_rng(42)
+    cx = rng.uniform(-60, -40, n)
+    cy = rng.uniform(-25, -5, n)
+    externos = shapely.buffer(shapely.points(cx, cy), 0.01, quad_segs=30)
+    furos = shapely.buffer(shapely.points(cx, cy), 0.003, quad_segs=8)
+    geoms = shapely.difference(externos, furos)
+    return gpd.GeoDataFrame(
+        {"codigo": [f"P{i:06d}" for i in range(n)], "area_ha": rng.uniform(1, 5000, n)},
+        geometry=geoms, crs="EPSG:4326"
+    )
+
+def benchmark_exportacao(tamanhos=(1, 100, 1_000, 10_000, 100_000), formatos=None):
+    """Mede tempo (s) e pico de memória (MB) de cada formato para cada tamanho."""
+    formatos = formatos or list(FORMATOS)
+    resultados = []
+    for n in tamanhos:
+        gdf = _gdf_sintetico(n)
+        for formato in formatos:
+            funcao = FORMATOS[formato][0]
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            dados = funcao(gdf)
+            tempo = time.perf_counter() - inicio
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            resultados.append({
+                "feicoes": n, "formato": formato, "tempo_s": round(tempo, 4),
+                "pico_mb": round(pico / 1e6, 2), "tamanho_mb": round(len(dados or b"") / 1e6, 2)
+            })
+    return pd.DataFrame(resultados)
+
+if __name__ == "__main__":
+    print(benchmark_exportacao().to_string(index=False))
@@ -0,0 +1,142 @@
+import os
+import math
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import ee
+import numpy as np
+
+# Rasterio é opcional: sem ele a aba continua usando o link do getDownloadURL
+try:
+    import rasterio
+    from rasterio.shutil import copy as rio_copy
+    from rasterio.transform import from_origin
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+# Metros por grau no Equador (mesma conversão que o GEE usa em EPSG:4326)
+METROS_POR_GRAU = 111319.49079327357
+
+# Tiles de 1024 px ficam bem abaixo do limite de 48 MB do computePixels
+TAMANHO_TILE = 1024
+MAX_WORKERS_TILES = 6
+
+NODATA_FLOAT = -9999.0
+
+# ==========================================
+# 1. GRADE E DOWNLOAD DOS TILES
+# ==========================================
+
+def montar_grade(bbox, escala_m, tamanho_tile=TAMANHO_TILE):
+    """
+    Divide o retângulo (oeste, sul, leste, norte) em janelas de pixels.
+    Retorna (largura, altura, tamanho_pixel_graus, lista de janelas (col, lin, w, h)).
+    """
+    oeste, sul, leste, norte = bbox
+    px = escala_m / METROS_POR_GRAU
+    largura = max(1, math.ceil((leste - oeste) / px))
+    altura = max(1, math.ceil((norte - sul) / px))
+
+    janelas = []
+    for lin in range(0, altura, tamanho_tile):
+        for col in range(0, largura, tamanho_tile):
+            janelas.append((col, lin, min(tamanho_tile, largura - col), min(tamanho_tile, altura - lin)))
+    return largura, altura, px, janelas
+
+def baixar_tile(imagem, bandas, origem, px, janela):
+    """Busca um tile como array NumPy (bandas, h, w) via computePixels."""
+    oeste, norte = origem
+    col, lin, w, h = janela
+    arr = ee.data.computePixels({
+        'expression': imagem,
+        'fileFormat': 'NUMPY_NDARRAY',
+        'bandIds': bandas,
+        'grid': {
+            'dimensions': {'width': w, 'height': h},
+            'affineTransform': {
+                'scaleX': px, 'shearX': 0, 'translateX': oeste + col * px,
+                'shearY': 0, 'scaleY': -px, 'translateY': norte - lin * px
+            },
+            'crsCode': 'EPSG:4326'
+        }
+    })
+    return np.stack([arr[b] for b in bandas])
+
+def iterar_tiles(imagem, bandas, origem, px, janelas, max_workers=MAX_WORKERS_TILES):
+    """
+    Baixa as janelas em paralelo e entrega (janela, array) conforme chegam.
+    Janela deslizante: no máximo 2x max_workers tiles ficam na memória ao mesmo tempo.
+    """
+    fila = iter(janelas)
+    pendentes = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for janela in fila:
+            pendentes[pool.submit(baixar_tile, imagem, bandas, origem, px, janela)] = janela
+            if len(pendentes) >= max_workers * 2: break
+
+        while pendentes:
+            feitos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                janela = pendentes.pop(futuro)
+                yield janela, futuro.result()
+
+                proxima = next(fila, None)
+                if proxima is not None:
+                    pendentes[pool.submit(baixar_tile, imagem, bandas, origem, px, proxima)] = proxima
+
+# ==========================================
+# 2. MOSAICO EM COG
+# ==========================================
+
+def exportar_cog(imagem, bandas, bbox, escala_m=10, dtype='uint16', progresso=None,
+                 max_workers=MAX_WORKERS_TILES):
+    """
+    Exporta a imagem GEE como Cloud-Optimized GeoTIFF montado localmente.
+    - Os tiles são baixados em paralelo (no máximo 2x max_workers em memória).
+    - Cada tile é gravado na janela correspondente assim que chega.
+    - progresso: função opcional progresso(fracao, texto).
+    Retorna (bytes, erro).
+    """
+    if rasterio is None: return None, "Biblioteca rasterio não instalada."
+
+    nodata = 0 if np.dtype(dtype).kind in 'ui' else NODATA_FLOAT
+    imagem = ee.Image(imagem).select(bandas).unmask(nodata)
+    imagem = imagem.toUint16() if dtype == 'uint16' else imagem.toFloat()
+
+    largura, altura, px, janelas = montar_grade(bbox, escala_m)
+    origem = (bbox[0], bbox[3])
+    total = len(janelas)
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            caminho_bruto = os.path.join(temp_dir, "mosaico.tif")
+            caminho_cog = os.path.join(temp_dir, "mosaico_cog.tif")
+
+            perfil = {
+                'driver': 'GTiff', 'width': largura, 'height': altura, 'count': len(bandas),
+                'dtype': dtype, 'crs': 'EPSG:4326', 'nodata': nodata,
+                'transform': from_origin(origem[0], origem[1], px, px),
+                'tiled': True, 'blockxsize': 512, 'blockysize': 512, 'compress': 'deflate', 'BIGTIFF': 'IF_SAFER'
+            }
+
+            with rasterio.open(caminho_bruto, 'w', **perfil) as dst:
+                dst.descriptions = tuple(bandas)
+                # Cada tile é gravado na janela correspondente assim que chega
+                for concluidos, ((col, lin, w, h), arr) in enumerate(
+                        iterar_tiles(imagem, bandas, origem, px, janelas, max_workers), start=1):
+                    dst.write(arr.astype(dtype), window=Window(col, lin, w, h))
+                    if progresso: progresso(concluidos / total, f"Tiles {concluidos}/{total}")
+
+            if progresso: progresso(1.0, "Gerando COG com overviews...")
+            rio_copy(caminho_bruto, caminho_cog, driver='COG', compress='DEFLATE',
+                     overview_resampling='average', BIGTIFF='IF_SAFER')
+
+            with open(caminho_cog, 'rb') as f:
+                return f.read(), None
+    except Exception as e:
+        return None, str(e)
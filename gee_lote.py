@@ -0,0 +1,69 @@
+import ee
+from concurrent.futures import ThreadPoolExecutor
+from pyproj import Geod
+from shapely.geometry import shape
+
+# ==========================================
+# CAMADA DE REQUISIÇÕES GEE (LOTE + PARALELO)
+# ==========================================
+# Regra de uso nas abas:
+#  - Valores que são necessários juntos -> avaliar_lote (1 round-trip).
+#  - Chamadas independentes (getDownloadURL, getMapId, lotes distintos)
+#    -> avaliar_paralelo (latência da mais lenta, não a soma).
+
+MAX_WORKERS_GEE = 8
+
+# Medidas de geometrias do cliente (KML/CAR) sem ida ao servidor
+GEOD_WGS84 = Geod(ellps="WGS84")
+
+def avaliar_lote(computacoes):
+    """
+    Avalia vários objetos GEE num único round-trip.
+    computacoes: dict {nome: ee.ComputedObject ou valor Python}.
+    """
+    if not computacoes: return {}
+    return ee.Dictionary(computacoes).getInfo()
+
+def _executar(tarefa):
+    # Objetos GEE são avaliados direto pela API (mesma chamada do getInfo)
+    if isinstance(tarefa, ee.ComputedObject):
+        return ee.data.computeValue(tarefa)
+    return tarefa()
+
+def avaliar_paralelo(tarefas, max_workers=MAX_WORKERS_GEE):
+    """
+    Executa tarefas GEE independentes ao mesmo tempo num pool de threads.
+    tarefas: dict {nome: ee.ComputedObject ou função sem argumentos}.
+    Retorna (resultados, erros): uma falha não cancela as demais tarefas.
+    """
+    resultados, erros = {}, {}
+    if not tarefas: return resultados, erros
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tarefas))) as pool:
+        futuros = {nome: pool.submit(_executar, t) for nome, t in tarefas.items()}
+        for nome, futuro in futuros.items():
+            try:
+                resultados[nome] = futuro.result()
+            except Exception as e:
+                erros[nome] = e
+    return resultados, erros
+
+def geojson_geometria(geometry):
+    """
+    Retorna o GeoJSON da geometria sem round-trip quando ela foi criada no cliente
+    (KML/CAR). Só consulta o servidor se a geometria for resultado de um cálculo.
+    """
+    try:
+        return geometry.toGeoJSON()
+    except Exception:
+        return geometry.getInfo()
+
+def area_m2(geojson):
+    """Área geodésica (m², elipsoide WGS84) do GeoJSON, calculada localmente."""
+    area, _ = GEOD_WGS84.geometry_area_perimeter(shape(geojson))
+    return abs(area)
+
+def centroide(geojson):
+    """[lon, lat] do centroide do GeoJSON, calculado localmente."""
+    c = shape(geojson).centroid
+    return [c.x, c.y]
@@ -1,9 +1,9 @@
 import streamlit as st
 import utils
+import gee_lote
 import geemap.foliumap as geemap
 import ee
 import streamlit.components.v1 as components
-import io
 import geopandas as gpd
 import json
 from shapely.geometry import shape
@@ -16,7 +16,9 @@ def resetar_analises_anteriores():
     """
     chaves_para_limpar = [
         'camadas_fixas', 'camada_preview', 'ndvi_stats', 'ndvi_colorbar',
-        'clim_temp', 'clim_rain', 'last_clim_source', 'ctx_dados', 'gdf_imovel'
+        'clim_temp', 'clim_rain', 'clim_chuva_anual', 'last_clim_source', 'ctx_dados', 'gdf_imovel',
+        'ndvi_serie', 'ndvi_serie_longa', 'ndvi_talhoes', 'mudanca',
+        'catalogo_cenas', 'data_cena', 'quadros_timelapse', 'timelapse'
     ]
     
     for chave in chaves_para_limpar:
@@ -68,12 +70,14 @@ def render_tab():
                     if metodo == "KML":
                         if file_kml:
                             with st.spinner("Lendo KML..."):
-                                geom, erro = utils.processar_kml_conteudo(file_kml.read())
+                                conteudo_kml = file_kml.read()
+                                geom, erro = utils.processar_kml_conteudo(conteudo_kml)
                                 if not erro and geom:
                                     st.session_state['preview_geometry'] = geom
-                                    area_m2 = geom.area(1).getInfo()
+                                    area_m2 = gee_lote.area_m2(gee_lote.geojson_geometria(geom))
                                     st.session_state['preview_data'] = {
-                                        "tipo": "KML", "nome": file_kml.name, "area_ha": area_m2 / 10000
+                                        "tipo": "KML", "nome": file_kml.name, "area_ha": area_m2 / 10000,
+                                        "talhoes": utils.extrair_talhoes_kml(conteudo_kml)
                                     }
                                     st.rerun()
                                 else: st.error(f"Erro ao ler KML: {erro}")
@@ -116,23 +120,27 @@ def render_tab():
             st.markdown("##### 3. Visualização")
             
             if st.session_state.get('preview_geometry'):
-                m = geemap.Map(
-                    center=[-14, -50], zoom=4, height=270, 
-                    draw_control=False, scale_control=False, 
-                    fullscreen_control=False, attribution_control=False, toolbar_control=False,
-                    lite_mode=True
-                )
-                m.add_basemap("HYBRID")
-                m.centerObject(st.session_state['preview_geometry'], 13)
-                
+                geom_preview = st.session_state['preview_geometry']
+                fingerprint = utils.fingerprint_geometria(geom_preview)
+
+                # A URL dos tiles entra na chave: quando expira, o mapa é refeito
                 empty = ee.Image().byte()
-                outline = empty.paint(ee.FeatureCollection(st.session_state['preview_geometry']), 2, 3)
-                m.add_layer(outline, {'palette': 'FF0000'}, "Preview")
-                
-                with io.BytesIO() as buffer:
-                    m.save(buffer, close_file=False)
-                    map_html = buffer.getvalue().decode('utf-8')
-                st.components.v1.html(map_html, height=270)
+                outline = empty.paint(ee.FeatureCollection(geom_preview), 2, 3)
+                url_contorno = utils.url_camada_gee(outline, {'palette': 'FF0000'}, f"{fingerprint}|preview")
+
+                def construir_mapa():
+                    m = geemap.Map(
+                        center=[-14, -50], zoom=4, height=270, 
+                        draw_control=False, scale_control=False, 
+                        fullscreen_control=False, attribution_control=False, toolbar_control=False,
+                        lite_mode=True
+                    )
+                    m.add_basemap("HYBRID")
+                    m.centerObject(geom_preview, 13)
+                    m.add_tile_layer(url=url_contorno, name="Preview", attribution="Google Earth Engine")
+                    return m
+
+                utils.exibir_mapa(f"home|{fingerprint}|{url_contorno}", construir_mapa, height=270)
             else:
                 st.info("Aguardando localização do imóvel...")
 
@@ -189,6 +197,7 @@ def render_tab():
                         # 2. DEFINIR NOVO IMÓVEL OFICIAL
                         geom_gee = st.session_state['preview_geometry']
                         st.session_state['current_geometry'] = geom_gee
+                        st.session_state['talhoes'] = data.get('talhoes') or []
                         
                         # 3. NOME OFICIAL
                         if data.get("tipo") == "CAR":
@@ -202,7 +211,7 @@ def render_tab():
 
                         # 4. CONVERTER PARA GEOPANDAS
                         try:
-                            geojson = geom_gee.getInfo()
+                            geojson = gee_lote.geojson_geometria(geom_gee)
                             shapely_geom = shape(geojson)
                             gdf_conv = gpd.GeoDataFrame(
                                 {'geometry': [shapely_geom]},
@@ -0,0 +1,187 @@
+import os
+import json
+import math
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import shape
+
+import camadas_locais
+import normais_locais
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+# Duas fontes possíveis, carregadas uma vez por processo:
+#  - vetor: dados/koppen_brasil.geojson -> camada indexada 'koppen' (python camadas_locais.py koppen)
+#  - raster: dados/koppen.tif (Beck et al., classes 1-30) -> dados/koppen.npy lido via mmap
+#    (python koppen.py)
+ARQUIVO_RASTER = os.path.join("dados", "koppen.tif")
+ARQUIVO_NPY = os.path.join("dados", "koppen.npy")
+ARQUIVO_META = os.path.join("dados", "koppen.json")
+
+# Legenda do raster de Beck et al. (2018): valor -> (sigla, descrição)
+LEGENDA = {
+    1: ("Af", "Tropical Úmido (sem estação seca)"),
+    2: ("Am", "Tropical de Monção"),
+    3: ("Aw", "Tropical de Savana"),
+    4: ("BWh", "Árido Quente (Deserto)"),
+    5: ("BWk", "Árido Frio (Deserto)"),
+    6: ("BSh", "Semiárido Quente"),
+    7: ("BSk", "Semiárido Frio"),
+    8: ("Csa", "Subtropical (Verão Seco e Quente)"),
+    9: ("Csb", "Temperado (Verão Seco e Ameno)"),
+    10: ("Csc", "Temperado (Verão Seco e Frio)"),
+    11: ("Cwa", "Subtropical Úmido (Inverno Seco)"),
+    12: ("Cwb", "Subtropical de Altitude (Inverno Seco)"),
+    13: ("Cwc", "Temperado de Altitude (Inverno Seco e Verão Frio)"),
+    14: ("Cfa", "Subtropical Úmido"),
+    15: ("Cfb", "Temperado Oceânico (Verão Ameno)"),
+    16: ("Cfc", "Temperado Oceânico (Verão Frio)"),
+    17: ("Dsa", "Continental (Verão Seco e Quente)"),
+    18: ("Dsb", "Continental (Verão Seco e Ameno)"),
+    19: ("Dsc", "Continental Subártico (Verão Seco)"),
+    20: ("Dsd", "Continental Subártico (Verão Seco, Inverno Rigoroso)"),
+    21: ("Dwa", "Continental (Inverno Seco, Verão Quente)"),
+    22: ("Dwb", "Continental (Inverno Seco, Verão Ameno)"),
+    23: ("Dwc", "Continental Subártico (Inverno Seco)"),
+    24: ("Dwd", "Continental Subártico (Inverno Seco e Rigoroso)"),
+    25: ("Dfa", "Continental Úmido (Verão Quente)"),
+    26: ("Dfb", "Continental Úmido (Verão Ameno)"),
+    27: ("Dfc", "Continental Subártico"),
+    28: ("Dfd", "Continental Subártico (Inverno Rigoroso)"),
+    29: ("ET", "Tundra"),
+    30: ("EF", "Glacial"),
+}
+
+# ==========================================
+# 1. PREPARO DO RASTER (UMA VEZ)
+# ==========================================
+
+def preparar_raster(origem=ARQUIVO_RASTER, bbox=normais_locais.BBOX_BRASIL):
+    """Recorta o GeoTIFF ao Brasil e grava como .npy (uint8) + metadados da grade."""
+    import rasterio
+    from rasterio.windows import from_bounds
+
+    with rasterio.open(origem) as src:
+        janela = from_bounds(*bbox, transform=src.transform).round_offsets().round_lengths()
+        dados = src.read(1, window=janela, boundless=True, fill_value=0).astype(np.uint8)
+        t = src.window_transform(janela)
+
+    np.save(ARQUIVO_NPY, dados)
+    meta = {'origem': [t.c, t.f], 'px': t.a, 'forma': list(dados.shape)}
+    with open(ARQUIVO_META, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    _raster.cache_clear()
+    return meta
+
+@lru_cache(maxsize=1)
+def _raster():
+    with open(ARQUIVO_META, encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta, np.load(ARQUIVO_NPY, mmap_mode='r')
+
+def _fonte():
+    if camadas_locais.disponivel('koppen'): return 'vetor'
+    if os.path.exists(ARQUIVO_META) and os.path.exists(ARQUIVO_NPY): return 'raster'
+    return None
+
+def disponivel():
+    return _fonte() is not None
+
+def _classe(valor):
+    sigla, desc = LEGENDA.get(int(valor), (None, None))
+    return {"Classificacao": sigla, "Descricao": desc} if sigla else None
+
+# ==========================================
+# 2. CONSULTAS (PONTO, LOTE E POLÍGONO)
+# ==========================================
+
+def classes_pontos(lats, lons):
+    """
+    Sigla Köppen de muitos pontos de uma vez (None onde não há classe).
+    Lista na mesma ordem da entrada.
+    """
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    fonte = _fonte()
+    if fonte == 'vetor':
+        atributos, _, _ = camadas_locais.carregar('koppen')
+        idx = camadas_locais.indices_pontos('koppen', lons, lats)
+        siglas = atributos['Classificacao'].to_numpy(dtype=object)
+        return [siglas[i] if i >= 0 else None for i in idx]
+    if fonte == 'raster':
+        meta, arr = _raster()
+        (oeste, norte), px = meta['origem'], meta['px']
+        lin = np.floor((norte - lats) / px).astype(int)
+        col = np.floor((lons - oeste) / px).astype(int)
+        dentro = (lin >= 0) & (lin < arr.shape[0]) & (col >= 0) & (col < arr.shape[1])
+        valores = np.zeros(len(lats), dtype=np.uint8)
+        valores[dentro] = arr[lin[dentro], col[dentro]]
+        return [LEGENDA.get(int(v), (None,))[0] for v in valores]
+    return [None] * len(lats)
+
+def classe_ponto(lat, lon):
+    """{"Classificacao", "Descricao"} do ponto, ou None sem base local / fora dela."""
+    fonte = _fonte()
+    if fonte == 'vetor':
+        p = camadas_locais.consultar_ponto('koppen', lat, lon)
+        return {"Classificacao": p['Classificacao'], "Descricao": p['Descricao']} if p else None
+    if fonte == 'raster':
+        meta, arr = _raster()
+        (oeste, norte), px = meta['origem'], meta['px']
+        lin, col = math.floor((norte - lat) / px), math.floor((lon - oeste) / px)
+        if 0 <= lin < arr.shape[0] and 0 <= col < arr.shape[1]:
+            return _classe(arr[lin, col])
+    return None
+
+def participacoes(geojson):
+    """
+    Percentual da área do polígono em cada classe Köppen.
+    DataFrame (Classificacao, Descricao, percentual), vazio sem base local.
+    """
+    colunas = ['Classificacao', 'Descricao', 'percentual']
+    geom = shape(geojson)
+    fonte = _fonte()
+
+    if fonte == 'vetor':
+        df = camadas_locais.participacoes('koppen', geom, 'Classificacao')
+        if df.empty: return pd.DataFrame(columns=colunas)
+        atributos, _, _ = camadas_locais.carregar('koppen')
+        descricoes = atributos.drop_duplicates('Classificacao').set_index('Classificacao')['Descricao']
+        df = df.rename(columns={'classe': 'Classificacao'})
+        df['Descricao'] = df['Classificacao'].map(descricoes)
+        # Normaliza pela área classificada (borda do país/mar fica de fora)
+        df['percentual'] = df['area_ha'] / df['area_ha'].sum() * 100
+        return df[colunas]
+
+    if fonte == 'raster':
+        meta, arr = _raster()
+        recorte = normais_locais.pesos_area(geom, meta['origem'], meta['px'], arr.shape)
+        if recorte is None: return pd.DataFrame(columns=colunas)
+        pesos, linhas, cols = recorte
+        soma = np.bincount(np.asarray(arr[linhas, cols]).ravel(), weights=pesos.ravel(), minlength=len(LEGENDA) + 1)
+        soma[0] = 0  # sem dado
+        if soma.sum() <= 0: return pd.DataFrame(columns=colunas)
+        linhas_df = [(*LEGENDA[v], soma[v] / soma.sum() * 100) for v in np.flatnonzero(soma) if v in LEGENDA]
+        return pd.DataFrame(linhas_df, columns=colunas).sort_values('percentual', ascending=False).reset_index(drop=True)
+
+    return pd.DataFrame(columns=colunas)
+
+def classificar(lat, lon):
+    """
+    Classe Köppen do ponto pela base local; sem ela, estimativa pela latitude
+    (marcada com "aproximado").
+    """
+    classe = classe_ponto(lat, lon)
+    if classe: return classe
+
+    if lat > -10: code, desc = "Am", "Tropical de Monção"
+    elif lat > -20: code, desc = "Aw", "Tropical de Savana"
+    elif lat > -25: code, desc = "Cwa", "Subtropical Úmido (Inverno Seco)"
+    else: code, desc = "Cfa", "Subtropical Úmido"
+    return {"Classificacao": code, "Descricao": desc, "aproximado": True}
+
+if __name__ == "__main__":
+    print(json.dumps(preparar_raster(), indent=2))
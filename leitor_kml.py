@@ -0,0 +1,241 @@
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+from lxml import etree
+
+# ==========================================
+# LEITOR KML/KMZ ÚNICO (STREAMING)
+# ==========================================
+# Usado por todos os uploads (Início, Aptidão, GeoPandas).
+#  - KMZ/ZIP é lido direto do buffer do upload (sem arquivo temporário).
+#  - lxml.iterparse percorre só os Placemarks e libera cada um após a leitura.
+#  - Coordenadas viram arrays NumPy; as geometrias são montadas de uma vez
+#    pelos construtores vetorizados do shapely.
+# Suporta Point, LineString, LinearRing, Polygon (com furos), MultiGeometry
+# aninhado, name, description e ExtendedData (Data e SimpleData).
+
+TAGS_GEOMETRIA = ('{*}Point', '{*}LineString', '{*}LinearRing', '{*}Polygon')
+
+def _abrir(conteudo):
+    """Stream do KML: o próprio buffer ou o .kml de dentro do KMZ/ZIP."""
+    if conteudo[:2] == b'PK':
+        pacote = zipfile.ZipFile(io.BytesIO(conteudo))
+        kmls = [n for n in pacote.namelist() if n.lower().endswith('.kml')]
+        if not kmls:
+            raise ValueError("Nenhum arquivo .kml encontrado dentro do pacote.")
+        return pacote.open('doc.kml' if 'doc.kml' in kmls else kmls[0])
+    return io.BytesIO(conteudo)
+
+def _coordenadas(texto):
+    """Texto 'lon,lat[,alt] lon,lat[,alt] ...' -> array (n, 2)."""
+    tuplas = texto.split()
+    if not tuplas: return np.empty((0, 2))
+    dims = tuplas[0].count(',') + 1
+    try:
+        return np.array(','.join(tuplas).split(','), dtype=float).reshape(-1, dims)[:, :2]
+    except ValueError:
+        # Dimensões misturadas no mesmo elemento: lê tupla a tupla
+        return np.array([t.split(',')[:2] for t in tuplas if t.count(',') >= 1], dtype=float).reshape(-1, 2)
+
+def _texto_coordenadas(elem):
+    c = elem.find('.//{*}coordinates')
+    return c.text if c is not None and c.text else ""
+
+def _atributos(placemark):
+    props = {}
+    for campo in ('name', 'description'):
+        e = placemark.find(f'{{*}}{campo}')
+        if e is not None and e.text: props[campo] = e.text.strip()
+    for dado in placemark.iterfind('.//{*}ExtendedData//{*}Data'):
+        valor = dado.find('{*}value')
+        props[dado.get('name')] = valor.text if valor is not None else None
+    for dado in placemark.iterfind('.//{*}ExtendedData//{*}SimpleData'):
+        props[dado.get('name')] = dado.text
+    return props
+
+def _agrupar(partes, ids, construtor_multi):
+    """
+    Junta as partes com o mesmo id numa geometria multi (vetorizado).
+    Retorna (ids únicos, geometrias); id com uma parte só fica como geometria simples.
+    """
+    unicos, inverso, contagem = np.unique(ids, return_inverse=True, return_counts=True)
+    multi = construtor_multi(partes, indices=inverso)
+    simples = contagem == 1
+    multi[simples] = shapely.get_geometry(multi[simples], 0)
+    return unicos, multi
+
+class _Partes:
+    """Acumula coordenadas e índices de cada tipo de geometria para montagem vetorizada."""
+
+    def __init__(self):
+        self.pontos, self.id_ponto = [], []
+        self.linhas, self.id_linha = [], []
+        self.aneis, self.id_anel_poligono = [], []
+        self.id_poligono = []  # placemark de cada polígono
+
+    def ler(self, i, placemark):
+        for geom in placemark.iter(*TAGS_GEOMETRIA):
+            tag = etree.QName(geom).localname
+            if tag == 'Point':
+                xy = _coordenadas(_texto_coordenadas(geom))
+                if len(xy):
+                    self.pontos.append(xy[:1])
+                    self.id_ponto.append(i)
+            elif tag == 'LineString':
+                xy = _coordenadas(_texto_coordenadas(geom))
+                if len(xy) >= 2:
+                    self.linhas.append(xy)
+                    self.id_linha.append(i)
+            elif tag == 'LinearRing' and not etree.QName(geom.getparent()).localname.endswith('BoundaryIs'):
+                self._poligono(i, [_texto_coordenadas(geom)])
+            elif tag == 'Polygon':
+                externo = geom.find('{*}outerBoundaryIs')
+                if externo is None: continue
+                # Alguns exportadores põem vários LinearRing no mesmo innerBoundaryIs
+                furos = [_texto_coordenadas(anel) for anel in geom.iterfind('{*}innerBoundaryIs/{*}LinearRing')]
+                self._poligono(i, [_texto_coordenadas(externo), *furos])
+
+    def _poligono(self, i, textos):
+        aneis = [_coordenadas(t) for t in textos]
+        if len(aneis[0]) < 3: return
+        id_poligono = len(self.id_poligono)
+        self.id_poligono.append(i)
+        for anel in aneis:
+            if len(anel) >= 3:  # primeiro anel = externo, demais = furos
+                self.aneis.append(anel)
+                self.id_anel_poligono.append(id_poligono)
+
+    def montar(self, n):
+        """Uma geometria por placemark (None se não houver), tudo vetorizado por tipo."""
+        por_tipo = []
+
+        if self.aneis:
+            tamanhos = [len(a) for a in self.aneis]
+            aneis = shapely.linearrings(np.concatenate(self.aneis), indices=np.repeat(np.arange(len(self.aneis)), tamanhos))
+            poligonos = shapely.polygons(aneis, indices=np.asarray(self.id_anel_poligono))
+            por_tipo.append((poligonos, np.asarray(self.id_poligono), shapely.multipolygons))
+        if self.linhas:
+            tamanhos = [len(l) for l in self.linhas]
+            linhas = shapely.linestrings(np.concatenate(self.linhas), indices=np.repeat(np.arange(len(self.linhas)), tamanhos))
+            por_tipo.append((linhas, np.asarray(self.id_linha), shapely.multilinestrings))
+        if self.pontos:
+            pontos = shapely.points(np.concatenate(self.pontos))
+            por_tipo.append((pontos, np.asarray(self.id_ponto), shapely.multipoints))
+
+        resultado = np.full(n, None, dtype=object)
+        for partes, ids, construtor_multi in por_tipo:
+            unicos, multi = _agrupar(partes, ids, construtor_multi)
+            vazios = np.array([g is None for g in resultado[unicos]], dtype=bool)
+            resultado[unicos[vazios]] = multi[vazios]
+            # Placemark com tipos diferentes (raro): coleção de geometrias
+            for j in np.flatnonzero(~vazios):
+                resultado[unicos[j]] = shapely.geometrycollections([resultado[unicos[j]], multi[j]])
+        return resultado
+
+def ler_kml(conteudo):
+    """
+    Lê KML ou KMZ (bytes) e retorna um GeoDataFrame (EPSG:4326) com um registro
+    por Placemark que tenha geometria: colunas name, description, ExtendedData e geometry.
+    """
+    partes = _Partes()
+    registros = []
+    with _abrir(conteudo) as stream:
+        for _, placemark in etree.iterparse(stream, events=('end',), tag='{*}Placemark',
+                                            recover=True, huge_tree=True):
+            partes.ler(len(registros), placemark)
+            registros.append(_atributos(placemark))
+            # Libera o placemark (e os irmãos já lidos) para manter a memória constante
+            placemark.clear()
+            while placemark.getprevious() is not None:
+                del placemark.getparent()[0]
+
+    geometrias = partes.montar(len(registros))
+    atributos = pd.DataFrame(registros)
+    for coluna in ('name', 'description'):
+        if coluna not in atributos: atributos[coluna] = None
+    gdf = gpd.GeoDataFrame(atributos, geometry=list(geometrias), crs="EPSG:4326")
+    return gdf[gdf.geometry.notna()].reset_index(drop=True)
+
+def poligonos(gdf):
+    """
+    Somente as feições poligonais (Polygon/MultiPolygon) do KML.
+    De coleções (MultiGeometry com polígono e ponto/linha) ficam só os polígonos.
+    """
+    geoms = gdf.geometry.values.to_numpy()
+    colecao = shapely.get_type_id(geoms) == 7  # GeometryCollection
+    if colecao.any():
+        partes, linha = shapely.get_parts(geoms[colecao], return_index=True)
+        poligonal = np.isin(shapely.get_type_id(partes), [3, 6])  # Polygon, MultiPolygon
+        partes, sub = shapely.get_parts(partes[poligonal], return_index=True)
+        novas = np.full(colecao.sum(), None, dtype=object)
+        if len(partes):
+            unicos, multi = _agrupar(partes, linha[poligonal][sub], shapely.multipolygons)
+            novas[unicos] = multi
+        geoms = geoms.copy()
+        geoms[colecao] = novas
+        gdf = gdf.copy()
+        gdf[gdf.geometry.name] = gpd.GeoSeries(geoms, index=gdf.index, crs=gdf.crs)
+    return gdf[gdf.geom_type.isin(['Polygon', 'MultiPolygon'])]
+
+# ==========================================
+# VERIFICAÇÃO (python leitor_kml.py)
+# ==========================================
+
+def _anel(x0, y0, x1, y1):
+    return f"{x0},{y0} {x1},{y0} {x1},{y1} {x0},{y1} {x0},{y0}"
+
+KML_VERIFICACAO = f"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2"><Document>
+<Placemark><name>dois_furos_um_inner</name><Polygon>
+  <outerBoundaryIs><LinearRing><coordinates>{_anel(0, 0, 10, 10)}</coordinates></LinearRing></outerBoundaryIs>
+  <innerBoundaryIs>
+    <LinearRing><coordinates>{_anel(1, 1, 1.5, 2)}</coordinates></LinearRing>
+    <LinearRing><coordinates>{_anel(5, 5, 5.5, 6)}</coordinates></LinearRing>
+  </innerBoundaryIs>
+</Polygon></Placemark>
+<Placemark><name>dois_inner</name><Polygon>
+  <outerBoundaryIs><LinearRing><coordinates>{_anel(0, 0, 10, 10)}</coordinates></LinearRing></outerBoundaryIs>
+  <innerBoundaryIs><LinearRing><coordinates>{_anel(1, 1, 1.5, 2)}</coordinates></LinearRing></innerBoundaryIs>
+  <innerBoundaryIs><LinearRing><coordinates>{_anel(5, 5, 5.5, 6)}</coordinates></LinearRing></innerBoundaryIs>
+</Polygon></Placemark>
+<Placemark><name>misto</name><MultiGeometry>
+  <Point><coordinates>0,0</coordinates></Point>
+  <Polygon><outerBoundaryIs><LinearRing><coordinates>{_anel(0, 0, 1, 1)}</coordinates></LinearRing></outerBoundaryIs></Polygon>
+  <Polygon><outerBoundaryIs><LinearRing><coordinates>{_anel(2, 0, 3, 1)}</coordinates></LinearRing></outerBoundaryIs></Polygon>
+</MultiGeometry></Placemark>
+<Placemark><name>ponto</name><Point><coordinates>0,0,0</coordinates></Point></Placemark>
+</Document></kml>""".encode("utf-8")
+
+def verificar_leitura():
+    """
+    Lê o KML de referência e confere furos, coleções mistas e filtragem.
+    Retorna a lista de divergências (vazia = ok).
+    """
+    gdf = poligonos(ler_kml(KML_VERIFICACAO))
+    geoms = dict(zip(gdf['name'], gdf.geometry))
+    esperado = {  # nome -> (tipo, nº de furos, área em graus²)
+        'dois_furos_um_inner': ('Polygon', 2, 99.0),
+        'dois_inner': ('Polygon', 2, 99.0),
+        'misto': ('MultiPolygon', 0, 2.0),
+    }
+    divergencias = []
+    if set(geoms) != set(esperado):
+        divergencias.append(("feições", sorted(geoms), sorted(esperado)))
+    for nome, (tipo, furos, area) in esperado.items():
+        g = geoms.get(nome)
+        if g is None: continue
+        obtido = (g.geom_type, int(shapely.get_num_interior_rings(g)) if tipo == 'Polygon' else 0, round(g.area, 6))
+        if obtido != (tipo, furos, area):
+            divergencias.append((nome, obtido, (tipo, furos, area)))
+    return divergencias
+
+if __name__ == "__main__":
+    import sys
+    divergencias = verificar_leitura()
+    for d in divergencias: print("Divergência:", d)
+    print("OK" if not divergencias else f"{len(divergencias)} divergência(s)")
+    sys.exit(1 if divergencias else 0)
@@ -0,0 +1,164 @@
+import os
+import json
+import math
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+# Normais climatológicas do Brasil gravadas como arrays NumPy (.npy) lidos via mmap:
+# só as linhas/colunas que cobrem o imóvel são lidas do disco.
+PASTA_NORMAIS = os.path.join("dados", "normais")
+ARQUIVO_META = "normais.json"
+
+# Oeste, sul, leste, norte (com folga sobre o território nacional)
+BBOX_BRASIL = (-74.5, -34.5, -28.5, 5.5)
+
+# Resoluções nativas: WorldClim V1 = 30" (1/120°), CHIRPS = 0.05°
+RESOLUCAO_TEMP = 1 / 120
+RESOLUCAO_CHUVA = 0.05
+
+NODATA_TEMP = -32768
+NODATA_CHUVA = -9999.0
+
+# Acima disso a fração de cobertura exata fica cara; usa o centro do pixel
+MAX_PIXELS_FRACAO = 250_000
+
+BANDAS_TEMP = [f'{v}_{m:02d}' for m in range(1, 13) for v in ('tavg', 'tmin', 'tmax')]
+BANDAS_CHUVA = [f'chuva_{m:02d}' for m in range(1, 13)]
+
+# ==========================================
+# 1. CONSTRUÇÃO (UMA VEZ, VIA GEE)
+# ==========================================
+
+def _baixar_para_mmap(imagem, bandas, bbox, px, dtype, caminho, tamanho_tile, progresso):
+    import exportacao_raster
+
+    # montar_grade recebe a escala em metros; converte de volta para graus
+    largura, altura, px, janelas = exportacao_raster.montar_grade(
+        bbox, px * exportacao_raster.METROS_POR_GRAU, tamanho_tile
+    )
+    destino = np.lib.format.open_memmap(caminho, mode='w+', dtype=dtype, shape=(len(bandas), altura, largura))
+    origem = (bbox[0], bbox[3])
+    for i, ((col, lin, w, h), arr) in enumerate(
+            exportacao_raster.iterar_tiles(imagem, bandas, origem, px, janelas), start=1):
+        destino[:, lin:lin + h, col:col + w] = arr.astype(dtype)
+        progresso(f"{os.path.basename(caminho)}: tile {i}/{len(janelas)}")
+    destino.flush()
+    del destino
+    return {'origem': list(origem), 'px': px, 'forma': [len(bandas), altura, largura]}
+
+def construir_normais(pasta=PASTA_NORMAIS, bbox=BBOX_BRASIL, progresso=print):
+    """
+    Baixa as normais mensais (temperatura e chuva) na resolução nativa para o disco.
+    Temperatura: int16 em décimos de °C (36 bandas). Chuva: float32 em mm/mês (12 bandas).
+    """
+    from climatology import imagem_climatologia
+
+    os.makedirs(pasta, exist_ok=True)
+    img = imagem_climatologia()
+
+    temp = img.select(BANDAS_TEMP).multiply(10).round().unmask(NODATA_TEMP).toInt16()
+    chuva = img.select(BANDAS_CHUVA).unmask(NODATA_CHUVA).toFloat()
+
+    # Tiles de 512 px mantêm 36 bandas int16 abaixo do limite do computePixels
+    camadas = {
+        'temperatura': dict(
+            _baixar_para_mmap(temp, BANDAS_TEMP, bbox, RESOLUCAO_TEMP, 'int16',
+                              os.path.join(pasta, "temperatura.npy"), 512, progresso),
+            arquivo="temperatura.npy", bandas=BANDAS_TEMP, escala=0.1, nodata=NODATA_TEMP
+        ),
+        'chuva': dict(
+            _baixar_para_mmap(chuva, BANDAS_CHUVA, bbox, RESOLUCAO_CHUVA, 'float32',
+                              os.path.join(pasta, "chuva.npy"), 1024, progresso),
+            arquivo="chuva.npy", bandas=BANDAS_CHUVA, escala=1.0, nodata=NODATA_CHUVA
+        ),
+    }
+
+    meta = {'construido_em': datetime.now().isoformat(timespec='seconds'), 'bbox': list(bbox), 'camadas': camadas}
+    with open(os.path.join(pasta, ARQUIVO_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    _carregar.cache_clear()
+    return meta
+
+# ==========================================
+# 2. LEITURA E ESTATÍSTICA ZONAL (LOCAL)
+# ==========================================
+
+@lru_cache(maxsize=1)
+def _carregar(pasta=PASTA_NORMAIS):
+    """Metadados e arrays abertos em modo mmap (nada é lido até ser fatiado)."""
+    with open(os.path.join(pasta, ARQUIVO_META), encoding="utf-8") as f:
+        meta = json.load(f)
+    arrays = {nome: np.load(os.path.join(pasta, c['arquivo']), mmap_mode='r') for nome, c in meta['camadas'].items()}
+    return meta, arrays
+
+def disponivel(pasta=PASTA_NORMAIS):
+    return os.path.exists(os.path.join(pasta, ARQUIVO_META))
+
+def pesos_area(geom, origem, px, forma):
+    """
+    Fração de cada pixel coberta pelo polígono, ponderada pela área do pixel (cos da latitude).
+    Retorna (pesos 2D, fatia de linhas, fatia de colunas) ou None fora da grade.
+    """
+    oeste, norte = origem
+    altura, largura = forma
+    minx, miny, maxx, maxy = geom.bounds
+    col0, col1 = max(0, math.floor((minx - oeste) / px)), min(largura, math.ceil((maxx - oeste) / px))
+    lin0, lin1 = max(0, math.floor((norte - maxy) / px)), min(altura, math.ceil((norte - miny) / px))
+    if col0 >= col1 or lin0 >= lin1:
+        return None
+
+    x0 = oeste + np.arange(col0, col1) * px
+    y0 = norte - np.arange(lin0, lin1) * px
+    xx, yy = np.meshgrid(x0, y0)
+    cos_lat = np.cos(np.radians(yy - px / 2))
+
+    shapely.prepare(geom)
+    if xx.size <= MAX_PIXELS_FRACAO:
+        caixas = shapely.box(xx, yy - px, xx + px, yy)
+        fracao = shapely.area(shapely.intersection(caixas, geom)) / (px * px)
+    else:
+        fracao = shapely.contains_xy(geom, xx + px / 2, yy - px / 2).astype(float)
+    return fracao * cos_lat, slice(lin0, lin1), slice(col0, col1)
+
+def estatisticas_zonais(geojson, pasta=PASTA_NORMAIS):
+    """
+    Média ponderada por área de todas as bandas sobre o polígono (GeoJSON em WGS84).
+    Retorna {banda: valor} com os mesmos nomes da imagem do GEE, ou None se o imóvel
+    estiver fora da área armazenada ou se alguma camada só tiver nodata sob ele
+    (ex.: borda da máscara de terra do CHIRPS) -- nesses casos vale a consulta ao GEE.
+    """
+    meta, arrays = _carregar(pasta)
+    geom = shape(geojson)
+    valores = {}
+    for nome, camada in meta['camadas'].items():
+        arr = arrays[nome]
+        recorte = pesos_area(geom, camada['origem'], camada['px'], arr.shape[1:])
+        if recorte is None:
+            return None
+        pesos, linhas, colunas = recorte
+
+        bloco = np.asarray(arr[:, linhas, colunas])
+        for i, banda in enumerate(camada['bandas']):
+            w = pesos * (bloco[i] != camada['nodata'])
+            total = w.sum()
+            valores[banda] = float((bloco[i] * w).sum() / total * camada['escala']) if total > 0 else None
+        if all(valores[banda] is None for banda in camada['bandas']):
+            return None
+    return valores
+
+if __name__ == "__main__":
+    import ee
+    try:
+        ee.Initialize()
+    except Exception:
+        ee.Initialize(project='ee-julioczcosta')
+    meta = construir_normais()
+    print(json.dumps(meta, indent=2))
@@ -0,0 +1,426 @@
+import sys
+import json
+import math
+import tempfile
+import types
+import threading
+import itertools
+from types import SimpleNamespace
+
+import shapely
+from shapely.geometry import shape, mapping
+
+# ==========================================
+# ORÇAMENTO DE ROUND-TRIPS DO GEE (OFFLINE)
+# ==========================================
+# Substitui o módulo `ee` por um dublê que grava cada ida ao servidor
+# (getInfo, getMapId, computeValue...) e avalia localmente expressões simples
+# de geometria e coleção. Cada aba é renderizada com o AppTest do Streamlit
+# sobre geometrias de teste e o número de round-trips / tamanho do payload
+# é comparado com o orçamento abaixo.
+#
+# Uso (sem rede nem credenciais):  python orcamento_gee.py
+# Sai com código 1 se algum cenário estourar o orçamento.
+
+# cenário: máx. round-trips (abrir a aba + clique indicado em CENARIOS)
+ORCAMENTOS = {
+    "inicio_preview": 2,
+    "inicio_confirmar": 2,
+    "imagens_abrir": 2,
+    "imagens_visualizar": 3,
+    "climatologia_gerar": 1,
+}
+
+# Payload: cada round-trip pode levar a geometria uma vez (o serializador do ee
+# reaproveita objetos repetidos) mais esta folga para o resto da expressão.
+FOLGA_PAYLOAD_KB = 16
+
+METROS_POR_GRAU = 111319.49079327357
+
+# ==========================================
+# 1. GRAVADOR
+# ==========================================
+
+class Gravador:
+    """Guarda (tipo, bytes do payload) de cada round-trip, de qualquer thread."""
+
+    def __init__(self):
+        self.chamadas = []
+        self._trava = threading.Lock()
+
+    def registrar(self, tipo, objeto=None):
+        tamanho = len(objeto.serialize()) if isinstance(objeto, ComputedObject) else 0
+        with self._trava:
+            self.chamadas.append((tipo, tamanho))
+
+    def limpar(self):
+        with self._trava:
+            self.chamadas = []
+
+GRAVADOR = Gravador()
+_IDS_MAPA = itertools.count(1)
+
+# ==========================================
+# 2. DUBLÊ DO MÓDULO ee
+# ==========================================
+
+def _resolver(x):
+    """Valor Python de um argumento (objetos do dublê viram seu valor avaliado)."""
+    if isinstance(x, ComputedObject): return x._valor
+    if isinstance(x, dict): return {k: _resolver(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)): return [_resolver(v) for v in x]
+    return x
+
+def _grafo(x, vistos):
+    """
+    Representação serializável (≈ o payload que a API enviaria).
+    Como no serializador do ee, um objeto repetido vira referência ao primeiro.
+    """
+    if isinstance(x, ComputedObject):
+        if id(x) in vistos: return {'ref': vistos[id(x)]}
+        vistos[id(x)] = len(vistos)
+        return {'f': x._nome, 'a': [_grafo(a, vistos) for a in x._args],
+                'k': {k: _grafo(v, vistos) for k, v in sorted(x._kwargs.items())},
+                'p': _grafo(x._pai, vistos) if x._pai is not None else None}
+    if isinstance(x, dict): return {str(k): _grafo(v, vistos) for k, v in sorted(x.items(), key=lambda i: str(i[0]))}
+    if isinstance(x, (list, tuple)): return [_grafo(v, vistos) for v in x]
+    if callable(x): return "<funcao>"
+    if isinstance(x, (str, int, float, bool)) or x is None: return x
+    return str(x)
+
+def _para_json(valor):
+    """Converte o valor avaliado no que o getInfo devolveria."""
+    if isinstance(valor, shapely.Geometry): return mapping(valor)
+    return json.loads(json.dumps(valor, default=lambda o: mapping(o) if isinstance(o, shapely.Geometry) else None))
+
+def _geom(x):
+    v = _resolver(x)
+    if isinstance(v, shapely.Geometry): return v
+    if isinstance(v, dict) and v.get('type') == 'Feature': return shape(v['geometry'])
+    if isinstance(v, dict) and 'type' in v: return shape(v)
+    return None
+
+def _area_m2(g):
+    """Área aproximada (equirretangular local), suficiente para os testes."""
+    lat = g.centroid.y if not g.is_empty else 0
+    return g.area * METROS_POR_GRAU ** 2 * math.cos(math.radians(lat))
+
+def _coords(g):
+    return json.loads(json.dumps(mapping(g)['coordinates']))
+
+def _feature(g, props=None):
+    return {'type': 'Feature', 'geometry': mapping(g) if g is not None else None, 'properties': props or {}}
+
+# Avaliação local: nome do método -> função(valor_do_pai, *args, **kwargs)
+AVALIADORES = {
+    # Geometria
+    'area': lambda g, *a, **k: _area_m2(g) if isinstance(g, shapely.Geometry) else None,
+    'bounds': lambda g, *a, **k: shapely.box(*g.bounds) if isinstance(g, shapely.Geometry) else None,
+    'centroid': lambda g, *a, **k: g.centroid if isinstance(g, shapely.Geometry) else None,
+    'buffer': lambda g, d=0, *a, **k: g.buffer(_resolver(d) / METROS_POR_GRAU) if isinstance(g, shapely.Geometry) else None,
+    'simplify': lambda g, *a, **k: g,
+    'transform': lambda g, *a, **k: g,
+    'dissolve': lambda g, *a, **k: g,
+    'geometry': lambda v, *a, **k: _geom(v) if not isinstance(v, shapely.Geometry) else v,
+    'coordinates': lambda g, *a, **k: _coords(g) if isinstance(g, shapely.Geometry) else None,
+    # Coleções (sem imagens offline: filtros preservam a lista)
+    'filterBounds': lambda c, *a, **k: c, 'filterDate': lambda c, *a, **k: c,
+    'filter': lambda c, *a, **k: c, 'select': lambda c, *a, **k: c if isinstance(c, list) else None,
+    'limit': lambda c, n=None, *a, **k: c[:_resolver(n)] if isinstance(c, list) and n is not None else c,
+    'size': lambda c, *a, **k: len(c) if isinstance(c, list) else None,
+    'first': lambda c, *a, **k: c[0] if isinstance(c, list) and c else None,
+    'map': lambda c, fn, *a, **k: [_resolver(fn(ComputedObject._de(e))) for e in c] if isinstance(c, list) else None,
+    'toList': lambda c, *a, **k: c if isinstance(c, list) else None,
+    'reduceRegion': lambda *a, **k: {},
+    'reduceColumns': lambda *a, **k: {'list': []},
+    'get': lambda d, chave, *a, **k: d.get(_resolver(chave), _resolver(a[0]) if a else None) if isinstance(d, dict) else None,
+    # Números
+    'add': lambda n, o, *a, **k: n + _resolver(o) if isinstance(n, (int, float)) else None,
+    'subtract': lambda n, o, *a, **k: n - _resolver(o) if isinstance(n, (int, float)) else None,
+    'multiply': lambda n, o, *a, **k: n * _resolver(o) if isinstance(n, (int, float)) else None,
+    'divide': lambda n, o, *a, **k: n / _resolver(o) if isinstance(n, (int, float)) and _resolver(o) else None,
+    'gt': lambda n, o, *a, **k: int(n > _resolver(o)) if isinstance(n, (int, float)) else None,
+}
+
+class _Meta(type):
+    """Métodos estáticos (ee.Reducer.mean(), ee.Filter.lt(), ee.Geometry.Polygon()...)."""
+
+    def __getattr__(cls, nome):
+        if nome.startswith('__'): raise AttributeError(nome)
+        return lambda *a, **k: cls._estatico(nome, a, k)
+
+_SEM_VALOR = object()
+
+class ComputedObject(metaclass=_Meta):
+    """Nó do grafo de expressão: lembra como foi criado e, se possível, seu valor local."""
+
+    def __init__(self, *args, _nome=None, _pai=None, _valor=_SEM_VALOR, **kwargs):
+        self._nome = _nome or type(self).__name__
+        self._args = args
+        self._kwargs = kwargs
+        self._pai = _pai
+        self._valor = self._construir(*args, **kwargs) if _valor is _SEM_VALOR else _valor
+
+    def _construir(self, *args, **kwargs):
+        return _resolver(args[0]) if args else None
+
+    @classmethod
+    def _de(cls, valor):
+        return cls(_nome='constante', _valor=valor)
+
+    @classmethod
+    def _estatico(cls, nome, args, kwargs):
+        try:
+            valor = _ESTATICOS[nome](*args, **kwargs) if nome in _ESTATICOS else None
+        except Exception:
+            valor = None
+        return cls(*args, _nome=f"{cls.__name__}.{nome}", _valor=valor, **kwargs)
+
+    def __getattr__(self, nome):
+        if nome.startswith('_'): raise AttributeError(nome)
+
+        def metodo(*args, **kwargs):
+            avaliar = AVALIADORES.get(nome)
+            try:
+                valor = avaliar(self._valor, *args, **kwargs) if avaliar and self._valor is not None else None
+            except Exception:
+                valor = None
+            return ComputedObject(*args, _nome=nome, _pai=self, _valor=valor, **kwargs)
+        return metodo
+
+    # --- Round-trips ---
+    def getInfo(self):
+        GRAVADOR.registrar('getInfo', self)
+        return _para_json(self._valor)
+
+    def getMapId(self, vis_params=None):
+        GRAVADOR.registrar('getMapId', self)
+        # Id único no processo: mapas em cache de outro cenário não são reaproveitados
+        n = next(_IDS_MAPA)
+        return {'mapid': f"falso-{n}", 'token': '',
+                'tile_fetcher': SimpleNamespace(url_format=f"https://tiles.falso/{n}/{{z}}/{{x}}/{{y}}")}
+
+    def getDownloadURL(self, params=None):
+        GRAVADOR.registrar('getDownloadURL', self)
+        return "https://download.falso/arquivo.tif"
+
+    def getThumbURL(self, params=None):
+        GRAVADOR.registrar('getThumbURL', self)
+        return "https://thumb.falso/quadro.png"
+
+    # --- Lado cliente (sem round-trip) ---
+    def serialize(self, *args, **kwargs):
+        return json.dumps(_grafo(self, {}), sort_keys=True, separators=(',', ':'))
+
+    def toGeoJSON(self):
+        g = _geom(self)
+        if g is None: raise ValueError("Geometria calculada no servidor.")
+        return mapping(g)
+
+    def __repr__(self):
+        return f"ee.{self._nome}(falso)"
+
+def _poligono(coords, *a, **k):
+    c = _resolver(coords)
+    return shape({'type': 'Polygon', 'coordinates': c if isinstance(c[0][0], (list, tuple)) else [c]})
+
+_ESTATICOS = {
+    'Polygon': _poligono,
+    'MultiPolygon': lambda coords, *a, **k: shape({'type': 'MultiPolygon', 'coordinates': _resolver(coords)}),
+    'Point': lambda coords, *a, **k: shape({'type': 'Point', 'coordinates': _resolver(coords)}),
+    'Rectangle': lambda coords, *a, **k: shapely.box(*_resolver(coords)),
+    'sequence': lambda ini, fim, passo=1, *a, **k: list(range(int(_resolver(ini)), int(_resolver(fim)) + 1, int(_resolver(passo)))),
+    'If': lambda cond, a, b: _resolver(a) if _resolver(cond) else _resolver(b),
+}
+
+class Geometry(ComputedObject):
+    def _construir(self, geo_json=None, *args, **kwargs):
+        return _geom(geo_json) if geo_json is not None else None
+
+class Feature(ComputedObject):
+    def _construir(self, geom=None, props=None, *args, **kwargs):
+        return _feature(_geom(geom) if geom is not None else None, _resolver(props))
+
+class FeatureCollection(ComputedObject):
+    def _construir(self, fonte=None, *args, **kwargs):
+        g = _geom(fonte)
+        if g is not None: return [_feature(g)]
+        v = _resolver(fonte)
+        return v if isinstance(v, list) else None
+
+class ImageCollection(ComputedObject):
+    def _construir(self, *args, **kwargs):
+        # Nenhuma cena offline: size() == 0 exercita os caminhos "sem imagem"
+        return []
+
+class Image(ComputedObject): pass
+class Dictionary(ComputedObject): pass
+class Number(ComputedObject): pass
+class String(ComputedObject): pass
+class List(ComputedObject): pass
+class Date(ComputedObject): pass
+class Filter(ComputedObject): pass
+class Reducer(ComputedObject): pass
+class Algorithms(ComputedObject): pass
+class Kernel(ComputedObject): pass
+class Terrain(ComputedObject): pass
+
+class EEException(Exception): pass
+
+def _data_compute_value(objeto):
+    GRAVADOR.registrar('computeValue', objeto)
+    return _para_json(objeto._valor)
+
+def _data_compute_pixels(params):
+    GRAVADOR.registrar('computePixels', params.get('expression'))
+    return None
+
+def criar_ee_falso():
+    """Módulo `ee` substituto, pronto para sys.modules['ee']."""
+    ee = types.ModuleType('ee')
+    for cls in (ComputedObject, Geometry, Feature, FeatureCollection, Image, ImageCollection, Dictionary,
+                Number, String, List, Date, Filter, Reducer, Algorithms, Kernel, Terrain):
+        setattr(ee, cls.__name__, cls)
+    ee.EEException = EEException
+    ee.Initialize = lambda *a, **k: None
+    ee.Authenticate = lambda *a, **k: None
+    ee.data = types.SimpleNamespace(computeValue=_data_compute_value, computePixels=_data_compute_pixels)
+    return ee
+
+# ==========================================
+# 3. DUBLÊ DO geemap.foliumap
+# ==========================================
+
+class MapaFalso:
+    """Aceita qualquer chamada; centerObject faz o mesmo getInfo que o geemap real."""
+
+    def __init__(self, *args, **kwargs): pass
+
+    def centerObject(self, ee_object, zoom=None, *args, **kwargs):
+        ee_object.centroid(1).getInfo()
+
+    def save(self, destino, close_file=True, **kwargs):
+        destino.write(b"<html></html>")
+
+    def __getattr__(self, nome):
+        return lambda *a, **k: None
+
+def criar_geemap_falso():
+    pacote = types.ModuleType('geemap')
+    foliumap = types.ModuleType('geemap.foliumap')
+    foliumap.Map = MapaFalso
+    pacote.foliumap = foliumap
+    return pacote, foliumap
+
+def instalar_dubles():
+    """Coloca os dublês em sys.modules (antes de importar as abas)."""
+    geemap, foliumap = criar_geemap_falso()
+    sys.modules['ee'] = criar_ee_falso()
+    sys.modules['geemap'] = geemap
+    sys.modules['geemap.foliumap'] = foliumap
+
+# ==========================================
+# 4. GEOMETRIAS DE TESTE
+# ==========================================
+
+def _circulo(lon, lat, raio_m, vertices):
+    r = raio_m / METROS_POR_GRAU
+    anel = [[lon + r * math.cos(2 * math.pi * i / vertices) / math.cos(math.radians(lat)),
+             lat + r * math.sin(2 * math.pi * i / vertices)] for i in range(vertices)]
+    return anel + anel[:1]
+
+def fixtures():
+    """Um talhão simples (5 vértices) e um perímetro detalhado de KML (2.000 vértices)."""
+    simples = [[-55.60, -12.60], [-55.59, -12.60], [-55.59, -12.59], [-55.60, -12.59], [-55.60, -12.60]]
+    detalhado = _circulo(-47.90, -15.80, 3000, 2000)
+    return {
+        "simples": {'type': 'Polygon', 'coordinates': [simples]},
+        "detalhado": {'type': 'Polygon', 'coordinates': [detalhado]},
+    }
+
+# ==========================================
+# 5. CENÁRIOS (AppTest)
+# ==========================================
+
+def _script_aba(modulo, geojson, preview=False):
+    # Executado pelo AppTest (mesmo processo: usa os dublês de sys.modules)
+    import importlib
+    import streamlit as st
+    import ee
+
+    geom = ee.Geometry(geojson)
+    if preview:
+        st.session_state.setdefault('preview_geometry', geom)
+        st.session_state.setdefault('preview_data', {"tipo": "KML", "nome": "teste.kml", "area_ha": 100.0, "talhoes": []})
+    else:
+        st.session_state.setdefault('current_geometry', geom)
+        st.session_state.setdefault('source_name', "Imóvel de teste")
+    import utils
+    utils.init_session_state()
+    importlib.import_module(modulo).render_tab()
+
+def _clicar(at, rotulo):
+    botao = next(b for b in at.button if rotulo in b.label)
+    botao.click().run()
+
+CENARIOS = {
+    "inicio_preview": ("home", True, None),
+    "inicio_confirmar": ("home", True, "✅ Usar Este Perímetro"),
+    "imagens_abrir": ("sentinel", False, None),
+    "imagens_visualizar": ("sentinel", False, "Visualizar"),
+    "climatologia_gerar": ("climatology", False, "📊 Gerar Climatologia"),
+}
+
+def executar_cenario(nome, geojson, timeout=30):
+    """Roda um cenário do zero (caches limpos) e devolve a lista de round-trips."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    import utils
+
+    modulo, preview, botao = CENARIOS[nome]
+    st.cache_data.clear()
+    GRAVADOR.limpar()
+
+    # Mapas HTML já gravados em disco pulariam a montagem: cada cenário usa pasta vazia
+    pasta_original = utils.PASTA_MAPAS
+    with tempfile.TemporaryDirectory() as pasta:
+        utils.PASTA_MAPAS = pasta
+        try:
+            at = AppTest.from_function(_script_aba, args=(modulo, geojson, preview), default_timeout=timeout)
+            at.secrets['orcamento_gee'] = True  # sem 'earth_engine': init_gee não grava credenciais
+            at.run()
+            if botao:
+                _clicar(at, botao)
+        finally:
+            utils.PASTA_MAPAS = pasta_original
+    if at.exception:
+        raise RuntimeError(f"{nome}: {at.exception[0].message}")
+    return list(GRAVADOR.chamadas)
+
+def verificar_orcamentos(orcamentos=ORCAMENTOS):
+    """Executa todos os cenários para todas as geometrias. Retorna (linhas, falhas)."""
+    linhas, falhas = [], []
+    for fixture, geojson in fixtures().items():
+        max_kb = round(len(Geometry(geojson).serialize()) / 1024 + FOLGA_PAYLOAD_KB, 1)
+        for nome, max_chamadas in orcamentos.items():
+            chamadas = executar_cenario(nome, geojson)
+            maior_kb = max((t for _, t in chamadas), default=0) / 1024
+            ok = len(chamadas) <= max_chamadas and maior_kb <= max_kb
+            linhas.append({
+                "cenario": nome, "geometria": fixture, "round_trips": len(chamadas),
+                "orcamento": max_chamadas, "maior_payload_kb": round(maior_kb, 1), "limite_kb": max_kb,
+                "tipos": ",".join(t for t, _ in chamadas), "ok": ok
+            })
+            if not ok: falhas.append(linhas[-1])
+    return linhas, falhas
+
+if __name__ == "__main__":
+    instalar_dubles()
+    linhas, falhas = verificar_orcamentos()
+    for l in linhas:
+        status = "OK " if l['ok'] else "ERRO"
+        print(f"[{status}] {l['cenario']:<22} {l['geometria']:<10} "
+              f"{l['round_trips']}/{l['orcamento']} round-trips  "
+              f"{l['maior_payload_kb']}/{l['limite_kb']} KB  ({l['tipos']})")
+    sys.exit(1 if falhas else 0)
@@ -1,11 +1,339 @@
 import streamlit as st
 import ee
 import geemap.foliumap as geemap
-import io
+import json
 import streamlit.components.v1 as components
 import utils
+import gee_lote
+import exportacao_raster
+import timelapse
+import serie_longa
+import pandas as pd
+import plotly.graph_objects as go
 from datetime import datetime
 
+PALETA_NDVI = ['#d73027', '#f46d43', '#fdae61', '#fee08b', '#d9ef8b', '#a6d96a', '#66bd63', '#1a9850']
+PALETA_NDWI = ['#8c510a', '#d8b365', '#f6e8c3', '#c7eae5', '#5ab4ac', '#01665e', '#08306b']
+PALETA_NBR = ['#67001f', '#d6604d', '#fddbc7', '#d9f0d3', '#5aae61', '#00441b']
+
+INDICES = ['NDVI', 'EVI', 'NDWI', 'SAVI', 'NBR']
+
+VIS_DIFF = {'min': -0.5, 'max': 0.5, 'palette': ['#b2182b', '#ef8a62', '#f7f7f7', '#67a9cf', '#1a9850']}
+VIS_CLASSES_MUDANCA = {'min': 1, 'max': 2, 'palette': ['#e74c3c', '#2ecc71']}
+
+# Configuração de cada tipo de visualização sobre a mesma composição
+TIPOS_VISUALIZACAO = {
+    "RGB": {'vis': {'min': 0, 'max': 3000, 'bands': ['B4', 'B3', 'B2']}, 'download': ['B4', 'B3', 'B2'], 'sufixo': "RGB"},
+    "Falsa Cor": {'vis': {'min': 0, 'max': 3000, 'bands': ['B8', 'B4', 'B3']}, 'download': ['B8', 'B4', 'B3'], 'sufixo': "FalsaCor"},
+    "NDVI": {'indice': 'NDVI', 'vis': {'min': 0, 'max': 0.8, 'palette': PALETA_NDVI}, 'rotulos': ("Solo", "Vigor"), 'titulo': "Vigor M&eacute;dio"},
+    "EVI": {'indice': 'EVI', 'vis': {'min': 0, 'max': 0.8, 'palette': PALETA_NDVI}, 'rotulos': ("Solo", "Vigor"), 'titulo': "EVI M&eacute;dio"},
+    "SAVI": {'indice': 'SAVI', 'vis': {'min': 0, 'max': 0.8, 'palette': PALETA_NDVI}, 'rotulos': ("Solo", "Vigor"), 'titulo': "SAVI M&eacute;dio"},
+    "NDWI": {'indice': 'NDWI', 'vis': {'min': -0.6, 'max': 0.4, 'palette': PALETA_NDWI}, 'rotulos': ("Seco", "&Aacute;gua"), 'titulo': "NDWI M&eacute;dio"},
+    "NBR": {'indice': 'NBR', 'vis': {'min': -0.2, 'max': 0.8, 'palette': PALETA_NBR}, 'rotulos': ("Queimado", "Vegeta&ccedil;&atilde;o"), 'titulo': "NBR M&eacute;dio"},
+}
+for _cfg in TIPOS_VISUALIZACAO.values():
+    if 'indice' in _cfg:
+        _cfg['vis']['bands'] = [_cfg['indice']]
+        _cfg['download'] = [_cfg['indice']]
+        _cfg['sufixo'] = _cfg['indice']
+
+def composicao_indices(img):
+    """Adiciona NDVI, EVI, NDWI, SAVI e NBR como bandas da composição (reflectância 0-10000)."""
+    r = img.divide(10000)
+    evi = r.expression(
+        '2.5 * (NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1)',
+        {'NIR': r.select('B8'), 'RED': r.select('B4'), 'BLUE': r.select('B2')}
+    ).rename('EVI')
+    savi = r.expression(
+        '1.5 * (NIR - RED) / (NIR + RED + 0.5)',
+        {'NIR': r.select('B8'), 'RED': r.select('B4')}
+    ).rename('SAVI')
+    return img.addBands([
+        img.normalizedDifference(['B8', 'B4']).rename('NDVI'),
+        evi,
+        img.normalizedDifference(['B3', 'B8']).rename('NDWI'),
+        savi,
+        img.normalizedDifference(['B8', 'B12']).rename('NBR'),
+    ])
+
+def stats_indices(comp, geometry):
+    """Média e desvio de todos os índices num único reduceRegion (chaves NDVI_mean, EVI_stdDev...)."""
+    redutor = ee.Reducer.mean().combine(ee.Reducer.stdDev(), sharedInputs=True)
+    return comp.select(INDICES).reduceRegion(redutor, geometry, 30, crs='EPSG:4326', maxPixels=1e9)
+
+def camada_visual(prev, tipo):
+    """Camada pronta para o mapa a partir da composição em cache e do tipo escolhido."""
+    cfg = TIPOS_VISUALIZACAO[tipo]
+    return {
+        'ee_object': prev['ee_object'],
+        'vis_params': cfg['vis'],
+        'name': f"{tipo} {prev['periodo']}",
+        'type': tipo,
+        'cache_id': f"{prev['cache_id']}|{cfg['sufixo']}"
+    }
+
+@st.cache_data(ttl=utils.TTL_TILES_GEE, show_spinner=False)
+def obter_url_download(_img, cache_id, bandas_json, filename, _region):
+    """Link do getDownloadURL (gerado uma vez por camada/tipo)."""
+    try:
+        return _img.select(json.loads(bandas_json)).getDownloadURL({
+            'name': filename, # Nome que aparecerá no download
+            'scale': 10,
+            'crs': 'EPSG:4326',
+            'region': _region, 
+            'format': 'GEO_TIFF',
+            'maxPixels': 1e9
+        })
+    except Exception:
+        return None
+
+def html_colorbar(cfg):
+    grad = f"linear-gradient(to right, {', '.join(cfg['vis']['palette'])})"
+    esquerda, direita = cfg['rotulos']
+    return f"""<div style="position: fixed; bottom: 30px; left: 10px; z-index:9999; background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 6px rgba(0,0,0,0.3); font-family: sans-serif;"><div style="font-size: 12px; color: #555; text-align: center; margin-bottom: 4px;">{cfg['indice']}</div><div style="height: 12px; width: 150px; background: {grad}; border-radius: 4px;"></div><div style="display: flex; justify-content: space-between; font-size: 10px; color: #555; margin-top: 4px;"><span>{esquerda}</span><span>{direita}</span></div></div>"""
+
+def html_stats(cfg, val, periodo):
+    vmax = cfg['vis']['max']
+    cor = "#2ecc71" if val > 0.75 * vmax else "#f1c40f" if val > 0.375 * vmax else "#e74c3c"
+    return f"""<div style="position: fixed; bottom: 30px; right: 10px; z-index:9999; background: white; padding: 10px 20px; border-radius: 8px; box-shadow: 0 2px 6px rgba(0,0,0,0.3); font-family: sans-serif; text-align: center;"><div style="font-size: 12px; color: #555;">{cfg['titulo']} ({periodo})</div><div style="font-size: 20px; font-weight: bold; color: {cor};">{val:.2f}</div></div>"""
+
+def mascarar_nuvens_s2(img):
+    """Remove sombra, nuvens e cirrus usando a banda SCL do Sentinel-2 SR."""
+    scl = img.select('SCL')
+    limpo = scl.neq(3).And(scl.neq(8)).And(scl.neq(9)).And(scl.neq(10))
+    return img.updateMask(limpo)
+
+@st.cache_data(show_spinner=False)
+def get_serie_ndvi(_geometry, cache_id, max_nuvens, ano_inicio=2020):
+    """
+    Série mensal de NDVI (média, mediana e percentis) de ano_inicio até hoje.
+    Todo o cálculo é montado no servidor e buscado com um único getInfo.
+    """
+    agora = datetime.now()
+    n_meses = (agora.year - ano_inicio) * 12 + agora.month
+    inicio = ee.Date.fromYMD(ano_inicio, 1, 1)
+
+    ndvi = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+        .filterBounds(_geometry)
+        .filterDate(inicio, ee.Date(agora.strftime('%Y-%m-%d')).advance(1, 'day'))
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_nuvens))
+        .map(lambda img: mascarar_nuvens_s2(img)
+             .normalizedDifference(['B8', 'B4']).rename('NDVI')
+             .copyProperties(img, ['system:time_start'])))
+
+    redutor = ee.Reducer.mean().combine(ee.Reducer.percentile([10, 25, 50, 75, 90]), sharedInputs=True)
+
+    def stats_mes(k):
+        data_ini = inicio.advance(ee.Number(k), 'month')
+        do_mes = ndvi.filterDate(data_ini, data_ini.advance(1, 'month'))
+        base = {'data': data_ini.format('YYYY-MM'), 'cenas': do_mes.size()}
+        stats = do_mes.median().reduceRegion(
+            reducer=redutor, geometry=_geometry, scale=20,
+            maxPixels=1e9, bestEffort=True, tileScale=4
+        )
+        return ee.Algorithms.If(
+            do_mes.size().gt(0),
+            ee.Feature(None, stats).set(base),
+            ee.Feature(None, base)
+        )
+
+    try:
+        features = ee.FeatureCollection(
+            ee.List.sequence(0, n_meses - 1).map(stats_mes)
+        ).getInfo()['features']
+    except Exception as e:
+        st.session_state['erro_ndvi_serie'] = str(e)
+        return pd.DataFrame()
+
+    colunas = {'NDVI_mean': 'Média', 'NDVI_p50': 'Mediana', 'NDVI_p10': 'P10',
+               'NDVI_p25': 'P25', 'NDVI_p75': 'P75', 'NDVI_p90': 'P90'}
+    data = []
+    for f in features:
+        p = f['properties']
+        linha = {'Data': pd.to_datetime(p['data']), 'Cenas': int(p.get('cenas', 0))}
+        for chave, nome in colunas.items():
+            linha[nome] = p.get(chave)
+        data.append(linha)
+
+    return pd.DataFrame(data).sort_values('Data')
+
+@st.cache_data(show_spinner=False)
+def get_ndvi_talhoes(_talhoes, cache_id, ano, mes, max_nuvens):
+    """
+    Média, desvio padrão e histograma de NDVI por talhão.
+    Um único reduceRegions sobre a FeatureCollection (3 ou 300 talhões = 1 chamada).
+    """
+    fc = ee.FeatureCollection(_talhoes).map(
+        lambda f: f.set('area_ha', f.geometry().area(1).divide(10000))
+    )
+    inicio = ee.Date.fromYMD(ano, mes, 1)
+    coll = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+        .filterBounds(fc.geometry())
+        .filterDate(inicio, inicio.advance(1, 'month'))
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_nuvens))
+        .map(mascarar_nuvens_s2))
+    ndvi = coll.median().normalizedDifference(['B8', 'B4']).rename('NDVI')
+
+    redutor = (ee.Reducer.mean()
+        .combine(ee.Reducer.stdDev(), sharedInputs=True)
+        .combine(ee.Reducer.fixedHistogram(0, 1, 10), sharedInputs=True))
+
+    resultado = ee.Algorithms.If(
+        coll.size().gt(0),
+        ndvi.reduceRegions(collection=fc, reducer=redutor, scale=10, tileScale=4),
+        ee.FeatureCollection([])
+    )
+
+    try:
+        features = ee.FeatureCollection(resultado).getInfo()['features']
+    except Exception as e:
+        st.session_state['erro_ndvi_talhoes'] = str(e)
+        return pd.DataFrame()
+
+    data = []
+    for f in features:
+        p = f['properties']
+        hist = p.get('histogram') or []
+        data.append({
+            "Talhão": p.get('nome'),
+            "Área (ha)": p.get('area_ha'),
+            "NDVI Médio": p.get('mean'),
+            "Desvio": p.get('stdDev'),
+            "Distribuição": [int(c[1]) for c in hist]
+        })
+
+    df = pd.DataFrame(data)
+    if df.empty: return df
+    df = df.sort_values("NDVI Médio", ascending=False, na_position='last').reset_index(drop=True)
+    df.insert(0, "Rank", range(1, len(df) + 1))
+    return df
+
+def composicao_periodo(geometry, inicio, dias, max_nuvens):
+    """Mediana com máscara de nuvens para a janela [inicio, inicio + dias)."""
+    data_ini = ee.Date(inicio.strftime('%Y-%m-%d'))
+    coll = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+        .filterBounds(geometry)
+        .filterDate(data_ini, data_ini.advance(dias, 'day'))
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_nuvens))
+        .map(mascarar_nuvens_s2))
+    return coll, coll.median()
+
+def imagens_mudanca(geometry, data_a, data_b, dias, max_nuvens, limiar):
+    """
+    Diferença de NDVI (depois - antes) e classes: 1 = perda, 2 = ganho (0 = estável).
+    Só monta as expressões; nenhuma chamada ao servidor.
+    """
+    coll_a, img_a = composicao_periodo(geometry, data_a, dias, max_nuvens)
+    coll_b, img_b = composicao_periodo(geometry, data_b, dias, max_nuvens)
+    ndvi_a = img_a.normalizedDifference(['B8', 'B4'])
+    ndvi_b = img_b.normalizedDifference(['B8', 'B4'])
+    diff = ndvi_b.subtract(ndvi_a).rename('dNDVI').clip(geometry)
+    classes = (ee.Image(0)
+        .where(diff.lt(-limiar), 1)
+        .where(diff.gt(limiar), 2)
+        .updateMask(diff.mask())
+        .rename('classe').clip(geometry))
+    return coll_a, coll_b, diff, classes
+
+@st.cache_data(show_spinner=False)
+def get_mudanca_ndvi(_geometry, cache_id, data_a, data_b, dias, max_nuvens, limiar):
+    """Áreas (ha) de perda, ganho e estabilidade num único reduceRegion de soma."""
+    coll_a, coll_b, diff, classes = imagens_mudanca(_geometry, data_a, data_b, dias, max_nuvens, limiar)
+    area_ha = ee.Image.pixelArea().divide(10000)
+    bandas_area = ee.Image.cat([
+        area_ha.updateMask(classes.eq(1)).rename('perda'),
+        area_ha.updateMask(classes.eq(2)).rename('ganho'),
+        area_ha.updateMask(classes.eq(0)).rename('estavel'),
+    ])
+    tem_cenas = coll_a.size().gt(0).And(coll_b.size().gt(0))
+
+    try:
+        return gee_lote.avaliar_lote({
+            'cenas_a': coll_a.size(),
+            'cenas_b': coll_b.size(),
+            'areas': ee.Algorithms.If(tem_cenas, bandas_area.reduceRegion(
+                reducer=ee.Reducer.sum(), geometry=_geometry, scale=10,
+                maxPixels=1e10, bestEffort=True, tileScale=4
+            ), None),
+            'dndvi_medio': ee.Algorithms.If(tem_cenas, diff.reduceRegion(
+                reducer=ee.Reducer.mean(), geometry=_geometry, scale=30, maxPixels=1e9, bestEffort=True
+            ).get('dNDVI'), None)
+        })
+    except Exception as e:
+        return {'erro': str(e)}
+
+@st.cache_data(show_spinner=False)
+def get_catalogo_cenas(_geometry, cache_id, data_ini, data_fim):
+    """
+    Lista todas as cenas do período com data, % de nuvens da cena e fração de
+    pixels limpos dentro do imóvel (SCL). Um único reduceColumns + getInfo.
+    """
+    ini = ee.Date(data_ini.strftime('%Y-%m-%d'))
+    fim = ee.Date(data_fim.strftime('%Y-%m-%d')).advance(1, 'day')
+
+    def fracao_limpa(img):
+        scl = img.select('SCL')
+        limpo = scl.neq(3).And(scl.neq(8)).And(scl.neq(9)).And(scl.neq(10)).rename('limpo')
+        val = limpo.reduceRegion(
+            reducer=ee.Reducer.mean(), geometry=_geometry, scale=20,
+            maxPixels=1e9, bestEffort=True, tileScale=4
+        ).get('limpo')
+        # 0 (cena toda nublada) é um valor válido: só a ausência de pixels vira -1
+        return img.set('limpo', ee.Algorithms.If(ee.Algorithms.IsEqual(val, None), -1, val))
+
+    coll = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+        .filterBounds(_geometry)
+        .filterDate(ini, fim)
+        .map(fracao_limpa))
+    colunas = ['system:time_start', 'CLOUDY_PIXEL_PERCENTAGE', 'limpo', 'MGRS_TILE']
+
+    try:
+        linhas = coll.reduceColumns(ee.Reducer.toList(len(colunas)), colunas).get('list').getInfo()
+    except Exception as e:
+        st.session_state['erro_catalogo'] = str(e)
+        return pd.DataFrame()
+
+    df = pd.DataFrame(linhas, columns=['Data', 'Nuvens Cena (%)', 'Limpo no Imóvel (%)', 'Tile'])
+    if df.empty: return df
+    df['Data'] = pd.to_datetime(df['Data'], unit='ms').dt.date
+    df['Limpo no Imóvel (%)'] = (df['Limpo no Imóvel (%)'] * 100).where(df['Limpo no Imóvel (%)'] >= 0)
+    return df.sort_values(['Data', 'Tile'], ascending=[False, True]).reset_index(drop=True)
+
+def quadro_timelapse(regiao, inicio, fim, max_nuvens, tipo):
+    """Composição do período já visualizada (RGB 8 bits) e recortada na região."""
+    _, mediana = composicao_periodo(regiao, inicio, (fim - inicio).days, max_nuvens)
+    cfg = TIPOS_VISUALIZACAO[tipo]
+    img = composicao_indices(mediana) if 'indice' in cfg else mediana
+    return img.visualize(**cfg['vis']).clip(regiao)
+
+def bbox_anel(coords):
+    """Converte o anel retornado por bounds().coordinates() em (oeste, sul, leste, norte)."""
+    xs = [c[0] for c in coords[0]]
+    ys = [c[1] for c in coords[0]]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def grafico_serie_ndvi(df):
+    """Gráfico de vigor plurianual com faixas P10-P90 e P25-P75."""
+    df = df.dropna(subset=['Média'])
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df['Data'], y=df['P90'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=df['Data'], y=df['P10'], mode='lines', line=dict(width=0), fill='tonexty', fillcolor='rgba(26, 152, 80, 0.12)', name='P10 - P90'))
+    fig.add_trace(go.Scatter(x=df['Data'], y=df['P75'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=df['Data'], y=df['P25'], mode='lines', line=dict(width=0), fill='tonexty', fillcolor='rgba(26, 152, 80, 0.25)', name='P25 - P75'))
+    fig.add_trace(go.Scatter(x=df['Data'], y=df['Mediana'], mode='lines', name='Mediana', line=dict(color='#66bd63', width=1, dash='dot')))
+    fig.add_trace(go.Scatter(x=df['Data'], y=df['Média'], mode='lines+markers', name='Média', line=dict(color='#1a9850', width=3)))
+    fig.update_layout(
+        height=350, margin=dict(l=20, r=20, t=20, b=20),
+        yaxis_title="NDVI", yaxis_range=[0, 1], hovermode="x unified",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
+
+def limpar_cena():
+    """Volta a usar o mês inteiro (descarta a cena fixada pelo catálogo)."""
+    st.session_state.pop('data_cena', None)
+    utils.reset_preview()
+
 def render_tab():
     # 1. Verifica Geometria
     geometry = st.session_state.get('current_geometry')
@@ -22,37 +350,77 @@ def render_tab():
     try: idx_ano_atual = lista_anos.index(ano_atual)
     except ValueError: idx_ano_atual = len(lista_anos) - 1
 
+    # Cena escolhida no catálogo: atualiza os seletores antes de criá-los
+    if 'cena_pendente' in st.session_state:
+        cena = st.session_state.pop('cena_pendente')
+        st.session_state['sent_mes'], st.session_state['sent_ano'] = cena.month, cena.year
+        st.session_state['data_cena'] = cena
+        utils.reset_preview()
+
     # --- Layout da Barra de Ferramentas ---
     c2, c3, c4, c5, c6, c7 = st.columns([0.8, 0.8, 0.5, 0.5, 0.8, 0.8])
     
     with c2: 
-        mes = st.selectbox("Mês", range(1, 13), index=mes_atual - 1, label_visibility="collapsed", on_change=utils.reset_preview)
+        mes = st.selectbox("Mês", range(1, 13), index=mes_atual - 1, label_visibility="collapsed", on_change=limpar_cena, key="sent_mes")
     with c3: 
-        ano = st.selectbox("Ano", lista_anos, index=idx_ano_atual, label_visibility="collapsed", on_change=utils.reset_preview)
+        ano = st.selectbox("Ano", lista_anos, index=idx_ano_atual, label_visibility="collapsed", on_change=limpar_cena, key="sent_ano")
     with c4:
         with st.popover("⚙️", use_container_width=True):
             buffer_metros = st.slider("Buffer (m)", 0, 2000, 500, step=100, on_change=utils.reset_preview)
             max_nuvens = st.slider("Máx. Nuvens (%)", 0, 100, 30, on_change=utils.reset_preview)
     with c5:
         with st.popover("🎨", use_container_width=True):
-            tipo_visualizacao = st.radio("Tipo:", ["RGB", "NDVI", "Falsa Cor"], label_visibility="collapsed", on_change=utils.reset_preview)
+            # Trocar o tipo só muda os vis params (a composição já tem todos os índices)
+            tipo_visualizacao = st.radio("Tipo:", list(TIPOS_VISUALIZACAO), label_visibility="collapsed")
     with c6: 
         btn_visualizar = st.button("👁️ Visualizar", use_container_width=True)
     with c7: 
         btn_adicionar = st.button("➕ Adicionar", use_container_width=True)
 
-    # Adicionar Camada Fixa
+    data_cena = st.session_state.get('data_cena')
+    if data_cena:
+        c_info, c_x = st.columns([0.85, 0.15], vertical_alignment="center")
+        c_info.caption(f"📌 Cena fixa do catálogo: {data_cena.strftime('%d/%m/%Y')} (Visualizar usa apenas este dia)")
+        c_x.button("✖ Mês inteiro", on_click=limpar_cena, use_container_width=True)
+
+    # --- CATÁLOGO DE CENAS (1 round-trip por período) ---
+    with st.expander("🗓️ Catálogo de Cenas"):
+        c_i, c_f, c_btn = st.columns([0.4, 0.4, 0.2], vertical_alignment="bottom")
+        with c_i: cat_ini = st.date_input("De", value=datetime(ano_atual, mes_atual, 1) - pd.DateOffset(months=6), min_value=datetime(lista_anos[0], 1, 1), format="DD/MM/YYYY", key="cat_ini")
+        with c_f: cat_fim = st.date_input("Até", value=agora, min_value=datetime(lista_anos[0], 1, 1), format="DD/MM/YYYY", key="cat_fim")
+        with c_btn:
+            if st.button("Listar Cenas", use_container_width=True):
+                with st.spinner("Consultando catálogo..."):
+                    df_cat = get_catalogo_cenas(geometry, utils.fingerprint_geometria(geometry), cat_ini, cat_fim)
+                st.session_state['catalogo_cenas'] = df_cat
+                if df_cat.empty: st.warning(st.session_state.get('erro_catalogo') or "Nenhuma cena no período.")
+
+        df_cat = st.session_state.get('catalogo_cenas')
+        if df_cat is not None and not df_cat.empty:
+            evento = st.dataframe(
+                df_cat,
+                column_config={
+                    "Data": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                    "Nuvens Cena (%)": st.column_config.NumberColumn("Nuvens Cena (%)", format="%.1f"),
+                    "Limpo no Imóvel (%)": st.column_config.ProgressColumn("Limpo no Imóvel", format="%.0f%%", min_value=0, max_value=100),
+                },
+                use_container_width=True, hide_index=True, height=min(len(df_cat) * 35 + 38, 300),
+                selection_mode="single-row", on_select="rerun", key="grid_catalogo"
+            )
+            if evento.selection.rows:
+                escolhida = df_cat.iloc[evento.selection.rows[0]]['Data']
+                if st.button(f"📌 Usar cena de {escolhida.strftime('%d/%m/%Y')}", use_container_width=True):
+                    st.session_state['cena_pendente'] = escolhida
+                    st.rerun()
+
+    # Adicionar Camada Fixa (congela o tipo de visualização escolhido)
     if btn_adicionar and st.session_state['camada_preview']:
-        st.session_state['camadas_fixas'].append(st.session_state['camada_preview'])
+        st.session_state['camadas_fixas'].append(camada_visual(st.session_state['camada_preview'], tipo_visualizacao))
         st.toast("Camada fixada no mapa!")
         utils.reset_preview()
 
     # --- MAPA ---
     with st.container():
-        m = geemap.Map(center=[-14, -50], zoom=4, draw_control=False, scale_control=True)
-        m.add_basemap("HYBRID")
-        m.centerObject(geometry, 13)
-
         # PROCESSAMENTO (Visualizar)
         if btn_visualizar:
             utils.reset_preview()
@@ -61,44 +429,33 @@ def render_tab():
                     # Define região de visualização (Box)
                     region_viz = geometry.bounds().buffer(buffer_metros)
                     
+                    # Janela: mês inteiro (até o último dia) ou o dia escolhido no catálogo
+                    if data_cena:
+                        inicio = ee.Date(data_cena.strftime('%Y-%m-%d'))
+                        fim = inicio.advance(1, 'day')
+                        periodo, sufixo, chave_janela = data_cena.strftime('%d/%m/%Y'), data_cena.strftime('%d_%m_%Y'), data_cena.isoformat()
+                    else:
+                        inicio = ee.Date.fromYMD(ano, mes, 1)
+                        fim = inicio.advance(1, 'month')
+                        periodo, sufixo, chave_janela = f"{mes}/{ano}", f"{mes}_{ano}", f"{ano}-{mes:02d}"
+
                     coll = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
                         .filterBounds(region_viz)
-                        .filterDate(f'{ano}-{mes:02d}-01', f'{ano}-{mes:02d}-28')
+                        .filterDate(inicio, fim)
                         .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_nuvens)))
 
-                    if coll.size().getInfo() > 0:
-                        img = coll.median().clip(region_viz)
-                        vis, nome_camada = {}, ""
-                        download_bands = []
-
-                        # Configuração das Bandas
-                        if tipo_visualizacao == "RGB":
-                            vis = {'min': 0, 'max': 3000, 'bands': ['B4', 'B3', 'B2']}
-                            nome_camada = f"RGB {mes}/{ano}"
-                            download_bands = ['B4', 'B3', 'B2']
-                            type_suffix = "RGB"
-                            
-                        elif tipo_visualizacao == "Falsa Cor":
-                            vis = {'min': 0, 'max': 3000, 'bands': ['B8', 'B4', 'B3']}
-                            nome_camada = f"Falsa Cor {mes}/{ano}"
-                            download_bands = ['B8', 'B4', 'B3']
-                            type_suffix = "FalsaCor"
-                            
-                        elif tipo_visualizacao == "NDVI":
-                            img = img.normalizedDifference(['B8', 'B4']).rename('NDVI')
-                            vis = {'min': 0, 'max': 0.8, 'palette': ['#d73027', '#f46d43', '#fdae61', '#fee08b', '#d9ef8b', '#a6d96a', '#66bd63', '#1a9850']}
-                            nome_camada = f"NDVI {mes}/{ano}"
-                            download_bands = ['NDVI']
-                            type_suffix = "NDVI"
-                            
-                            # Stats
-                            stats = img.reduceRegion(ee.Reducer.mean(), geometry, 30, crs='EPSG:4326', maxPixels=1e9).getInfo()
-                            val = stats['NDVI'] if stats['NDVI'] else 0
-                            cor = "#2ecc71" if val > 0.6 else "#f1c40f" if val > 0.3 else "#e74c3c"
-                            st.session_state['ndvi_stats'] = f"""<div style="position: fixed; bottom: 30px; right: 10px; z-index:9999; background: white; padding: 10px 20px; border-radius: 8px; box-shadow: 0 2px 6px rgba(0,0,0,0.3); font-family: sans-serif; text-align: center;"><div style="font-size: 12px; color: #555;">Vigor M&eacute;dio ({mes}/{ano})</div><div style="font-size: 20px; font-weight: bold; color: {cor};">{val:.2f}</div></div>"""
-                            grad = f"linear-gradient(to right, {', '.join(vis['palette'])})"
-                            st.session_state['ndvi_colorbar'] = f"""<div style="position: fixed; bottom: 30px; left: 10px; z-index:9999; background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 6px rgba(0,0,0,0.3); font-family: sans-serif;"><div style="font-size: 12px; color: #555; text-align: center; margin-bottom: 4px;">NDVI</div><div style="height: 12px; width: 150px; background: {grad}; border-radius: 4px;"></div><div style="display: flex; justify-content: space-between; font-size: 10px; color: #555; margin-top: 4px;"><span>Solo</span><span>Vigor</span></div></div>"""
+                    n_cenas = coll.size()
+                    # Uma composição com todas as bandas e índices: trocar o tipo não recalcula nada
+                    comp = composicao_indices(coll.median()).clip(region_viz)
 
+                    # Valores necessários juntos -> um único ee.Dictionary
+                    resultados = gee_lote.avaliar_lote({
+                        'n': n_cenas,
+                        'bbox': region_viz.bounds(1).coordinates(),
+                        'stats': ee.Algorithms.If(n_cenas.gt(0), stats_indices(comp, geometry), None)
+                    })
+
+                    if resultados['n'] > 0:
                         # --- CONSTRUÇÃO DO NOME DO ARQUIVO ---
                         raw_source = st.session_state.get('source_name', 'Imovel')
                         
@@ -112,54 +469,50 @@ def render_tab():
                             file_prefix = clean_name.replace(" ", "_")
                         else:
                             file_prefix = "Sentinel"
-                            
-                        # Nome Final: {Prefixo}_{Tipo}_{Mes}_{Ano}
-                        filename_final = f"{file_prefix}_{type_suffix}_{mes}_{ano}"
 
-                        # --- GERAÇÃO DO LINK DE DOWNLOAD ---
-                        img_download = img.select(download_bands)
-                        
-                        params_download = {
-                            'name': filename_final, # Nome que aparecerá no download
-                            'scale': 10,
-                            'crs': 'EPSG:4326',
-                            'region': region_viz, 
-                            'format': 'GEO_TIFF',
-                            'maxPixels': 1e9
-                        }
-                        
-                        url = img_download.getDownloadURL(params_download)
-                        
                         st.session_state['camada_preview'] = {
-                            'ee_object': img, 
-                            'vis_params': vis, 
-                            'name': nome_camada, 
-                            'type': tipo_visualizacao,
-                            'download_url': url,
-                            'filename': filename_final # Salva nome para usar no botão
+                            'ee_object': comp, 
+                            # Chave da composição: geometria + janela + buffer + nuvens
+                            'cache_id': f"{utils.fingerprint_geometria(geometry)}|{chave_janela}|{buffer_metros}m|{max_nuvens}%",
+                            'periodo': periodo,
+                            'sufixo_arquivo': sufixo,
+                            'file_prefix': file_prefix,
+                            'stats': resultados['stats'] or {},
+                            'region': region_viz,
+                            'bbox': bbox_anel(resultados['bbox'])
                         }
                     else: 
-                        st.warning(f"☁️ Nenhuma imagem encontrada em {mes}/{ano} com menos de {max_nuvens}% de nuvens.")
+                        st.warning(f"☁️ Nenhuma imagem encontrada em {periodo} com menos de {max_nuvens}% de nuvens. Consulte o 🗓️ Catálogo de Cenas.")
                 except Exception as e: 
                     st.error(f"Erro GEE: {e}")
 
         # RENDER LAYERS
-        for c in st.session_state['camadas_fixas']: 
-            m.add_layer(c['ee_object'], c['vis_params'], c['name'])
+        # (Tiles em cache: re-render não dispara getMapId nem recalcula a mediana)
+        camadas_mapa = [
+            (c['name'], utils.url_camada_gee(c['ee_object'], c['vis_params'], c['cache_id']))
+            for c in st.session_state['camadas_fixas']
+        ]
+        extras_html = []
             
         if st.session_state['camada_preview']:
             prev = st.session_state['camada_preview']
-            m.add_layer(prev['ee_object'], prev['vis_params'], "* " + prev['name'])
+            camada = camada_visual(prev, tipo_visualizacao)
+            cfg = TIPOS_VISUALIZACAO[tipo_visualizacao]
+            camadas_mapa.append(("* " + camada['name'], utils.url_camada_gee(camada['ee_object'], camada['vis_params'], camada['cache_id'])))
             
-            if prev.get('type') == "NDVI":
-                if st.session_state['ndvi_colorbar']: m.add_html(st.session_state['ndvi_colorbar'])
-                if st.session_state['ndvi_stats']: m.add_html(st.session_state['ndvi_stats'])
+            if cfg.get('indice'):
+                extras_html.append(html_colorbar(cfg))
+                val = prev['stats'].get(f"{cfg['indice']}_mean")
+                if val is not None: extras_html.append(html_stats(cfg, val, prev['periodo']))
 
-            if prev.get('download_url'):
+            filename = f"{prev['file_prefix']}_{cfg['sufixo']}_{prev['sufixo_arquivo']}"
+            download_url = obter_url_download(prev['ee_object'], camada['cache_id'], json.dumps(cfg['download']), filename, prev['region'])
+
+            if download_url:
                 # Botão de Download com o nome correto
                 st.markdown(f"""
                     <div style="text-align: center; margin-bottom: 10px;">
-                        <a href="{prev['download_url']}" target="_blank" style="text-decoration: none;">
+                        <a href="{download_url}" target="_blank" style="text-decoration: none;">
                             <button style="
                                 background-color: #2c3e50; 
                                 color: white; 
@@ -170,22 +523,226 @@ def render_tab():
                                 font-weight: 600;
                                 box-shadow: 0 2px 4px rgba(0,0,0,0.2);
                                 transition: background-color 0.2s;">
-                                📥 Baixar TIFF ({prev.get('filename', 'imagem')}.tif)
+                                📥 Baixar TIFF ({filename}.tif)
                             </button>
                         </a>
                     </div>
                 """, unsafe_allow_html=True)
 
+            # Exportação local em tiles: não depende do limite de tamanho do getDownloadURL
+            if prev.get('bbox'):
+                c_cog, c_dl = st.columns(2)
+                with c_cog:
+                    if st.button("🧩 Gerar GeoTIFF Completo (COG)", use_container_width=True):
+                        barra = st.progress(0.0, text="Dividindo em tiles...")
+                        cog_bytes, erro = exportacao_raster.exportar_cog(
+                            prev['ee_object'], cfg['download'], prev['bbox'],
+                            escala_m=10, dtype='float32' if cfg.get('indice') else 'uint16',
+                            progresso=lambda f, t: barra.progress(min(f, 1.0), text=t)
+                        )
+                        barra.empty()
+                        if erro: st.error(f"Erro na exportação: {erro}")
+                        else: st.session_state['cog_bytes'] = (filename, cog_bytes)
+                with c_dl:
+                    cog = st.session_state.get('cog_bytes')
+                    if cog and cog[0] == filename:
+                        st.download_button(f"📥 {cog[0]}_COG.tif", data=cog[1], file_name=f"{cog[0]}_COG.tif", mime="image/tiff", use_container_width=True)
+
+        # Camadas da detecção de mudança (URLs em cache por chave da análise)
+        mudanca = st.session_state.get('mudanca')
+        if mudanca and mudanca.get('no_mapa'):
+            p = mudanca['params']
+            _, _, diff, classes = imagens_mudanca(geometry, p['data_a'], p['data_b'], p['dias'], p['max_nuvens'], p['limiar'])
+            camadas_mapa.append(("Δ NDVI", utils.url_camada_gee(diff, VIS_DIFF, f"{mudanca['cache_id']}|diff")))
+            camadas_mapa.append(("Perda / Ganho", utils.url_camada_gee(classes.selfMask(), VIS_CLASSES_MUDANCA, f"{mudanca['cache_id']}|classes")))
+
+        fingerprint = utils.fingerprint_geometria(geometry)
         empty = ee.Image().byte()
         outline = empty.paint(ee.FeatureCollection(geometry), 1, 2)
-        m.add_layer(outline, {'palette': 'FF0000'}, "📍 Limite Oficial")
-        m.add_layer_control()
+        camadas_mapa.append(("📍 Limite Oficial", utils.url_camada_gee(outline, {'palette': 'FF0000'}, f"{fingerprint}|contorno")))
+
+        def construir_mapa():
+            m = geemap.Map(center=[-14, -50], zoom=4, draw_control=False, scale_control=True)
+            m.add_basemap("HYBRID")
+            m.centerObject(geometry, 13)
+            for nome, url in camadas_mapa:
+                m.add_tile_layer(url=url, name=nome, attribution="Google Earth Engine")
+            for html in extras_html:
+                m.add_html(html)
+            m.add_layer_control()
+            return m
 
-        with io.BytesIO() as buffer:
-            m.save(buffer, close_file=False)
-            map_html = buffer.getvalue().decode('utf-8')
-        st.components.v1.html(map_html, height=650, scrolling=False)
+        # Mapa só é reconstruído/reenviado quando o estado das camadas muda
+        chave_mapa = json.dumps(["sentinel", fingerprint, camadas_mapa, extras_html])
+        utils.exibir_mapa(chave_mapa, construir_mapa, height=650, scrolling=False)
         
         if st.button("🗑️ Limpar Mapa"):
             utils.limpar_tudo()
-            st.rerun()
\ No newline at end of file
+            st.rerun()
+
+    # --- SÉRIE TEMPORAL (1 round-trip para toda a série) ---
+    with st.expander("📈 Série Temporal NDVI (2020 - Hoje)"):
+        if st.button("Gerar Série Temporal", use_container_width=True):
+            with st.spinner("Calculando série mensal no GEE..."):
+                df_serie = get_serie_ndvi(geometry, utils.fingerprint_geometria(geometry), max_nuvens)
+            if not df_serie.empty:
+                st.session_state['ndvi_serie'] = df_serie
+            else:
+                st.error(f"Erro GEE: {st.session_state.get('erro_ndvi_serie', 'Sem dados.')}")
+
+        if st.session_state.get('ndvi_serie') is not None:
+            df = st.session_state['ndvi_serie']
+            st.plotly_chart(grafico_serie_ndvi(df), use_container_width=True)
+            st.caption(f"Composições mensais Sentinel-2 (nuvens < {max_nuvens}% e máscara SCL). Meses sem cena aparecem como lacunas.")
+
+    # --- HISTÓRICO LONGO (Landsat 5/7/8/9 + Sentinel-2, blocos anuais em paralelo) ---
+    with st.expander(f"🛰️ Histórico Longo NDVI ({serie_longa.ANO_INICIAL} - Hoje, Landsat + Sentinel-2)"):
+        fp_longo = utils.fingerprint_geometria(geometry)
+        if st.button("Atualizar Histórico", use_container_width=True):
+            with st.status("Consultando Landsat e Sentinel-2...", expanded=False) as status:
+                df_longo, erros = serie_longa.atualizar_serie(
+                    geometry, fp_longo, max_nuvens, progresso=status.write
+                )
+                status.update(label="Histórico atualizado.", state="error" if erros else "complete")
+            if erros:
+                st.warning(f"Anos com falha (serão buscados de novo na próxima vez): {', '.join(map(str, sorted(erros)))}")
+            st.session_state['ndvi_serie_longa'] = df_longo
+
+        df_longo = st.session_state.get('ndvi_serie_longa')
+        if df_longo is None:
+            df_longo = serie_longa.carregar_serie(fp_longo, max_nuvens)
+
+        if not df_longo.empty:
+            fig = grafico_serie_ndvi(df_longo)
+            fig.add_vline(x=f"{serie_longa.ANO_CODIGO_FLORESTAL}-07-22", line=dict(color="#e74c3c", width=2, dash="dash"))
+            fig.add_annotation(x=f"{serie_longa.ANO_CODIGO_FLORESTAL}-07-22", y=1, yref="y", text="Marco Código Florestal", showarrow=False, font=dict(color="#e74c3c"), xanchor="left")
+            st.plotly_chart(fig, use_container_width=True)
+            ultimo = df_longo['Data'].max()
+            st.caption(f"Composições mensais harmonizadas (nuvens < {max_nuvens}%), armazenadas até {ultimo:%m/%Y}. Novas consultas buscam apenas os meses ainda não consolidados.")
+        else:
+            st.caption("Nenhum histórico armazenado para este imóvel. A primeira consulta pode levar alguns minutos.")
+
+    # --- NDVI POR TALHÃO (1 reduceRegions para todos os talhões) ---
+    talhoes = st.session_state.get('talhoes') or []
+    if len(talhoes) > 1:
+        with st.expander(f"🌱 NDVI por Talhão ({len(talhoes)} talhões) - {mes}/{ano}"):
+            if st.button("Calcular NDVI dos Talhões", use_container_width=True):
+                with st.spinner("Calculando estatísticas por talhão..."):
+                    cache_talhoes = f"{utils.fingerprint_geometria(geometry)}|{len(talhoes)}"
+                    df_talhoes = get_ndvi_talhoes(talhoes, cache_talhoes, ano, mes, max_nuvens)
+                if not df_talhoes.empty:
+                    st.session_state['ndvi_talhoes'] = (f"{mes}/{ano}", df_talhoes)
+                else:
+                    st.warning(st.session_state.get('erro_ndvi_talhoes') or f"☁️ Nenhuma imagem encontrada em {mes}/{ano} com menos de {max_nuvens}% de nuvens.")
+
+            if st.session_state.get('ndvi_talhoes'):
+                periodo, df = st.session_state['ndvi_talhoes']
+                st.caption(f"Ranking de vigor dos talhões em {periodo}")
+                st.dataframe(
+                    df,
+                    column_config={
+                        "Área (ha)": st.column_config.NumberColumn("Área (ha)", format="%.2f"),
+                        "NDVI Médio": st.column_config.ProgressColumn("NDVI Médio", format="%.2f", min_value=0, max_value=1),
+                        "Desvio": st.column_config.NumberColumn("Desvio", format="%.3f"),
+                        "Distribuição": st.column_config.BarChartColumn("Histograma (0 - 1)", y_min=0)
+                    },
+                    use_container_width=True, hide_index=True
+                )
+
+    # --- DETECÇÃO DE MUDANÇA (2 datas, áreas em 1 round-trip) ---
+    with st.expander("🔀 Detecção de Mudança (Antes x Depois)"):
+        c_a, c_b, c_j, c_l = st.columns(4)
+        with c_a: data_a = st.date_input("Antes (início)", value=datetime(ano_atual - 1, mes_atual, 1), format="DD/MM/YYYY", key="mud_data_a")
+        with c_b: data_b = st.date_input("Depois (início)", value=datetime(ano_atual, mes_atual, 1), format="DD/MM/YYYY", key="mud_data_b")
+        with c_j: dias = st.number_input("Janela (dias)", 10, 120, 30, step=5, key="mud_dias")
+        with c_l: limiar = st.number_input("Limiar ΔNDVI", 0.05, 0.5, 0.15, step=0.05, key="mud_limiar")
+
+        if st.button("Detectar Mudança", use_container_width=True):
+            params = {'data_a': data_a, 'data_b': data_b, 'dias': int(dias), 'max_nuvens': max_nuvens, 'limiar': float(limiar)}
+            cache_mudanca = f"{utils.fingerprint_geometria(geometry)}|{data_a}|{data_b}|{int(dias)}d|{max_nuvens}%|{limiar:.2f}"
+            with st.spinner("Comparando composições..."):
+                res = get_mudanca_ndvi(geometry, cache_mudanca, **params)
+            if 'erro' in res:
+                st.error(f"Erro GEE: {res['erro']}")
+            elif not res.get('areas'):
+                st.warning(f"☁️ Sem imagens válidas em uma das janelas (antes: {res['cenas_a']} cenas, depois: {res['cenas_b']} cenas).")
+            else:
+                st.session_state['mudanca'] = {'params': params, 'cache_id': cache_mudanca, 'res': res, 'no_mapa': True}
+                st.rerun()
+
+        mudanca = st.session_state.get('mudanca')
+        if mudanca:
+            res = mudanca['res']
+            areas = res['areas']
+            total = sum(v or 0 for v in areas.values()) or 1
+            fmt = lambda v: f"{(v or 0):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("🔴 Perda", f"{fmt(areas.get('perda'))} ha", f"{100 * (areas.get('perda') or 0) / total:.1f}%", delta_color="off")
+            m2.metric("🟢 Ganho", f"{fmt(areas.get('ganho'))} ha", f"{100 * (areas.get('ganho') or 0) / total:.1f}%", delta_color="off")
+            m3.metric("⚪ Estável", f"{fmt(areas.get('estavel'))} ha")
+            m4.metric("Δ NDVI médio", f"{(res.get('dndvi_medio') or 0):+.3f}")
+            st.caption(f"Cenas usadas: {res['cenas_a']} (antes) e {res['cenas_b']} (depois). Perda/ganho = |ΔNDVI| > {mudanca['params']['limiar']:.2f}.")
+
+            no_mapa = st.toggle("Mostrar camadas no mapa", value=mudanca.get('no_mapa', True), key="mud_no_mapa")
+            if no_mapa != mudanca.get('no_mapa'):
+                mudanca['no_mapa'] = no_mapa
+                st.rerun()
+
+    # --- TIME-LAPSE (quadros em paralelo, cache por imóvel/período) ---
+    with st.expander("🎞️ Time-lapse do Imóvel"):
+        c_g, c_i, c_t = st.columns(3)
+        with c_g: granularidade = st.radio("Período", list(timelapse.GRANULARIDADES), horizontal=True, key="tl_gran")
+        anos_tl = list(range(timelapse.ANO_INICIAL_S2, ano_atual + 1))
+        with c_i: ano_ini_tl = st.selectbox("A partir de", anos_tl, index=max(0, len(anos_tl) - 6), key="tl_ano_ini")
+        with c_t: tipo_tl = st.selectbox("Visualização", list(TIPOS_VISUALIZACAO), key="tl_tipo")
+
+        c_fps, c_rot, c_fmt = st.columns(3, vertical_alignment="bottom")
+        with c_fps: fps = st.slider("Quadros/s", 0.5, 5.0, 1.0, step=0.5, key="tl_fps")
+        with c_rot: com_rotulos = st.checkbox("Rótulo de data", value=True, key="tl_rotulos")
+        with c_fmt: formato_tl = st.radio("Formato", ["GIF", "MP4"], horizontal=True, key="tl_formato")
+
+        if st.button("Gerar Time-lapse", use_container_width=True):
+            fp = utils.fingerprint_geometria(geometry)
+            periodos = timelapse.periodos_timelapse(ano_ini_tl, ano_atual, granularidade)
+            prefixo = f"{fp}|{buffer_metros}m|{max_nuvens}%|{tipo_tl}"
+            cache = st.session_state.setdefault('quadros_timelapse', {})
+            regiao = geometry.buffer(buffer_metros)
+
+            try:
+                # Quadros já baixados (mesmo imóvel/período) não voltam ao GEE
+                faltantes = {
+                    f"{prefixo}|{pid}": quadro_timelapse(regiao, ini, fim, max_nuvens, tipo_tl)
+                    for pid, _, ini, fim in periodos if f"{prefixo}|{pid}" not in cache
+                }
+                if faltantes:
+                    with st.spinner(f"Baixando {len(faltantes)} quadros em paralelo..."):
+                        chave_bbox = f"{fp}|{buffer_metros}m|bbox"
+                        if chave_bbox not in cache:
+                            cache[chave_bbox] = bbox_anel(regiao.bounds(1).coordinates().getInfo())
+                        quadros, erros = timelapse.baixar_quadros(faltantes, cache[chave_bbox])
+                    cache.update(quadros)
+                    if erros:
+                        st.warning(f"{len(erros)} período(s) sem imagem válida foram ignorados.")
+
+                validos = [(rot, cache[f"{prefixo}|{pid}"]) for pid, rot, _, _ in periodos if f"{prefixo}|{pid}" in cache]
+                st.session_state['timelapse'] = {'quadros': validos, 'nome': f"timelapse_{tipo_tl}_{granularidade}".replace(" ", "")}
+            except Exception as e:
+                st.error(f"Erro GEE: {e}")
+
+        dados_tl = st.session_state.get('timelapse')
+        if dados_tl and dados_tl['quadros']:
+            # Codificação é local: mudar fps/rótulos/formato não refaz o download
+            rotulos = [r for r, _ in dados_tl['quadros']] if com_rotulos else None
+            pngs = [q for _, q in dados_tl['quadros']]
+            montar, mime = (timelapse.montar_gif, "image/gif") if formato_tl == "GIF" else (timelapse.montar_mp4, "video/mp4")
+            dados, erro = montar(pngs, fps, rotulos)
+
+            if erro:
+                st.error(f"Erro ao gerar {formato_tl}: {erro}")
+            elif dados:
+                if formato_tl == "GIF": st.image(dados, use_container_width=True)
+                else: st.video(dados)
+                st.download_button(
+                    f"⬇️ Baixar {formato_tl} ({len(pngs)} quadros)", dados,
+                    file_name=f"{dados_tl['nome']}.{formato_tl.lower()}", mime=mime, use_container_width=True
+                )
@@ -0,0 +1,191 @@
+import os
+from datetime import date
+
+import ee
+import pandas as pd
+
+import gee_lote
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+ANO_INICIAL = 1985
+ANO_CODIGO_FLORESTAL = 2008
+
+# Série armazenada por imóvel (um parquet por fingerprint da geometria)
+PASTA_SERIES = os.path.join("dados", "series_ndvi")
+
+# Meses mais recentes que isso ainda recebem cenas novas (latência do Landsat C2)
+DIAS_ATE_CONSOLIDAR = 60
+
+# Um ano por requisição: 12 reduções de mediana cabem com folga nos limites do EE
+MAX_WORKERS_ANOS = 6
+
+# Landsat C2 L2: (coleção, banda vermelho, banda NIR). filterDate descarta sozinho
+# os sensores fora de operação no ano pedido.
+LANDSAT = [
+    ('LANDSAT/LT05/C02/T1_L2', 'SR_B3', 'SR_B4'),
+    ('LANDSAT/LE07/C02/T1_L2', 'SR_B3', 'SR_B4'),
+    ('LANDSAT/LC08/C02/T1_L2', 'SR_B4', 'SR_B5'),
+    ('LANDSAT/LC09/C02/T1_L2', 'SR_B4', 'SR_B5'),
+]
+
+# Roy et al. (2016): ETM+/TM -> OLI (vermelho, NIR), OLI = ganho * ETM + offset
+HARMONIZACAO_TM = {'ganho': [0.9047, 0.8462], 'offset': [0.0061, 0.0412]}
+
+COLUNAS = {'NDVI_mean': 'Média', 'NDVI_p50': 'Mediana', 'NDVI_p10': 'P10',
+           'NDVI_p25': 'P25', 'NDVI_p75': 'P75', 'NDVI_p90': 'P90'}
+
+# ==========================================
+# 1. COLEÇÃO HARMONIZADA (LANDSAT + SENTINEL-2)
+# ==========================================
+
+def _ndvi_landsat(banda_red, banda_nir):
+    oli = banda_nir == 'SR_B5'
+
+    def preparar(img):
+        qa = img.select('QA_PIXEL')
+        # Bits: 1 nuvem dilatada, 3 nuvem, 4 sombra, 5 neve
+        limpo = qa.bitwiseAnd(0b111010).eq(0)
+        refl = img.select([banda_red, banda_nir]).multiply(0.0000275).add(-0.2)
+        if not oli:
+            refl = refl.multiply(HARMONIZACAO_TM['ganho']).add(HARMONIZACAO_TM['offset'])
+        return (refl.normalizedDifference([banda_nir, banda_red]).rename('NDVI')
+                .updateMask(limpo)
+                .copyProperties(img, ['system:time_start']))
+    return preparar
+
+def _ndvi_sentinel(img):
+    scl = img.select('SCL')
+    limpo = scl.neq(3).And(scl.neq(8)).And(scl.neq(9)).And(scl.neq(10))
+    return (img.normalizedDifference(['B8', 'B4']).rename('NDVI')
+            .updateMask(limpo)
+            .copyProperties(img, ['system:time_start']))
+
+def colecao_ndvi(geometry, inicio, fim, max_nuvens):
+    """NDVI de todos os sensores disponíveis em [inicio, fim), numa só coleção."""
+    colecoes = []
+    for nome, red, nir in LANDSAT:
+        colecoes.append(
+            ee.ImageCollection(nome)
+            .filterBounds(geometry)
+            .filterDate(inicio, fim)
+            .filter(ee.Filter.lt('CLOUD_COVER', max_nuvens))
+            .map(_ndvi_landsat(red, nir))
+        )
+    colecoes.append(
+        ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+        .filterBounds(geometry)
+        .filterDate(inicio, fim)
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_nuvens))
+        .map(_ndvi_sentinel)
+    )
+    unida = colecoes[0]
+    for c in colecoes[1:]:
+        unida = unida.merge(c)
+    return unida
+
+# ==========================================
+# 2. EXTRAÇÃO POR BLOCOS ANUAIS
+# ==========================================
+
+def _bloco_ano(geometry, ano, mes_ini, mes_fim, max_nuvens):
+    """FeatureCollection com as estatísticas mensais de um ano (meses mes_ini..mes_fim)."""
+    inicio = ee.Date.fromYMD(ano, mes_ini, 1)
+    ndvi = colecao_ndvi(geometry, inicio, ee.Date.fromYMD(ano, mes_fim, 1).advance(1, 'month'), max_nuvens)
+    redutor = ee.Reducer.mean().combine(ee.Reducer.percentile([10, 25, 50, 75, 90]), sharedInputs=True)
+
+    def stats_mes(k):
+        data_ini = inicio.advance(ee.Number(k), 'month')
+        do_mes = ndvi.filterDate(data_ini, data_ini.advance(1, 'month'))
+        base = {'data': data_ini.format('YYYY-MM'), 'cenas': do_mes.size()}
+        stats = do_mes.median().reduceRegion(
+            reducer=redutor, geometry=geometry, scale=30,
+            maxPixels=1e9, bestEffort=True, tileScale=4
+        )
+        return ee.Algorithms.If(
+            do_mes.size().gt(0),
+            ee.Feature(None, stats).set(base),
+            ee.Feature(None, base)
+        )
+
+    return ee.FeatureCollection(ee.List.sequence(0, mes_fim - mes_ini).map(stats_mes))
+
+def _para_dataframe(features):
+    linhas = []
+    for f in features:
+        p = f['properties']
+        linha = {'Data': pd.to_datetime(p['data']), 'Cenas': int(p.get('cenas', 0))}
+        for chave, nome in COLUNAS.items():
+            linha[nome] = p.get(chave)
+        linhas.append(linha)
+    return pd.DataFrame(linhas, columns=['Data', 'Cenas', *COLUNAS.values()])
+
+# ==========================================
+# 3. ARMAZENAMENTO INCREMENTAL
+# ==========================================
+
+def _caminho(fingerprint, max_nuvens):
+    return os.path.join(PASTA_SERIES, f"{fingerprint}_{max_nuvens}.parquet")
+
+def carregar_serie(fingerprint, max_nuvens):
+    """Série já armazenada do imóvel (DataFrame vazio se ainda não existe)."""
+    caminho = _caminho(fingerprint, max_nuvens)
+    if not os.path.exists(caminho):
+        return pd.DataFrame(columns=['Data', 'Cenas', *COLUNAS.values(), 'Consolidado'])
+    return pd.read_parquet(caminho)
+
+def _salvar_serie(df, fingerprint, max_nuvens):
+    os.makedirs(PASTA_SERIES, exist_ok=True)
+    caminho = _caminho(fingerprint, max_nuvens)
+    temporario = f"{caminho}.tmp"
+    df.to_parquet(temporario, index=False)
+    os.replace(temporario, caminho)
+
+def blocos_pendentes(df, ano_inicial=ANO_INICIAL, hoje=None):
+    """
+    Lista (ano, mes_ini, mes_fim) que ainda precisam ir ao GEE.
+    Meses consolidados já armazenados nunca são buscados de novo.
+    """
+    hoje = hoje or date.today()
+    consolidados = set(df.loc[df['Consolidado'].astype(bool), 'Data'].dt.strftime('%Y-%m')) if not df.empty else set()
+
+    blocos = []
+    for ano in range(ano_inicial, hoje.year + 1):
+        ultimo_mes = hoje.month if ano == hoje.year else 12
+        faltantes = [m for m in range(1, ultimo_mes + 1) if f"{ano}-{m:02d}" not in consolidados]
+        if faltantes:
+            blocos.append((ano, faltantes[0], faltantes[-1]))
+    return blocos
+
+def atualizar_serie(geometry, fingerprint, max_nuvens, ano_inicial=ANO_INICIAL,
+                    progresso=None, max_workers=MAX_WORKERS_ANOS):
+    """
+    Completa a série armazenada buscando só os meses que faltam.
+    Cada ano é uma requisição independente; os anos rodam em paralelo.
+    Retorna (DataFrame da série, {ano: erro}).
+    """
+    hoje = date.today()
+    df = carregar_serie(fingerprint, max_nuvens)
+    blocos = blocos_pendentes(df, ano_inicial, hoje)
+    if not blocos:
+        return df, {}
+
+    if progresso: progresso(f"Buscando {len(blocos)} ano(s) em paralelo...")
+    tarefas = {ano: _bloco_ano(geometry, ano, m_ini, m_fim, max_nuvens) for ano, m_ini, m_fim in blocos}
+    resultados, erros = gee_lote.avaliar_paralelo(tarefas, max_workers=max_workers)
+
+    novos = [_para_dataframe(fc['features']) for fc in resultados.values()]
+    if novos:
+        limite = pd.Timestamp(hoje) - pd.Timedelta(days=DIAS_ATE_CONSOLIDAR)
+        novos = pd.concat(novos, ignore_index=True)
+        # Mês consolidado = terminou há mais de DIAS_ATE_CONSOLIDAR dias
+        novos['Consolidado'] = (novos['Data'] + pd.offsets.MonthBegin(1)) <= limite
+
+        df = pd.concat([df[~df['Data'].isin(novos['Data'])], novos], ignore_index=True)
+        df['Data'] = pd.to_datetime(df['Data'])
+        df = df.sort_values('Data').reset_index(drop=True)
+        _salvar_serie(df, fingerprint, max_nuvens)
+
+    return df, erros
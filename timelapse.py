@@ -0,0 +1,153 @@
+import io
+from datetime import date
+
+import ee
+from PIL import Image, ImageDraw, ImageFont
+
+import gee_lote
+
+# imageio (+ ffmpeg) é opcional: sem ele a aba oferece apenas o GIF
+try:
+    import imageio.v3 as iio
+    import numpy as np
+except ImportError:
+    iio = None
+
+# ==========================================
+# 0. CONFIGURAÇÕES
+# ==========================================
+
+# Sentinel-2 SR harmonizado tem cobertura global a partir de 2017
+ANO_INICIAL_S2 = 2017
+
+LARGURA_QUADRO = 768
+MAX_WORKERS_QUADROS = 6
+
+GRANULARIDADES = {
+    "Anual": 12,
+    "Trimestral": 3,
+}
+
+# ==========================================
+# 1. PERÍODOS
+# ==========================================
+
+def periodos_timelapse(ano_ini, ano_fim, granularidade="Anual"):
+    """
+    Lista os períodos do time-lapse como (id, rótulo, início, fim).
+    O id é estável e entra na chave do cache de cada quadro.
+    """
+    passo = GRANULARIDADES[granularidade]
+    hoje = date.today()
+    periodos = []
+    for ano in range(ano_ini, ano_fim + 1):
+        for mes in range(1, 13, passo):
+            inicio = date(ano, mes, 1)
+            if inicio > hoje: break
+            if passo == 12:
+                periodos.append((f"{ano}", f"{ano}", inicio, date(ano + 1, 1, 1)))
+            else:
+                tri = (mes - 1) // 3 + 1
+                fim = date(ano + 1, 1, 1) if mes + passo > 12 else date(ano, mes + passo, 1)
+                periodos.append((f"{ano}-T{tri}", f"{tri}º Tri {ano}", inicio, fim))
+    return periodos
+
+# ==========================================
+# 2. DOWNLOAD DOS QUADROS (PARALELO)
+# ==========================================
+
+def dimensoes_quadro(bbox, largura=LARGURA_QUADRO):
+    """Mantém a proporção do retângulo (oeste, sul, leste, norte) em graus."""
+    oeste, sul, leste, norte = bbox
+    altura = max(1, round(largura * (norte - sul) / max(leste - oeste, 1e-9)))
+    return largura, altura
+
+def _baixar_quadro(imagem_visual, bbox, largura, altura):
+    """Busca um quadro PNG (bytes) via computePixels, sem passar por URL."""
+    oeste, sul, leste, norte = bbox
+    return ee.data.computePixels({
+        'expression': imagem_visual,
+        'fileFormat': 'PNG',
+        'grid': {
+            'dimensions': {'width': largura, 'height': altura},
+            'affineTransform': {
+                'scaleX': (leste - oeste) / largura, 'shearX': 0, 'translateX': oeste,
+                'shearY': 0, 'scaleY': -(norte - sul) / altura, 'translateY': norte
+            },
+            'crsCode': 'EPSG:4326'
+        }
+    })
+
+def baixar_quadros(imagens, bbox, largura=LARGURA_QUADRO, max_workers=MAX_WORKERS_QUADROS):
+    """
+    Baixa vários quadros ao mesmo tempo (no máximo max_workers requisições).
+    imagens: dict {chave: ee.Image visualizada}.
+    Retorna (quadros {chave: png_bytes}, erros {chave: exceção}).
+    """
+    largura, altura = dimensoes_quadro(bbox, largura)
+    tarefas = {
+        chave: (lambda img=img: _baixar_quadro(img, bbox, largura, altura))
+        for chave, img in imagens.items()
+    }
+    return gee_lote.avaliar_paralelo(tarefas, max_workers=max_workers)
+
+# ==========================================
+# 3. ANIMAÇÃO (LOCAL)
+# ==========================================
+
+def _fonte(tamanho):
+    try:
+        return ImageFont.truetype("DejaVuSans-Bold.ttf", tamanho)
+    except OSError:
+        return ImageFont.load_default()
+
+def _preparar_quadro(png, rotulo=None):
+    """Abre o PNG, aplica fundo escuro na transparência e escreve o rótulo."""
+    img = Image.open(io.BytesIO(png)).convert("RGBA")
+    fundo = Image.new("RGBA", img.size, (20, 20, 20, 255))
+    img = Image.alpha_composite(fundo, img).convert("RGB")
+
+    if rotulo:
+        draw = ImageDraw.Draw(img)
+        fonte = _fonte(max(14, img.width // 28))
+        x0, y0, x1, y1 = draw.textbbox((10, 10), rotulo, font=fonte)
+        draw.rectangle((x0 - 6, y0 - 4, x1 + 6, y1 + 4), fill=(0, 0, 0))
+        draw.text((10, 10), rotulo, font=fonte, fill=(255, 255, 255))
+    return img
+
+def montar_gif(quadros, fps=1.0, rotulos=None):
+    """
+    Codifica o GIF a partir dos PNGs já baixados. Retorna (bytes, erro).
+    quadros: lista de png_bytes; rotulos: lista de textos (ou None).
+    """
+    rotulos = rotulos or [None] * len(quadros)
+    imagens = [_preparar_quadro(q, r) for q, r in zip(quadros, rotulos)]
+    if not imagens: return None, "Nenhum quadro."
+
+    buffer = io.BytesIO()
+    try:
+        imagens[0].save(
+            buffer, format="GIF", save_all=True, append_images=imagens[1:],
+            duration=int(1000 / fps), loop=0, optimize=True
+        )
+        return buffer.getvalue(), None
+    except Exception as e:
+        return None, str(e)
+
+def montar_mp4(quadros, fps=1.0, rotulos=None):
+    """Codifica MP4 (H.264). Retorna (bytes, erro)."""
+    if iio is None: return None, "Biblioteca imageio não instalada."
+    rotulos = rotulos or [None] * len(quadros)
+    imagens = [_preparar_quadro(q, r) for q, r in zip(quadros, rotulos)]
+    if not imagens: return None, "Nenhum quadro."
+
+    # H.264 exige dimensões pares
+    w, h = imagens[0].size
+    w, h = w - w % 2, h - h % 2
+    arrays = np.stack([np.asarray(img.crop((0, 0, w, h))) for img in imagens])
+    try:
+        dados = iio.imwrite("<bytes>", arrays, extension=".mp4", fps=fps, codec="libx264",
+                            macro_block_size=1, output_params=["-pix_fmt", "yuv420p"])
+        return dados, None
+    except Exception as e:
+        return None, str(e)
@@ -1,31 +1,32 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import ee
-import xml.etree.ElementTree as ET
 import requests
 import ssl
 import json
 import os
 import time
 import io
-import zipfile
-import shutil
-import tempfile
-import pandas as pd
-from shapely.geometry import shape, Point, mapping
+import hashlib
+import shapely
+from shapely.geometry import shape, mapping
 from requests.adapters import HTTPAdapter
 from urllib3.poolmanager import PoolManager
-from shapely.ops import transform
 
 # Tenta importar Geopandas e Fiona
 try:
     import geopandas as gpd
     import fiona
+    import exportacao
+    import leitor_kml
     # Habilita drivers KML para leitura/escrita
     fiona.drvsupport.supported_drivers['KML'] = 'rw'
     fiona.drvsupport.supported_drivers['LIBKML'] = 'rw'
 except ImportError:
     gpd = None
     fiona = None
+    exportacao = None
+    leitor_kml = None
 
 # ==========================================
 # 1. INICIALIZAÇÃO E STATE
@@ -89,8 +90,10 @@ def init_session_state():
 def limpar_analises():
     """FAXINA GERAL: Apaga todos os dados calculados."""
     keys_to_delete = [
-        'clim_temp', 'clim_rain', 'erro_clima_temp', 'erro_clima_rain', 'last_clim_source',
-        'camada_preview', 'camadas_fixas', 'ndvi_stats', 'ndvi_colorbar', 'ctx_dados'
+        'clim_temp', 'clim_rain', 'clim_chuva_anual', 'erro_clima', 'last_clim_source',
+        'camada_preview', 'camadas_fixas', 'ndvi_stats', 'ndvi_colorbar', 'ctx_dados',
+        'ndvi_serie', 'ndvi_serie_longa', 'ndvi_talhoes', 'mudanca',
+        'catalogo_cenas', 'data_cena', 'quadros_timelapse', 'timelapse'
     ]
     
     for k in keys_to_delete:
@@ -105,6 +108,7 @@ def reset_preview():
     st.session_state['camada_preview'] = None
     st.session_state['ndvi_stats'] = None
     st.session_state['ndvi_colorbar'] = None
+    st.session_state['cog_bytes'] = None
 
 # ==========================================
 # 2. CONEXÃO SEGURA (CAR/SSL)
@@ -162,229 +166,59 @@ def get_car_geometry(codigo_car):
 # ==========================================
 
 @st.cache_data
+def ler_kml_cache(kml_content):
+    """KML/KMZ (bytes) -> GeoDataFrame, lido uma vez por conteúdo."""
+    return leitor_kml.ler_kml(kml_content)
+
+def _geometria_gee(geom):
+    # GeoJSON em listas (o construtor do GEE não aceita as tuplas do shapely)
+    return ee.Geometry(json.loads(shapely.to_geojson(geom)))
+
 def processar_kml_conteudo(kml_content):
-    """Lê arquivo KML (XML) e converte para geometria Earth Engine diretamente."""
+    """Lê KML/KMZ e converte os polígonos (com furos) para geometria Earth Engine."""
     try:
-        kml_str = kml_content.decode('utf-8', errors='ignore')
-        tree = ET.fromstring(kml_str)
-        poligonos_gee = []
-        for elem in tree.iter():
-            if 'coordinates' in elem.tag and elem.text:
-                try:
-                    coords_list = []
-                    for coord in elem.text.strip().split():
-                        parts = coord.split(',')
-                        if len(parts) >= 2:
-                            coords_list.append([float(parts[0]), float(parts[1])])
-                    if len(coords_list) > 2:
-                        poligonos_gee.append(ee.Geometry.Polygon([coords_list]))
-                except: continue
-        
-        if not poligonos_gee: return None, "Sem coordenadas."
-        if len(poligonos_gee) > 1: return ee.Geometry.MultiPolygon(poligonos_gee), None
-        return poligonos_gee[0], None
+        gdf = leitor_kml.poligonos(ler_kml_cache(kml_content))
+        if gdf.empty: return None, "Nenhum polígono encontrado no arquivo."
+        partes = shapely.get_parts(gdf.geometry.values)
+        if len(partes) == 1: return _geometria_gee(partes[0]), None
+        return _geometria_gee(shapely.multipolygons(partes)), None
     except Exception as e:
         return None, str(e)
 
+def extrair_talhoes_kml(kml_content):
+    """
+    Lê cada Placemark poligonal do KML como um talhão separado.
+    Retorna lista de features GeoJSON com a propriedade 'nome'.
+    """
+    try:
+        gdf = leitor_kml.poligonos(ler_kml_cache(kml_content))
+        return [
+            {"type": "Feature", "geometry": json.loads(shapely.to_geojson(geom)),
+             "properties": {"nome": nome if isinstance(nome, str) and nome else f"Talhão {i + 1}"}}
+            for i, (nome, geom) in enumerate(zip(gdf['name'], gdf.geometry.values))
+        ]
+    except Exception:
+        return []
+
 # ==========================================
 # 4. FUNÇÕES DE SUPORTE GEOPANDAS
 # ==========================================
 
-def _force_2d(geometry):
-    """Remove a coordenada Z (altitude) das geometrias para evitar erros."""
-    if geometry.has_z:
-        return transform(lambda x, y, z: (x, y), geometry)
-    return geometry
-
 def carregar_kml_geopandas(uploaded_file):
     """
     Lê KML, KMZ ou ZIP e retorna um GeoDataFrame (GPD) consolidado com TODAS as geometrias.
-    Usa Geopandas e Fiona para processar arquivos complexos.
+    Pontos, linhas e polígonos vêm juntos, já em 2D e WGS84.
     """
     if gpd is None: return None, "Biblioteca Geopandas não instalada."
 
     try:
-        # Cria diretório temporário
-        temp_dir = tempfile.mkdtemp()
-        file_path = os.path.join(temp_dir, uploaded_file.name)
-        
-        # Salva o arquivo enviado
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-
-        target_file = file_path
-
-        # Lógica de extração para KMZ ou ZIP
-        if uploaded_file.name.lower().endswith(('.kmz', '.zip')):
-            with zipfile.ZipFile(file_path, 'r') as z:
-                # Procura por arquivo .kml dentro do zip/kmz
-                kml_filename = [n for n in z.namelist() if n.lower().endswith('.kml')]
-                if not kml_filename:
-                    return None, "Nenhum arquivo .kml encontrado dentro do pacote."
-                z.extract(kml_filename[0], temp_dir)
-                target_file = os.path.join(temp_dir, kml_filename[0])
-
-        gdfs = []
-        # Tenta listar camadas. KMLs complexos podem ter várias (ex: Pontos, Linhas, Polígonos).
-        try:
-            layers = fiona.listlayers(target_file)
-        except:
-            layers = [0] # Fallback se não conseguir listar
-
-        for layer in layers:
-            try:
-                # Lê a camada específica
-                gdf = gpd.read_file(target_file, layer=layer)
-                
-                if not gdf.empty:
-                    # Remove Z (3D) para evitar erro no GEE ou Shapefile
-                    gdf.geometry = gdf.geometry.apply(_force_2d)
-                    
-                    # Padroniza CRS para WGS84
-                    if gdf.crs is None:
-                        gdf.set_crs(epsg=4326, inplace=True)
-                    else:
-                        gdf = gdf.to_crs(epsg=4326)
-                    
-                    gdfs.append(gdf)
-            except Exception:
-                continue # Pula camadas vazias ou inválidas
-
-        if not gdfs:
+        gdf = ler_kml_cache(uploaded_file.getvalue())
+        if gdf.empty:
             return None, "Nenhuma geometria válida encontrada."
-
-        # Consolida pontos, linhas e polígonos num único GeoDataFrame
-        gdf_final = pd.concat(gdfs, ignore_index=True)
-        
-        # Limpa diretório temporário (opcional, SO limpa depois)
-        try: shutil.rmtree(temp_dir)
-        except: pass
-
-        return gdf_final, None
-
+        return gdf, None
     except Exception as e:
         return None, f"Erro ao processar arquivo: {str(e)}"
 
-# ==========================================
-# 5. DADOS DE CONTEXTO
-# ==========================================
-
-@st.cache_data
-def get_koppen_class(lat, lon):
-    caminho_arquivo = os.path.join("dados", "koppen_brasil.geojson")
-    try:
-        with open(caminho_arquivo, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        ponto = Point(lon, lat)
-        for feature in data['features']:
-            if shape(feature['geometry']).contains(ponto):
-                return feature['properties']
-    except Exception: pass
-        
-    # Fallback aproximado se não achar o arquivo
-    if lat > -10: code, desc = "Am", "Tropical de Monção"
-    elif lat > -20: code, desc = "Aw", "Tropical de Savana"
-    elif lat > -25: code, desc = "Cwa", "Subtropical Úmido (Inverno Seco)"
-    else: code, desc = "Cfa", "Subtropical Úmido"
-    return {"Classificacao": code, "Descricao": desc}
-
-@st.cache_data
-def get_ibge_context(lat, lon):
-    try:
-        session = requests.Session()
-        headers = {"User-Agent": "GeoDashboard/1.0"}
-        
-        # Geolocalização Reversa (Nominatim)
-        url_geo = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}&zoom=10"
-        try:
-            resp_geo = session.get(url_geo, headers=headers, timeout=5)
-            data_geo = resp_geo.json()
-            address = data_geo.get("address", {})
-            cidade = address.get("city") or address.get("town") or address.get("village") or address.get("municipality")
-            state_raw = address.get("ISO3166-2-lvl4", "") 
-            uf = state_raw.split("-")[1] if "-" in state_raw else "BR"
-            if not cidade: return {"erro": "Local não identificado."}
-        except: return {"erro": "Erro na geolocalização."}
-
-        # Busca Município no IBGE
-        url_loc = f"https://servicodados.ibge.gov.br/api/v1/localidades/estados/{uf}/municipios"
-        resp_loc = session.get(url_loc, timeout=5)
-        lista = resp_loc.json()
-        
-        def normalizar(s): return s.lower().replace("á","a").replace("ã","a").replace("â","a").replace("é","e").replace("í","i").replace("ó","o").replace("ú","u").replace("ç","c")
-        
-        target = normalizar(cidade)
-        municipio_alvo = next((m for m in lista if normalizar(m['nome']) == target), None)
-        if not municipio_alvo: municipio_alvo = next((m for m in lista if target in normalizar(m['nome'])), None)
-        if not municipio_alvo: return {"erro": f"Município {cidade} não encontrado."}
-        
-        cod_ibge = municipio_alvo['id']
-        nome_oficial = municipio_alvo['nome']
-
-        # População e Área
-        populacao, area_km2 = None, None
-        try:
-            r_pop = session.get(f"https://apisidra.ibge.gov.br/values/t/4714/n6/{cod_ibge}/v/93/p/last%201", timeout=5).json()
-            if len(r_pop) > 1: populacao = float(r_pop[1].get("V"))
-        except: pass
-        
-        try:
-            r_area = session.get(f"https://servicodados.ibge.gov.br/api/v3/malhas/municipios/{cod_ibge}/metadados", timeout=5).json()
-            if r_area and len(r_area) > 0: area_km2 = float(r_area[0].get("area", {}).get("dimensao"))
-        except: pass
-
-        densidade = (populacao / area_km2) if (populacao and area_km2) else None
-
-        # Regiões (Intermediária e Imediata via WFS)
-        reg_int, reg_ime = "---", "---"
-        try:
-            bbox = f"{lon-0.001},{lat-0.001},{lon+0.001},{lat+0.001}"
-            url_wfs = "https://geoservicos.ibge.gov.br/geoserver/ows"
-            p_int = {"service": "WFS", "version": "1.0.0", "request": "GetFeature", "typeName": "CGEO:RG2017_rgint", "outputFormat": "application/json", "bbox": bbox}
-            r_int = session.get(url_wfs, params=p_int, timeout=5).json()
-            if r_int.get("features"): reg_int = r_int["features"][0]["properties"].get("first_nome", "---")
-
-            p_ime = {"service": "WFS", "version": "1.0.0", "request": "GetFeature", "typeName": "CGMAT:qg_2024_110_reggeogimed_agreg", "outputFormat": "application/json", "bbox": bbox}
-            r_ime = session.get(url_wfs, params=p_ime, timeout=5).json()
-            if r_ime.get("features"): reg_ime = r_ime["features"][0]["properties"].get("nm_rgi", "---")
-        except: pass
-
-        return {
-            "municipio": nome_oficial, "uf": uf, "area_km2": area_km2, "populacao": populacao, "densidade": densidade, "codigo_ibge": cod_ibge,
-            "regiao_intermediaria": reg_int, "regiao_imediata": reg_ime
-        }
-    except Exception as e: return {"erro": str(e)}
-
-@st.cache_data
-def get_bacia_info(lat, lon):
-    try:
-        session = requests.Session()
-        url = "https://geoservicos.ibge.gov.br/geoserver/ows"
-        bbox = f"{lon-0.01},{lat-0.01},{lon+0.01},{lat+0.01}"
-        
-        # Tenta Nível 6 (Mais detalhado)
-        try:
-            r = session.get(url, params={"service": "WFS", "version": "1.0.0", "request": "GetFeature", "typeName": "CREN:bacias_nivel_6", "outputFormat": "application/json", "bbox": bbox}, timeout=6).json()
-            props = r["features"][0]["properties"] if r.get("features") else {}
-        except: props = {}
-
-        # Fallback Nível 4
-        if not props:
-            try:
-                r = session.get(url, params={"service": "WFS", "version": "1.0.0", "request": "GetFeature", "typeName": "CREN:bacias_nivel_4", "outputFormat": "application/json", "bbox": bbox}, timeout=6).json()
-                props = r["features"][0]["properties"] if r.get("features") else {}
-            except: pass
-
-        if not props: return {"erro": "Bacia não identificada."}
-
-        return {
-            "suprabacia": props.get("suprabacia", "---"),
-            "nome_bacia": props.get("nome_bacia", "---"),
-            "curso_prin": props.get("curso_prin", "---"),
-            "princ_aflu": props.get("princ_aflu", "---")
-        }
-    except Exception as e: return {"erro": str(e)}
-
 # ==========================================
 # 6. FUNÇÕES DE EXPORTAÇÃO (VETORIAL)
 # ==========================================
@@ -407,45 +241,96 @@ def convert_gee_to_gdf(gee_geometry, properties):
 def gerar_kml_bytes(gdf, nome_arquivo):
     """Gera bytes de um arquivo KML."""
     if gpd is None: return None
-    try:
-        with tempfile.NamedTemporaryFile(suffix='.kml', delete=False) as tmp:
-            gdf.to_file(tmp.name, driver='KML')
-            tmp.seek(0)
-            return tmp.read()
-    except:
-        return gdf.to_json().encode('utf-8')
+    return exportacao.gerar_kml_bytes(gdf, nome=nome_arquivo)
 
 def gerar_shapefile_zip(gdf):
     """Gera um ZIP contendo o Shapefile."""
     if gpd is None: return None
-    try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            nome_base = "imovel_car"
-            caminho_completo = os.path.join(temp_dir, nome_base + ".shp")
-            
-            # Salva o shapefile
-            gdf.to_file(caminho_completo, encoding='utf-8')
-            
-            # Zipa os arquivos gerados
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                for ext in ['.shp', '.shx', '.dbf', '.prj', '.cpg']:
-                    arquivo = nome_base + ext
-                    caminho_arq = os.path.join(temp_dir, arquivo)
-                    if os.path.exists(caminho_arq):
-                        zip_file.write(caminho_arq, arcname=arquivo)
-            
-            return zip_buffer.getvalue()
-    except Exception as e:
-        print(f"Erro SHP: {e}")
-        return None
+    return exportacao.gerar_shapefile_zip(gdf, "imovel_car")
 
 def gerar_geopackage_bytes(gdf):
     """Gera bytes de um arquivo GPKG."""
     if gpd is None: return None
-    try:
-        with tempfile.NamedTemporaryFile(suffix='.gpkg', delete=False) as tmp:
-            gdf.to_file(tmp.name, driver="GPKG")
-            tmp.seek(0)
-            return tmp.read()
-    except: return None
\ No newline at end of file
+    return exportacao.gerar_geopackage_bytes(gdf, "imovel_car")
+
+# ==========================================
+# 7. IDENTIFICAÇÃO DE GEOMETRIAS (CACHE)
+# ==========================================
+
+def fingerprint_geometria(geometry):
+    """
+    Gera uma chave curta e estável para a geometria GEE.
+    Usa a serialização local do objeto (não faz round-trip ao servidor).
+    """
+    return hashlib.sha1(geometry.serialize().encode('utf-8')).hexdigest()[:16]
+
+# ==========================================
+# 8. CACHE DE CAMADAS (TILES GEE)
+# ==========================================
+
+# Os mapids do GEE acompanham a validade do token OAuth (1 hora).
+# Expira um pouco antes para nunca servir uma URL vencida.
+TTL_TILES_GEE = 55 * 60
+
+@st.cache_data(ttl=TTL_TILES_GEE, show_spinner=False)
+def obter_url_tiles(_ee_object, cache_id, vis_json):
+    """
+    Gera (uma única vez por chave) a URL XYZ de uma camada GEE.
+    cache_id deve identificar geometria, janela de datas, nuvens e tipo da camada.
+    """
+    map_id = _ee_object.getMapId(json.loads(vis_json))
+    return map_id['tile_fetcher'].url_format
+
+def url_camada_gee(ee_object, vis_params, cache_id):
+    """URL XYZ da camada (do cache quando possível)."""
+    return obter_url_tiles(ee_object, cache_id, json.dumps(vis_params, sort_keys=True))
+
+# ==========================================
+# 9. CACHE DE MAPAS RENDERIZADOS (HTML)
+# ==========================================
+
+# Servida pelo Streamlit em /app/static/mapas (server.enableStaticServing);
+# relativa a este arquivo para não depender do diretório de execução
+PASTA_MAPAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "mapas")
+# O HTML embute URLs de tiles: vale o mesmo que elas
+IDADE_MAX_MAPAS = TTL_TILES_GEE
+
+@st.cache_data(ttl=IDADE_MAX_MAPAS, show_spinner=False, max_entries=64)
+def _html_mapa(chave, _construtor):
+    """Serializa o mapa apenas uma vez por chave de estado das camadas."""
+    m = _construtor()
+    with io.BytesIO() as buffer:
+        m.save(buffer, close_file=False)
+        return buffer.getvalue().decode('utf-8')
+
+def _limpar_mapas_antigos():
+    agora = time.time()
+    for nome in os.listdir(PASTA_MAPAS):
+        caminho = os.path.join(PASTA_MAPAS, nome)
+        try:
+            if agora - os.path.getmtime(caminho) > IDADE_MAX_MAPAS: os.remove(caminho)
+        except OSError: pass
+
+def exibir_mapa(chave, construtor, height, scrolling=False):
+    """
+    Exibe um mapa folium/geemap sem reconstruí-lo se o estado não mudou.
+    - chave: texto que descreve o estado (geometria, camadas, vis params).
+    - construtor: função sem argumentos que monta o mapa (só chamada na 1ª vez).
+    Com static serving ativo, o navegador recebe só a URL do arquivo (fica em cache
+    no browser); sem ele, o HTML em cache é enviado pelo componente.
+    """
+    chave = hashlib.sha1(chave.encode('utf-8')).hexdigest()[:20]
+
+    if st.get_option("server.enableStaticServing"):
+        caminho = os.path.join(PASTA_MAPAS, f"{chave}.html")
+        if not os.path.exists(caminho) or time.time() - os.path.getmtime(caminho) > IDADE_MAX_MAPAS:
+            os.makedirs(PASTA_MAPAS, exist_ok=True)
+            _limpar_mapas_antigos()
+            # Grava em arquivo temporário e renomeia (outra sessão pode estar lendo)
+            temporario = f"{caminho}.{os.getpid()}.tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                f.write(_html_mapa(chave, construtor))
+            os.replace(temporario, caminho)
+        components.iframe(f"app/static/mapas/{chave}.html", height=height, scrolling=scrolling)
+    else:
+        components.html(_html_mapa(chave, construtor), height=height, scrolling=scrolling)